@@ -0,0 +1,299 @@
+import os
+import re
+import shutil
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+import processing_functions as pf
+import watch_folder as wf
+
+
+# Suffix <wf.archive_previous_exports> and data_processing.bash add to archived exports
+ARCHIVED_SUFFIX = re.compile(r"_Archived_[^.]*(?=\.xlsx$)", re.IGNORECASE)
+
+# Pull date data_processing.bash adds to the export name, in <%m%d%Y> format
+PULL_DATE = re.compile(r"_(\d{8})\.xlsx$", re.IGNORECASE)
+
+
+def get_export_name(path):
+    """Get the name of an export before it was archived."""
+
+    return ARCHIVED_SUFFIX.sub("", os.path.basename(path))
+
+
+def get_pull_date(path):
+    """Get the date an export was pulled from OLDC.
+
+    The date comes from the export name, exports without one use the date
+    the file was last modified.
+
+    :param path: File path of the export, archived or not
+    :type path: <str>
+
+    :return: Pull date
+    :rtype: <datetime>
+    """
+
+    match = PULL_DATE.search(get_export_name(path))
+    if match is not None:
+        try:
+            return datetime.strptime(match.group(1), "%m%d%Y")
+        except ValueError:
+            pass
+
+    return datetime.fromtimestamp(os.path.getmtime(path))
+
+
+def discover_pulls(jobs):
+    """Find the current and archived OLDC pulls of every job.
+
+    The pulls are looked for in the folder of each job's raw export and in
+    its Archive folder.
+
+    :param jobs: Raw export, processed data and crosswalk file paths per key
+        of <wf.EXPORT_KINDS>
+    :type jobs: <Dict<Dict>>
+
+    :return: Kind, file path and pull date of every pull, oldest first
+    :rtype: <List<Dict>>
+    """
+
+    pulls = []
+    for kind, job in jobs.items():
+        raw_dir = os.path.dirname(os.path.abspath(job["raw_data_filename"]))
+        for directory in [raw_dir, os.path.join(raw_dir, "Archive")]:
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if wf.classify_export(get_export_name(path)) != kind or not os.path.isfile(path):
+                    continue
+                pulls.append({"kind": kind, "path": path, "pull_date": get_pull_date(path)})
+
+    return sorted(pulls, key=lambda pull: (pull["pull_date"], pull["kind"], pull["path"]))
+
+
+def _init_backfill_worker(jobs, engine, copy_on_write):
+    """Parse the crosswalks into the sheet cache of a worker.
+
+    With the "fork" start method the workers inherit the cache of the main
+    process and this only checks it is warm. The pandas Copy-on-Write
+    setting is passed in, spawned workers don't inherit it.
+    """
+
+    pd.set_option("mode.copy_on_write", copy_on_write)
+    pf.enable_sheet_cache()
+    wf.warm_crosswalks(jobs, engine=engine)
+
+
+def process_pull(pull, job, options, pull_dir, string_date, previous_filename=None):
+    """Process one OLDC pull into its own folder.
+
+    The pull and the processed data of the pull before it are copied into
+    <pull_dir>, so the processing archives and replaces the copies and
+    leaves the originals alone. Only the new processed data is kept.
+
+    :param pull: Pull from <discover_pulls>
+    :type pull: <Dict>
+    :param job: Processed data and crosswalk file paths of the pull's kind
+    :type job: <Dict>
+    :param options: Options shared by all jobs, see <wf.run_daemon>
+    :type options: <Dict>
+    :param pull_dir: Folder to write the processed data to
+    :type pull_dir: <str>
+    :param string_date: Timestamp appended to the new file
+    :type string_date: <str>
+    :param previous_filename: File path of the processed data of the pull
+        before, the history this pull is added to. Default is None, starting
+        from an empty history
+    :type previous_filename: <str>
+
+    :return: Summary of the pull: kind, pull date, pull file path, status,
+        processed data file path, seconds and error
+    :rtype: <Dict>
+    """
+
+    t1 = time.time()
+    summary = {
+        "kind": pull["kind"],
+        "pull_date": pull["pull_date"].strftime("%Y-%m-%d"),
+        "pull": pull["path"],
+        "status": "ok",
+        "output": None,
+        "seconds": None,
+        "error": None,
+    }
+
+    raw_dir = os.path.join(pull_dir, "raw")
+    processed_dir = os.path.join(pull_dir, "processed")
+    try:
+        os.makedirs(raw_dir, exist_ok=True)
+        os.makedirs(processed_dir, exist_ok=True)
+        # Name the copy as the export was before it was archived, the runs read the pull date from it
+        raw_copy = shutil.copy(pull["path"], os.path.join(raw_dir, get_export_name(pull["path"])))
+        if previous_filename is not None:
+            processed_copy = shutil.copy(previous_filename, processed_dir)
+        else:
+            # There is no processed data yet, the first pull starts the history
+            processed_copy = os.path.join(processed_dir, os.path.basename(job["processed_data_filename"]))
+
+        output = wf.run_export(
+            raw_copy,
+            pull["kind"],
+            dict(job, processed_data_filename=processed_copy),
+            options,
+            string_date,
+        )
+        summary["output"] = output
+    except Exception:
+        summary["status"] = "failed"
+        summary["error"] = traceback.format_exc()
+        traceback.print_exc()
+    finally:
+        shutil.rmtree(raw_dir, ignore_errors=True)
+        shutil.rmtree(os.path.join(processed_dir, "Archive"), ignore_errors=True)
+
+    summary["seconds"] = round(time.time() - t1, 1)
+    print(f"Backfill of {pull['path']} {summary['status']} in {summary['seconds']}s")
+
+    return summary
+
+
+def backfill_job(pulls, job, options, job_dir, string_date):
+    """Rebuild the history of one job from its pulls.
+
+    The pulls are processed oldest first, each on top of the processed data
+    of the pull before it, and the first one on an empty history. Each pull
+    gets its own output folder, <job_dir>/<pull file name>, that holds the
+    history as of that pull. After a failed pull the later pulls are
+    skipped, they would build on an incomplete history.
+
+    :param pulls: Pulls of the job from <discover_pulls>, oldest first
+    :type pulls: <List<Dict>>
+    :param job: Processed data and crosswalk file paths of the job
+    :type job: <Dict>
+    :param options: Options shared by all jobs, see <wf.run_daemon>
+    :type options: <Dict>
+    :param job_dir: Folder to write the processed data of the pulls to
+    :type job_dir: <str>
+    :param string_date: Timestamp appended to the new files
+    :type string_date: <str>
+
+    :return: Summary of every pull, see <process_pull>
+    :rtype: <List<Dict>>
+    """
+
+    summaries = []
+    previous_filename = None
+    for pull in pulls:
+        if summaries and summaries[-1]["status"] != "ok":
+            summaries.append(
+                {
+                    "kind": pull["kind"],
+                    "pull_date": pull["pull_date"].strftime("%Y-%m-%d"),
+                    "pull": pull["path"],
+                    "status": "skipped",
+                    "output": None,
+                    "seconds": None,
+                    "error": "An earlier pull of this job failed",
+                }
+            )
+            continue
+
+        summaries.append(
+            process_pull(
+                pull,
+                job,
+                options,
+                os.path.join(job_dir, os.path.basename(pull["path"]).replace(".xlsx", "")),
+                string_date,
+                previous_filename=previous_filename,
+            )
+        )
+        previous_filename = summaries[-1]["output"]
+
+    return summaries
+
+
+def run_backfill(jobs, options, output_dir, processes=None):
+    """Rebuild the history of every job from its current and archived OLDC pulls.
+
+    The pulls of each selected job are processed in pull date order, each
+    on top of the processed data of the pull before it and the first one on
+    an empty history, see <backfill_job>. The pulls of a job depend on each
+    other, so the jobs are run in parallel in a process pool instead. Each
+    pull gets its own output folder, <output_dir>/<kind>/<pull file name>,
+    and the output of a job's latest pull is its rebuilt history. The
+    crosswalks are parsed once into the sheet cache before the pool starts.
+    A failed pull is reported and the other jobs carry on. A CSV summary of
+    every pull is saved to <output_dir>. The current processed data is left
+    as is and the backfilled data isn't added to the catalog, so catalog
+    lookups keep returning the current processed data.
+
+    :param jobs: Raw export, processed data and crosswalk file paths per key
+        of <wf.EXPORT_KINDS>
+    :type jobs: <Dict<Dict>>
+    :param options: Options shared by all jobs, see <wf.run_daemon>
+    :type options: <Dict>
+    :param output_dir: Folder to write the processed data and summary to
+    :type output_dir: <str>
+    :param processes: Maximum number of jobs backfilled at once. Default is
+        the number of CPUs
+    :type processes: <int>
+
+    :return: Summary of every pull, see <process_pull>
+    :rtype: <pd.DataFrame>
+    """
+
+    pulls = discover_pulls(jobs)
+    print(f"Found {len(pulls)} pulls to backfill")
+    for pull in pulls:
+        print(f"  {pull['pull_date']:%Y-%m-%d} {pull['kind']}: {pull['path']}")
+
+    string_date = datetime.today().strftime("%m%d%Y_%H%M%S")
+    os.makedirs(output_dir, exist_ok=True)
+
+    print("Loading crosswalks...")
+    _init_backfill_worker(jobs, options["excel_engine"], pd.get_option("mode.copy_on_write"))
+    print("Loading crosswalks - COMPLETE")
+
+    t1 = time.time()
+    pool = ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_backfill_worker,
+        initargs=(jobs, options["excel_engine"], pd.get_option("mode.copy_on_write")),
+    )
+    with pool:
+        futures = [
+            pool.submit(
+                backfill_job,
+                [pull for pull in pulls if pull["kind"] == kind],
+                job,
+                dict(options, catalog_filename=None),
+                os.path.join(output_dir, kind),
+                string_date,
+            )
+            for kind, job in jobs.items()
+        ]
+
+    summary = pd.DataFrame(
+        [pull for future in futures for pull in future.result()],
+        columns=["kind", "pull_date", "pull", "status", "output", "seconds", "error"],
+    )
+    summary_filename = os.path.join(output_dir, f"backfill_summary_{string_date}.csv")
+    summary.to_csv(summary_filename, index=False)
+
+    failed = summary[summary.status != "ok"]
+    print(f"Backfilled {len(summary) - len(failed)} of {len(summary)} pulls in {time.time() - t1:.1f}s")
+    for status, pull in zip(failed.status, failed.pull):
+        print(f"  {status.capitalize()}: {pull}")
+    for kind, job_summary in summary.groupby("kind", sort=False):
+        if (job_summary.status == "ok").all():
+            print(f"  Rebuilt {kind} history: {job_summary.output.iloc[-1]}")
+    print(f"Summary saved to {summary_filename}")
+
+    return summary
@@ -0,0 +1,519 @@
+import argparse
+import glob
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+import processing_functions as pf
+
+
+# Catalog of the raw OLDC pulls and processed outputs, one row per file
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    role TEXT NOT NULL,             -- "raw" or "processed"
+    branch TEXT NOT NULL,           -- "states" or "coalitions"
+    ppr_version TEXT NOT NULL,      -- "2023" or "2024"
+    oldc_pull_date TEXT,            -- ISO date the raw data was pulled from OLDC
+    processed_at TEXT,              -- ISO timestamp of the run, processed files only
+    registered_at TEXT NOT NULL,
+    sha1 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    status TEXT NOT NULL,           -- "current", or "archived" once moved to an Archive folder
+    source_file_id INTEGER REFERENCES files (file_id)
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    file_id INTEGER NOT NULL REFERENCES files (file_id) ON DELETE CASCADE,
+    sheet_index INTEGER NOT NULL,
+    sheet_name TEXT NOT NULL,
+    n_rows INTEGER NOT NULL,
+    n_columns INTEGER NOT NULL,
+    PRIMARY KEY (file_id, sheet_name)
+);
+CREATE INDEX IF NOT EXISTS files_latest
+    ON files (role, branch, ppr_version, processed_at, oldc_pull_date);
+CREATE INDEX IF NOT EXISTS files_sha1 ON files (sha1);
+"""
+
+# File name of the catalog in the data folder
+CATALOG_NAME = "ppr_catalog.sqlite"
+
+ROLES = ["raw", "processed"]
+BRANCHES = ["states", "coalitions"]
+
+
+@contextmanager
+def open_catalog(catalog_filename):
+    """Open the catalog in a write transaction.
+
+    The transaction takes the write lock straight away, so runs that finish
+    at the same time update the catalog one after the other. Everything
+    done in the block is committed together, or rolled back if it fails.
+
+    :param catalog_filename: File path of the SQLite catalog, created if it
+        doesn't exist
+    :type catalog_filename: <str>
+
+    :return: Connection to the catalog
+    :rtype: <sqlite3.Connection>
+    """
+
+    catalog_dir = os.path.dirname(os.path.abspath(catalog_filename))
+    os.makedirs(catalog_dir, exist_ok=True)
+
+    with closing(sqlite3.connect(catalog_filename, timeout=60, isolation_level=None)) as conn:
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.executescript(CATALOG_SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def _query(catalog_filename, sql, params=()):
+    """Run a read-only query on the catalog, no rows if it doesn't exist."""
+
+    if catalog_filename is None or not os.path.exists(catalog_filename):
+        return []
+
+    uri = f"file:{os.path.abspath(catalog_filename)}?mode=ro"
+    with closing(sqlite3.connect(uri, uri=True, timeout=60)) as conn:
+        try:
+            return conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            # An empty file, before the first run created the tables
+            if "no such table" in str(e):
+                return []
+            raise
+
+
+def parse_pull_date(oldc_pull_date):
+    """Get the ISO date of an OLDC pull date in <%m%d%Y> format, or None."""
+
+    try:
+        return datetime.strptime(oldc_pull_date, "%m%d%Y").date().isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_string_date(string_date):
+    """Get the ISO timestamp of a run timestamp in <%m%d%Y_%H%M%S> format, or None."""
+
+    try:
+        return datetime.strptime(string_date, "%m%d%Y_%H%M%S").isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def get_sheet_shapes(sheets):
+    """Get the number of rows and columns of every sheet.
+
+    :param sheets: Data frames by sheet name, or (sheet name, data frame)
+        pairs in workbook order
+    :type sheets: <Dict<pd.DataFrame>> or <List<Tuple>>
+
+    :return: Sheet name, rows and columns of every sheet, in order
+    :rtype: <List<Tuple>>
+    """
+
+    if isinstance(sheets, dict):
+        sheets = sheets.items()
+
+    return [(sheet_name, df.shape[0], df.shape[1]) for sheet_name, df in sheets]
+
+
+def get_file_info(path):
+    """Get the content hash and size of a file, computed outside a transaction."""
+
+    return {"sha1": pf.get_file_fingerprint(path), "size": os.path.getsize(path)}
+
+
+def _upsert_file(conn, path, info, role, branch, ppr_version, oldc_pull_date=None, processed_at=None,
+                 status="current", source_file_id=None, sheet_shapes=None):
+    """Add or update the row of a file and its sheets, return its file id.
+
+    A file that was moved keeps its row: when nothing is registered at
+    <path>, a row of the same kind of file and content whose file is gone
+    is moved to <path>.
+    """
+
+    path = os.path.abspath(path)
+    row = conn.execute("SELECT file_id FROM files WHERE path = ?", (path,)).fetchone()
+    if row is None:
+        for file_id, old_path in conn.execute(
+            "SELECT file_id, path FROM files WHERE sha1 = ? AND role = ? AND branch = ? AND ppr_version = ?",
+            (info["sha1"], role, branch, ppr_version),
+        ).fetchall():
+            if not os.path.exists(old_path):
+                row = (file_id,)
+                break
+
+    values = {
+        "path": path,
+        "role": role,
+        "branch": branch,
+        "ppr_version": ppr_version,
+        "oldc_pull_date": oldc_pull_date,
+        "processed_at": processed_at,
+        "registered_at": datetime.now().isoformat(timespec="seconds"),
+        "sha1": info["sha1"],
+        "size": info["size"],
+        "status": status,
+        "source_file_id": source_file_id,
+    }
+    if row is None:
+        file_id = conn.execute(
+            f"INSERT INTO files ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+            list(values.values()),
+        ).lastrowid
+    else:
+        file_id = row[0]
+        # Keep what's known about the file when it's registered again without it
+        updates = dict((k, v) for k, v in values.items() if v is not None)
+        conn.execute(
+            f"UPDATE files SET {', '.join(f'{k} = ?' for k in updates)} WHERE file_id = ?",
+            list(updates.values()) + [file_id],
+        )
+
+    if sheet_shapes is not None:
+        conn.execute("DELETE FROM sheets WHERE file_id = ?", (file_id,))
+        conn.executemany(
+            "INSERT INTO sheets (file_id, sheet_index, sheet_name, n_rows, n_columns) VALUES (?, ?, ?, ?, ?)",
+            [(file_id, i, *shape) for i, shape in enumerate(sheet_shapes)],
+        )
+
+    return file_id
+
+
+def move_file(catalog_filename, old_path, new_path, status="archived"):
+    """Update the path of a cataloged file that was moved, e.g. to an Archive folder.
+
+    Files that aren't in the catalog are left out.
+
+    :param catalog_filename: File path of the SQLite catalog
+    :type catalog_filename: <str>
+    :param old_path: Path the file was cataloged under
+    :type old_path: <str>
+    :param new_path: Path the file was moved to
+    :type new_path: <str>
+    :param status: Status of the file at its new path
+    :type status: <str>
+    """
+
+    with open_catalog(catalog_filename) as conn:
+        conn.execute(
+            "UPDATE files SET path = ?, status = ? WHERE path = ?",
+            (os.path.abspath(new_path), status, os.path.abspath(old_path)),
+        )
+
+
+def record_run(
+    catalog_filename,
+    branch,
+    ppr_version,
+    raw_data_filename,
+    raw_sheet_shapes,
+    new_processed_data_filename,
+    processed_sheet_shapes,
+    oldc_pull_date,
+    string_date,
+    archived_filename=None,
+):
+    """Catalog the raw pull and processed output of a run.
+
+    The raw pull and the new processed data are added with their hashes and
+    sheet sizes, and the row of the previously processed data, which the
+    run removed, is moved to the copy the run archived it to. It's all done
+    in one transaction, so a catalog lookup sees either none or all of the
+    run.
+
+    :param catalog_filename: File path of the SQLite catalog
+    :type catalog_filename: <str>
+    :param branch: "states" or "coalitions"
+    :type branch: <str>
+    :param ppr_version: PPR version of the run, e.g. "2024"
+    :type ppr_version: <str>
+    :param raw_data_filename: File path of the raw OLDC data
+    :type raw_data_filename: <str>
+    :param raw_sheet_shapes: Rows and columns of the raw sheets that were
+        read, see <get_sheet_shapes>
+    :type raw_sheet_shapes: <List<Tuple>>
+    :param new_processed_data_filename: File path of the new processed data
+    :type new_processed_data_filename: <str>
+    :param processed_sheet_shapes: Rows and columns of the saved sheets
+    :type processed_sheet_shapes: <List<Tuple>>
+    :param oldc_pull_date: Date the raw data was pulled, in <%m%d%Y> format
+    :type oldc_pull_date: <str>
+    :param string_date: Timestamp of the run, in <%m%d%Y_%H%M%S> format
+    :type string_date: <str>
+    :param archived_filename: File path the previously processed data was
+        archived to
+    :type archived_filename: <str>
+    """
+
+    raw_info = get_file_info(raw_data_filename)
+    processed_info = get_file_info(new_processed_data_filename)
+    archived_info = None
+    if archived_filename is not None and os.path.exists(archived_filename):
+        archived_info = get_file_info(archived_filename)
+
+    pull_date = parse_pull_date(oldc_pull_date)
+    with open_catalog(catalog_filename) as conn:
+        raw_id = _upsert_file(
+            conn, raw_data_filename, raw_info, "raw", branch, ppr_version,
+            oldc_pull_date=pull_date, sheet_shapes=raw_sheet_shapes,
+        )
+
+        if archived_info is not None:
+            # The run removed the previous processed data, its row moves to the archived copy
+            _upsert_file(
+                conn, archived_filename, archived_info, "processed", branch, ppr_version, status="archived",
+            )
+
+        _upsert_file(
+            conn, new_processed_data_filename, processed_info, "processed", branch, ppr_version,
+            oldc_pull_date=pull_date, processed_at=parse_string_date(string_date),
+            source_file_id=raw_id, sheet_shapes=processed_sheet_shapes,
+        )
+
+    print(f"Cataloged {new_processed_data_filename} in {catalog_filename}")
+
+
+def register_file(catalog_filename, path, role, branch, ppr_version, oldc_pull_date=None, processed_at=None,
+                  status="current", engine="openpyxl"):
+    """Catalog a file that wasn't written by a run, e.g. before the first cataloged run.
+
+    The sheets are read to count their rows and columns.
+
+    :param catalog_filename: File path of the SQLite catalog
+    :type catalog_filename: <str>
+    :param path: File path of the raw pull or processed data
+    :type path: <str>
+    :param role: "raw" or "processed"
+    :type role: <str>
+    :param branch: "states" or "coalitions"
+    :type branch: <str>
+    :param ppr_version: PPR version of the file, e.g. "2024"
+    :type ppr_version: <str>
+    :param oldc_pull_date: Date the raw data was pulled, in <%m%d%Y> format
+    :type oldc_pull_date: <str>
+    :param processed_at: Timestamp of the run, in <%m%d%Y_%H%M%S> format
+    :type processed_at: <str>
+    :param status: "current" or "archived"
+    :type status: <str>
+    :param engine: Engine to read the sheets with, one of <pf.EXCEL_ENGINES>
+    :type engine: <str>
+    """
+
+    sheet_shapes = get_sheet_shapes(pf.read_excel(path, sheet_name=None, engine=engine))
+    info = get_file_info(path)
+    with open_catalog(catalog_filename) as conn:
+        _upsert_file(
+            conn, path, info, role, branch, ppr_version,
+            oldc_pull_date=parse_pull_date(oldc_pull_date), processed_at=parse_string_date(processed_at),
+            status=status, sheet_shapes=sheet_shapes,
+        )
+
+
+def get_latest(catalog_filename, role, branch, ppr_version):
+    """Get the latest raw pull or processed output of a PPR version.
+
+    Processed outputs are ordered by the time they were processed, raw
+    pulls by their OLDC pull date. Files that were moved or removed since
+    they were cataloged are skipped.
+
+    :param catalog_filename: File path of the SQLite catalog
+    :type catalog_filename: <str>
+    :param role: "raw" or "processed"
+    :type role: <str>
+    :param branch: "states" or "coalitions"
+    :type branch: <str>
+    :param ppr_version: PPR version, e.g. "2024"
+    :type ppr_version: <str>
+
+    :return: File path, or None if there is no such file
+    :rtype: <str>
+    """
+
+    rows = _query(
+        catalog_filename,
+        "SELECT path FROM files WHERE role = ? AND branch = ? AND ppr_version = ? AND status = 'current' "
+        "ORDER BY processed_at DESC, oldc_pull_date DESC, registered_at DESC",
+        (role, branch, ppr_version),
+    )
+    for (path,) in rows:
+        if os.path.exists(path):
+            return path
+
+    return None
+
+
+def resolve_latest(catalog_filename, role, branch, ppr_version, pattern):
+    """Get the latest file from the catalog, or the newest file matching <pattern>.
+
+    :param catalog_filename: File path of the SQLite catalog
+    :type catalog_filename: <str>
+    :param role: "raw" or "processed"
+    :type role: <str>
+    :param branch: "states" or "coalitions"
+    :type branch: <str>
+    :param ppr_version: PPR version, e.g. "2024"
+    :type ppr_version: <str>
+    :param pattern: Glob pattern of the files when they aren't cataloged
+    :type pattern: <str>
+
+    :return: File path, or None if there is no such file
+    :rtype: <str>
+    """
+
+    path = get_latest(catalog_filename, role, branch, ppr_version)
+    if path is not None:
+        return path
+
+    matches = glob.glob(pattern)
+    if len(matches) == 0:
+        return None
+
+    return max(matches, key=lambda match: (os.path.getmtime(match), match))
+
+
+def list_files(catalog_filename, role=None, branch=None, ppr_version=None, status=None):
+    """List the cataloged files, newest first.
+
+    :param catalog_filename: File path of the SQLite catalog
+    :type catalog_filename: <str>
+    :param role: Only list "raw" or "processed" files
+    :type role: <str>
+    :param branch: Only list "states" or "coalitions" files
+    :type branch: <str>
+    :param ppr_version: Only list files of this PPR version
+    :type ppr_version: <str>
+    :param status: Only list "current" or "archived" files
+    :type status: <str>
+
+    :return: One row per file, with the number of sheets and total rows
+    :rtype: <pd.DataFrame>
+    """
+
+    columns = ["path", "role", "branch", "ppr_version", "oldc_pull_date", "processed_at", "status", "sha1",
+               "size"]
+    filters = {"role": role, "branch": branch, "ppr_version": ppr_version, "status": status}
+    filters = dict((k, v) for k, v in filters.items() if v is not None)
+    where = " AND ".join(f"f.{k} = ?" for k in filters) or "1"
+
+    rows = _query(
+        catalog_filename,
+        f"SELECT {', '.join('f.' + c for c in columns)}, COUNT(s.sheet_name), COALESCE(SUM(s.n_rows), 0) "
+        f"FROM files f LEFT JOIN sheets s ON s.file_id = f.file_id WHERE {where} GROUP BY f.file_id "
+        f"ORDER BY f.processed_at DESC, f.oldc_pull_date DESC, f.registered_at DESC",
+        list(filters.values()),
+    )
+
+    return pd.DataFrame(rows, columns=columns + ["n_sheets", "n_rows"])
+
+
+def get_sheets(catalog_filename, path):
+    """Get the rows and columns of every sheet of a cataloged file.
+
+    :param catalog_filename: File path of the SQLite catalog
+    :type catalog_filename: <str>
+    :param path: File path of the raw pull or processed data
+    :type path: <str>
+
+    :return: One row per sheet, in workbook order
+    :rtype: <pd.DataFrame>
+    """
+
+    rows = _query(
+        catalog_filename,
+        "SELECT s.sheet_name, s.n_rows, s.n_columns FROM sheets s JOIN files f ON f.file_id = s.file_id "
+        "WHERE f.path = ? ORDER BY s.sheet_index",
+        (os.path.abspath(path),),
+    )
+
+    return pd.DataFrame(rows, columns=["sheet_name", "n_rows", "n_columns"])
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Look up raw OLDC pulls and processed PPR data in the catalog the processing runs keep",
+    )
+
+    parser.add_argument(
+        "--catalog_filename",
+        default=os.path.join(
+            os.environ.get("OneDrive", ""), "Your_Root_Directory", "Your_Data_Folder", CATALOG_NAME
+        ),
+        help='File path of the SQLite catalog. Default is "ppr_catalog.sqlite" in the data folder',
+    )
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    latest_parser = subparsers.add_parser(
+        "latest", help="Print the file path of the latest raw pull or processed data of a PPR version",
+    )
+    latest_parser.add_argument("role", choices=ROLES)
+    latest_parser.add_argument("branch", choices=BRANCHES)
+    latest_parser.add_argument("ppr_version", help='PPR version, e.g. "2024"')
+
+    list_parser = subparsers.add_parser("list", help="List the cataloged files, newest first")
+    list_parser.add_argument("--role", choices=ROLES, default=None)
+    list_parser.add_argument("--branch", choices=BRANCHES, default=None)
+    list_parser.add_argument("--ppr_version", default=None)
+    list_parser.add_argument("--status", choices=["current", "archived"], default=None)
+
+    sheets_parser = subparsers.add_parser("sheets", help="Print the rows and columns of every sheet of a file")
+    sheets_parser.add_argument("path")
+
+    register_parser = subparsers.add_parser(
+        "register", help="Catalog files that weren't written by a cataloged run, e.g. existing processed data",
+    )
+    register_parser.add_argument("paths", nargs="+")
+    register_parser.add_argument("--role", choices=ROLES, required=True)
+    register_parser.add_argument("--branch", choices=BRANCHES, required=True)
+    register_parser.add_argument("--ppr_version", required=True, help='PPR version, e.g. "2024"')
+    register_parser.add_argument(
+        "--status", choices=["current", "archived"], default="current",
+        help='"archived" for files in an Archive folder. Default is "current"',
+    )
+    register_parser.add_argument("--excel_engine", choices=pf.EXCEL_ENGINES, default="openpyxl")
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+
+    if args.command == "latest":
+        path = get_latest(args.catalog_filename, args.role, args.branch, args.ppr_version)
+        if path is None:
+            raise SystemExit(f"No {args.role} {args.branch} {args.ppr_version} file in {args.catalog_filename}")
+        print(path)
+    elif args.command == "list":
+        with pd.option_context("display.max_rows", None, "display.width", None, "display.max_colwidth", 80):
+            print(list_files(args.catalog_filename, args.role, args.branch, args.ppr_version, args.status))
+    elif args.command == "sheets":
+        print(get_sheets(args.catalog_filename, args.path).to_string(index=False))
+    else:
+        for path in args.paths:
+            # Exports and outputs are named with the pull date and run timestamp, see <record_run>
+            stem = os.path.basename(path).replace(".xlsx", "")
+            if args.role == "raw":
+                oldc_pull_date, processed_at = stem.split("_")[-1], None
+            else:
+                splits = stem.rsplit("_processed_", 1)
+                oldc_pull_date = splits[0].split("_")[-1]
+                processed_at = splits[-1] if len(splits) > 1 else None
+            print(f"Registering {path}...")
+            register_file(
+                args.catalog_filename, path, args.role, args.branch, args.ppr_version,
+                oldc_pull_date=oldc_pull_date, processed_at=processed_at, status=args.status,
+                engine=args.excel_engine,
+            )
@@ -0,0 +1,723 @@
+import argparse
+import os
+import sys
+import time
+
+import catalog as ct
+import coalitions_polars as cpl
+import coalitions_processing_functions as cpf
+import pipeline
+import processing_functions as pf
+import xlsx_writer as xw
+
+
+# The list of sheet names in the raw data and their proper section names
+# as seen in the OLDC PPR
+SCREEN_NAMES = {
+    "Screen-1": "I. Cover Page",
+    "Screen-2": "II. FVPSA Funds",
+    "Screen-3": "III. Coalition Members",
+    "Screen-4": "IV. Narrative Questions",
+    "Screen-5": "V. Summary of Activities",
+    "Screen-6": "VI. Other Topics",
+    "Screen-7": "VII. Training",
+}
+
+# Duplicated columns in Section V. Summary of Activities and their proper names
+SOA_DUPLICATE_COLUMNS = {
+    "Types of Activities,FVPSA Summary of Activities,R19C2": "Types of Activities,FVPSA Summary of Activities,R9C2",
+    "Types of Activities,FVPSA Summary of Activities,R19C2.1": "Types of Activities,FVPSA Summary of Activities,R19C2",
+    "Number of People Reached &lt;BR&gt;(Training /TA only),FVPSA Underserved and culturally-specific populations Summary of Activities,RvC3": "Number of People Reached &lt;BR&gt;(Training /TA only),FVPSA Underserved and culturally-specific populations Summary of Activities,R33C3",
+    "Number of People Reached &lt;BR&gt;(Training /TA only),FVPSA Underserved and culturally-specific populations Summary of Activities,RvC3.1": "Number of People Reached &lt;BR&gt;(Training /TA only),FVPSA Underserved and culturally-specific populations Summary of Activities,R31C3",
+}
+
+# Screen-1 columns the identifier columns are taken from, see <prepare_coalitions_data>
+ID_COLUMNS = slice(1, 41)
+
+# Identifier columns that aren't joined on as they are, every version also drops its "id_drop_cols"
+ID_DROP_COLUMNS = [
+    "Screen-Name",
+    "Row-Iteration",
+    "Screen-Iteration",
+    "RevSeqNumber",
+    "SubmitDate",
+    "PostalCode",
+    "Fy",
+    "ProgAcronym",
+    "ProgramName",
+    "RptEin",
+]
+
+# Settings that differ between the PPR versions of the coalitions data
+COALITION_VERSIONS = {
+    # fvpsa_performance_progress_report_ver_1 (FY2001-2023)
+    "2023": {
+        "label": "coalitions",
+        "target_year": "before_2024",
+        "ppr_year": "2023",
+        # Screen-1 identifier columns that are renamed or not used to join on
+        "id_drop_cols": ["DunsId9"],
+        "id_renamed_cols": ["DUNS"],
+        "col_mapping": {
+            "PostalCode": "State",
+            "Fy": "Year",
+            "ProgAcronym": "Program Abbr",
+            "RptEin": "EIN",
+            "DunsId9": "DUNS",
+            "ProgramName": "Program Name",
+        },
+    },
+    # fvpsa_performance_progress_report_ver_2 (FY2024-2027)
+    "2024": {
+        "label": "new 2024 coalitions",
+        "target_year": "after_2024",
+        "ppr_year": "2024",
+        "id_drop_cols": ["UEI[Unique Entity Identifier]"],
+        "id_renamed_cols": ["UEI"],
+        "col_mapping": {
+            "PostalCode": "State",
+            "Fy": "Year",
+            "ProgAcronym": "Program Abbr",
+            "RptEin": "EIN",
+            "ProgramName": "Program Name",
+            "UEI[Unique Entity Identifier]": "UEI",
+        },
+    },
+}
+
+
+def read_coalitions_inputs(raw_data_filename, crosswalk_filename, coalitions_names_filename, run_options):
+    """Stage: read the raw coalitions data, crosswalk and coalition names."""
+
+    print("Reading in coalitions data...")
+    (coal_dat, coal_xw, coalition_names, coercion_report) = cpf.read_coalitions_data(
+        raw_data_filename,
+        crosswalk_filename,
+        coalitions_names_filename,
+        engine=run_options["excel_engine"],
+        sheet_names=list(SCREEN_NAMES.keys()),
+    )
+    print("Reading in coalitions data - COMPLETE")
+
+    return coal_dat, coal_xw, coalition_names, coercion_report
+
+
+def prescan_coalitions_inputs(ppr_version, raw_data_filename, crosswalk_filename, excel_engine="openpyxl"):
+    """Check the headers of a raw coalitions export against the expected layout.
+
+    Only the sheet names and header rows of the export are read. The export
+    must have every screen of <SCREEN_NAMES>, the identifier columns of
+    <ID_DROP_COLUMNS> and the version's renamed columns in the Screen-1
+    identifier columns, the Screen-1 identifier columns on every screen, a
+    column for every Meta Name Description of the crosswalk, and no
+    duplicated columns other than the <SOA_DUPLICATE_COLUMNS>.
+
+    :param ppr_version: Key of <COALITION_VERSIONS> to check against
+    :type ppr_version: <str>
+    :param raw_data_filename: File path of the raw coalitions OLDC data
+    :type raw_data_filename: <str>
+    :param crosswalk_filename: File path of the crosswalk for this version
+    :type crosswalk_filename: <str>
+    :param excel_engine: Engine to read the workbooks with, one of
+        <pf.EXCEL_ENGINES>
+    :type excel_engine: <str>
+
+    :return: Schema drift report, see <pf.get_schema_drift>
+    :rtype: <pd.DataFrame>
+    """
+
+    coalition_settings = COALITION_VERSIONS[ppr_version]
+    headers = pf.read_headers(raw_data_filename, engine=excel_engine)
+
+    screens = [s for s in SCREEN_NAMES.keys() if s in headers]
+    rows = pf.get_missing_columns("(workbook)", "sheet", list(SCREEN_NAMES.keys()), list(headers.keys()))
+
+    if "Screen-1" in headers:
+        id_cols = headers["Screen-1"][ID_COLUMNS]
+        expected = ID_DROP_COLUMNS + list(coalition_settings["col_mapping"].keys())
+        rows += pf.get_missing_columns("Screen-1", "identifier", list(dict.fromkeys(expected)), id_cols)
+        for screen in screens[1:]:
+            rows += pf.get_missing_columns(
+                screen,
+                "identifier",
+                [c for c in id_cols if c not in cpf.SCREEN_ITERATION_COLUMNS],
+                headers[screen],
+            )
+
+    for screen in screens:
+        for column in pf.find_duplicate_columns(headers[screen], expected=list(SOA_DUPLICATE_COLUMNS.keys())):
+            rows.append([screen, "duplicate", None, column])
+
+    # The crosswalk labels the columns after they're renamed, see <cpf.process_sheets>
+    coal_xw = pf.read_excel_sheet(crosswalk_filename, "coalitions", engine=excel_engine)
+    columns = [c for screen in screens for c in headers[screen]]
+    columns += list(coalition_settings["col_mapping"].values()) + list(SOA_DUPLICATE_COLUMNS.values())
+    rows += pf.get_missing_columns(
+        "(all screens)",
+        "crosswalk",
+        list(dict.fromkeys(coal_xw["Meta Name Description"].dropna())),
+        columns,
+    )
+
+    return pf.get_schema_drift(rows)
+
+
+def archive_coalitions_data(processed_data_filename, string_date, oldc_pull_date):
+    """Stage: back up the current processed coalitions file."""
+
+    return cpf.copy_old_data(
+        string_date,
+        processed_coalitions_data_filename=processed_data_filename,
+        oldc_pull_date=oldc_pull_date,
+    )
+
+
+def prepare_coalitions_data(coal_dat, coalition_settings):
+    """Stage: light processing and the identifier columns to join on."""
+
+    # Light processing on coalitions data
+    coal_dat_processed = pf.process_raw_data(coal_dat, coalitions=True)
+    coal_dat_processed = dict(
+        (k, coal_dat_processed[k]) for k in SCREEN_NAMES.keys()
+    )
+
+    # Columns to join on across all screens, should be identifiers
+    join_cols = (
+        coal_dat["Screen-1"]
+        .columns[ID_COLUMNS]
+        .drop(ID_DROP_COLUMNS + coalition_settings["id_drop_cols"])
+    )
+    # Going to use State, Year, and Program Abbr as renamed columns
+    join_cols = (
+        list(join_cols)
+        + ["State", "Year", "Program Abbr", "EIN", "Program Name"]
+        + coalition_settings["id_renamed_cols"]
+    )
+
+    return coal_dat_processed, join_cols
+
+
+def transform_coalitions_data(
+    coal_dat_processed, join_cols, coal_xw, coalition_names, coalition_settings, run_options
+):
+    """Stage: standardize and process the coalition sheets.
+
+    Returns the processed sheets, the long format of Section IV.
+    Narrative Questions and Section V. Summary of Activities, and the
+    Screen-1 cover page. The sheets only carry the submission key of their
+    cover page, see <project_coalitions_cover_page>. The "polars" backend
+    runs the same transforms as one lazy Polars query, its sheets already
+    have the cover page columns and its cover page is None.
+    """
+
+    # Set up ground truth of submissions to identify missing
+    expected = cpf.get_expected_submissions(target_year=coalition_settings["target_year"])
+
+    soa_sheetName = [
+        k for k, v in SCREEN_NAMES.items() if v == "V. Summary of Activities"
+    ][0]
+    narr_sheetName = [
+        k for k, v in SCREEN_NAMES.items() if v == "IV. Narrative Questions"
+    ][0]
+
+    if run_options["coalitions_backend"] == "polars":
+        (coal_screens, narr_long, soa_long) = cpl.transform_coalitions_polars(
+            coal_dat_processed,
+            join_cols,
+            coal_xw,
+            coalition_names,
+            cpf.get_ground_truth_submissions(target_year=coalition_settings["target_year"]),
+            SCREEN_NAMES,
+            soa_sheetName,
+            narr_sheetName,
+            SOA_DUPLICATE_COLUMNS,
+            coalition_settings["col_mapping"],
+            coalition_settings["ppr_year"],
+        )
+        return coal_screens, narr_long, soa_long, None
+
+    # Standardize submissions by row iteration, review sequence number, and submit date
+    # The sheets are replaced in a copy of the dictionary, the stage input isn't changed
+    (coal_dat_processed, std_join_cols, cover_page) = cpf.standardize_submissions(
+        dict(coal_dat_processed),
+        join_cols,
+        coalition_names,
+        coalition_settings["col_mapping"],
+        executor=run_options["executor"],
+        max_workers=run_options["max_workers"],
+    )
+
+    # Fix duplicate columns in Section V. Summary of Activities
+    coal_dat_processed[soa_sheetName] = coal_dat_processed[soa_sheetName].rename(
+        columns=SOA_DUPLICATE_COLUMNS
+    )
+
+    # Process all sheets
+    (coal_dat_processed, new_join_cols) = cpf.process_sheets(
+        coal_dat_processed,
+        coal_xw,
+        SCREEN_NAMES,
+        expected,
+        soa_sheetName,
+        std_join_cols,
+        coalition_names,
+        coalition_settings["ppr_year"],
+        executor=run_options["executor"],
+        max_workers=run_options["max_workers"],
+    )
+
+    var_cols = new_join_cols.copy()
+    cover_cols = cpf.get_cover_page_join_cols(std_join_cols, join_cols, coal_xw)
+
+    # Create Section IV. long format
+    narr = coal_dat_processed[narr_sheetName]
+    narr_long = cpf.sectionIV_long_format(narr, var_cols + ["Rpt-Receipt-Id"], coal_xw)
+    narr_long = cpf.expand_cover_page(narr_long, cover_page, cover_cols)
+
+    # Create Section V. long format
+    soa = coal_dat_processed[soa_sheetName]
+    soa_long = cpf.sectionV_long_format(soa, var_cols + ["Rpt-Receipt-Id"])
+    soa_long = cpf.expand_cover_page(soa_long, cover_page, cover_cols)
+
+    return coal_dat_processed, narr_long, soa_long, cover_page
+
+
+def project_coalitions_cover_page(coal_screens, cover_page, coal_xw):
+    """Stage: join the cover page columns onto the processed screens for the export."""
+
+    if cover_page is None:
+        return coal_screens
+
+    return cpf.project_cover_page(coal_screens, cover_page, coal_xw)
+
+
+def get_output_sheets(coal_sheets, narr_long, soa_long):
+    """Get the sheets of the final coalitions workbook, in order, as (sheet name, data frame) pairs."""
+
+    return [(SCREEN_NAMES[screen], coal_sheets[screen]) for screen in coal_sheets.keys()] + [
+        ("Section IV Narr Long Format", narr_long),
+        ("Section V SoA Long Format", soa_long),
+    ]
+
+
+def save_coalitions_workbook(
+    coal_sheets,
+    narr_long,
+    soa_long,
+    new_coalitions_processed_data_filename,
+    processed_data_filename,
+    coalition_settings,
+    run_options,
+):
+    """Stage: write every sheet and save the final coalitions workbook."""
+
+    # Save processed sheets and the long formats of Section IV. Narrative Questions
+    # and Section V. Summary of Activities
+    workbook, sheet_xml = xw.save_sheets_to_workbook(
+        get_output_sheets(coal_sheets, narr_long, soa_long),
+        writer=run_options["workbook_writer"],
+        max_workers=run_options["max_workers"],
+        previous_filename=processed_data_filename,
+    )
+
+    # SAVE FINAL WORKBOOK
+    # ==================================================================================================================
+    print(f"Saving {coalition_settings['label']} workbook...")
+    print(new_coalitions_processed_data_filename)
+    xw.save_workbook(workbook, new_coalitions_processed_data_filename, sheet_xml)
+    # Only remove current version if save was successful, there is none when the history starts with this pull
+    if os.path.exists(processed_data_filename):
+        os.remove(processed_data_filename)
+    print(f"Processing {coalition_settings['label']} OLDC data - COMPLETE")
+
+    return new_coalitions_processed_data_filename
+
+
+def update_coalitions_catalog(
+    coal_dat,
+    coal_sheets,
+    narr_long,
+    soa_long,
+    raw_data_filename,
+    processed_data_filename,
+    new_processed_data_filename,
+    oldc_pull_date,
+    string_date,
+    ppr_version,
+    run_options,
+):
+    """Stage: add the raw pull and the new processed coalitions data to the catalog."""
+
+    if run_options["catalog_filename"] is None:
+        return
+
+    # The copy <cpf.copy_old_data> archived the previous processed data to
+    backup_file_path = os.path.join(
+        os.path.dirname(processed_data_filename),
+        "Archive",
+        f"{os.path.basename(processed_data_filename).replace('.xlsx', '')}_Archived_{string_date}.xlsx",
+    )
+
+    ct.record_run(
+        run_options["catalog_filename"],
+        "coalitions",
+        ppr_version,
+        raw_data_filename,
+        ct.get_sheet_shapes(coal_dat),
+        new_processed_data_filename,
+        ct.get_sheet_shapes(get_output_sheets(coal_sheets, narr_long, soa_long)),
+        oldc_pull_date,
+        string_date,
+        archived_filename=backup_file_path,
+    )
+
+
+def get_coalitions_stages():
+    """Get the stage graph of the coalitions branches.
+
+    The same graph is used for every PPR version, the version specific
+    settings are passed in through the "coalition_settings" artifact.
+
+    :return: Stage definitions
+    :rtype: <List<Dict>>
+    """
+
+    return [
+        pipeline.stage(
+            "read_coalitions_inputs",
+            read_coalitions_inputs,
+            ["raw_data_filename", "crosswalk_filename", "coalitions_names_filename", "run_options"],
+            ["coal_dat", "coal_xw", "coalition_names", "coercion_report"],
+        ),
+        pipeline.stage(
+            "archive_coalitions_data",
+            archive_coalitions_data,
+            ["processed_data_filename", "string_date", "oldc_pull_date"],
+            ["new_coalitions_processed_data_filename"],
+        ),
+        pipeline.stage(
+            "prepare_coalitions_data",
+            prepare_coalitions_data,
+            ["coal_dat", "coalition_settings"],
+            ["coal_dat_processed", "join_cols"],
+        ),
+        pipeline.stage(
+            "transform_coalitions_data",
+            transform_coalitions_data,
+            [
+                "coal_dat_processed",
+                "join_cols",
+                "coal_xw",
+                "coalition_names",
+                "coalition_settings",
+                "run_options",
+            ],
+            ["coal_screens", "narr_long", "soa_long", "cover_page"],
+        ),
+        pipeline.stage(
+            "project_coalitions_cover_page",
+            project_coalitions_cover_page,
+            ["coal_screens", "cover_page", "coal_xw"],
+            ["coal_sheets"],
+        ),
+        pipeline.stage(
+            "save_coalitions_workbook",
+            save_coalitions_workbook,
+            [
+                "coal_sheets",
+                "narr_long",
+                "soa_long",
+                "new_coalitions_processed_data_filename",
+                "processed_data_filename",
+                "coalition_settings",
+                "run_options",
+            ],
+            ["new_processed_data_filename"],
+        ),
+        pipeline.stage(
+            "update_coalitions_catalog",
+            update_coalitions_catalog,
+            [
+                "coal_dat",
+                "coal_sheets",
+                "narr_long",
+                "soa_long",
+                "raw_data_filename",
+                "processed_data_filename",
+                "new_processed_data_filename",
+                "oldc_pull_date",
+                "string_date",
+                "ppr_version",
+                "run_options",
+            ],
+            ["catalog_updated"],
+        ),
+    ]
+
+
+def run_coalitions_branch(
+    ppr_version,
+    raw_data_filename,
+    processed_data_filename,
+    crosswalk_filename,
+    coalitions_names_filename,
+    string_date,
+    executor="thread",
+    max_workers=None,
+    coalitions_backend="pandas",
+    excel_engine="openpyxl",
+    workbook_writer="openpyxl",
+    catalog_filename=None,
+    checkpoint_dir=None,
+    memory_budget=None,
+):
+    """Process one version of the coalitions PPR data.
+
+    :param ppr_version: Key of <COALITION_VERSIONS> to process ("2023" or
+        "2024")
+    :type ppr_version: <str>
+    :param raw_data_filename: File path of the raw coalitions OLDC data
+    :type raw_data_filename: <str>
+    :param processed_data_filename: File path of the previously processed
+        coalitions data
+    :type processed_data_filename: <str>
+    :param crosswalk_filename: File path of the crosswalk for this version
+    :type crosswalk_filename: <str>
+    :param coalitions_names_filename: File path of the full coalition names
+    :type coalitions_names_filename: <str>
+    :param string_date: Timestamp appended to the archived and new files
+    :type string_date: <str>
+    :param executor: Pool to run independent stages on, "thread", "process"
+        or "serial"
+    :type executor: <str>
+    :param max_workers: Maximum number of workers in the pool
+    :type max_workers: <int>
+    :param coalitions_backend: Backend of the coalitions transforms, "pandas"
+        or "polars"
+    :type coalitions_backend: <str>
+    :param excel_engine: Engine to read the workbooks with, one of
+        <pf.EXCEL_ENGINES>
+    :type excel_engine: <str>
+    :param workbook_writer: Writer to save the final workbook with, one of
+        <xw.WORKBOOK_WRITERS>. "parallel" and "incremental" use up to
+        <max_workers> processes, "incremental" copies the sheets that didn't
+        change from the previously processed data
+    :type workbook_writer: <str>
+    :param catalog_filename: File path of the SQLite catalog to add the raw
+        pull and the new processed data to, see <ct.record_run>. Default is
+        no catalog
+    :type catalog_filename: <str>
+    :param checkpoint_dir: Directory to checkpoint the stage outputs to and
+        resume from, see <pipeline.run_pipeline>
+    :type checkpoint_dir: <str>
+    :param memory_budget: Resident memory in MB above which stage outputs
+        are spilled to disk, see <pipeline.run_pipeline>. Default is no budget
+    :type memory_budget: <float>
+
+    :return: File path of the new processed coalitions data
+    :rtype: <str>
+    """
+
+    t1 = time.time()
+    coalition_settings = COALITION_VERSIONS[ppr_version]
+    print(f"Processing {coalition_settings['label']} data...")
+
+    # Extract the pull date from the filename
+    oldc_pull_splits = raw_data_filename.split("_")
+    oldc_pull_date = oldc_pull_splits[len(oldc_pull_splits) - 1].replace(".xlsx", "")
+
+    context = {
+        "raw_data_filename": raw_data_filename,
+        "processed_data_filename": processed_data_filename,
+        "crosswalk_filename": crosswalk_filename,
+        "coalitions_names_filename": coalitions_names_filename,
+        "oldc_pull_date": oldc_pull_date,
+        "string_date": string_date,
+        "ppr_version": ppr_version,
+        "coalition_settings": coalition_settings,
+        "run_options": {
+            "coalitions_backend": coalitions_backend,
+            "executor": executor,
+            "max_workers": max_workers,
+            "excel_engine": excel_engine,
+            "workbook_writer": workbook_writer,
+            "catalog_filename": catalog_filename,
+        },
+    }
+
+    artifacts, report = pipeline.run_pipeline(
+        get_coalitions_stages(),
+        context,
+        executor=executor,
+        max_workers=max_workers,
+        checkpoint_dir=checkpoint_dir,
+        keep=["new_processed_data_filename"],
+        memory_budget=memory_budget,
+    )
+    pipeline.print_run_report(report)
+    print(time.time() - t1)
+
+    return artifacts["new_processed_data_filename"]
+
+
+# BACKEND EQUIVALENCE AND BENCHMARK
+# ======================================================================================================================
+def frames_match(left, right):
+    """Check if two data frames hold the same values.
+
+    The backends return different dtypes for the same values (e.g. object
+    and string columns, or int and float columns with missing values), so
+    the values are compared rather than the dtypes.
+
+    :param left: Data frame to compare
+    :type left: <pd.DataFrame>
+    :param right: Data frame to compare
+    :type right: <pd.DataFrame>
+
+    :return: Whether the columns, row order and values match
+    :rtype: <bool>
+    """
+
+    if list(left.columns) != list(right.columns) or len(left) != len(right):
+        return False
+
+    for col in range(left.shape[1]):
+        left_values = left.iloc[:, col].astype(object)
+        right_values = right.iloc[:, col].astype(object)
+        left_values = left_values.where(left_values.notna(), None).tolist()
+        right_values = right_values.where(right_values.notna(), None).tolist()
+        if left_values != right_values:
+            return False
+
+    return True
+
+
+def compare_coalitions_backends(
+    ppr_version,
+    raw_data_filename,
+    crosswalk_filename,
+    coalitions_names_filename,
+    repeat=3,
+):
+    """Check the coalitions backends produce the same sheets and time them.
+
+    The raw data is read and lightly processed once, then the transforms
+    are run <repeat> times with each backend. Nothing is written to disk.
+
+    :param ppr_version: Key of <COALITION_VERSIONS> to process
+    :type ppr_version: <str>
+    :param raw_data_filename: File path of the raw coalitions OLDC data
+    :type raw_data_filename: <str>
+    :param crosswalk_filename: File path of the crosswalk for this version
+    :type crosswalk_filename: <str>
+    :param coalitions_names_filename: File path of the full coalition names
+    :type coalitions_names_filename: <str>
+    :param repeat: Number of timed runs per backend
+    :type repeat: <int>
+
+    :return: Best time per backend and the sheets that don't match
+    :rtype: <Dict>
+    """
+
+    coalition_settings = COALITION_VERSIONS[ppr_version]
+    (coal_dat, coal_xw, coalition_names, _) = read_coalitions_inputs(
+        raw_data_filename,
+        crosswalk_filename,
+        coalitions_names_filename,
+        {"excel_engine": "openpyxl"},
+    )
+    (coal_dat_processed, join_cols) = prepare_coalitions_data(coal_dat, coalition_settings)
+
+    outputs = {}
+    timings = {}
+    # The export projection of the cover page is timed with the transforms
+    for backend in ["pandas", "polars"]:
+        timings[backend] = []
+        for _ in range(repeat):
+            t1 = time.perf_counter()
+            (coal_screens, narr_long, soa_long, cover_page) = transform_coalitions_data(
+                dict(coal_dat_processed),
+                join_cols,
+                coal_xw,
+                coalition_names,
+                coalition_settings,
+                {"coalitions_backend": backend, "executor": "serial", "max_workers": None},
+            )
+            outputs[backend] = (
+                project_coalitions_cover_page(coal_screens, cover_page, coal_xw),
+                narr_long,
+                soa_long,
+            )
+            timings[backend].append(time.perf_counter() - t1)
+
+    (pandas_sheets, pandas_narr, pandas_soa) = outputs["pandas"]
+    (polars_sheets, polars_narr, polars_soa) = outputs["polars"]
+    pairs = dict(
+        (SCREEN_NAMES[k], (pandas_sheets[k], polars_sheets[k])) for k in SCREEN_NAMES
+    )
+    pairs["Section IV Narr Long Format"] = (pandas_narr, polars_narr)
+    pairs["Section V SoA Long Format"] = (pandas_soa, polars_soa)
+    mismatches = [
+        name
+        for name, (left, right) in pairs.items()
+        if not frames_match(left.reset_index(drop=True), right.reset_index(drop=True))
+    ]
+
+    print(f"Coalitions {ppr_version} transforms, best of {repeat}:")
+    for backend, times in timings.items():
+        print(f"  {backend:<8}{min(times):>10.3f}s")
+    if mismatches:
+        print("Sheets that don't match: " + ", ".join(mismatches))
+    else:
+        print(f"All {len(pairs)} sheets match")
+
+    return {
+        "timings": dict((k, min(v)) for k, v in timings.items()),
+        "mismatches": mismatches,
+    }
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Compare the pandas and polars coalitions backends on a raw OLDC file"
+    )
+
+    parser.add_argument(
+        "--ppr_version",
+        choices=list(COALITION_VERSIONS.keys()),
+        default="2024",
+        help='Version of the coalitions PPR. Default is "2024"',
+    )
+
+    parser.add_argument(
+        "--raw_data_filename",
+        required=True,
+        help="File path of raw coalitions OLDC data.",
+    )
+
+    parser.add_argument(
+        "--crosswalk_filename",
+        required=True,
+        help="File path of the crosswalk for this PPR version.",
+    )
+
+    parser.add_argument(
+        "--coalitions_names_filename",
+        required=True,
+        help="File path of the full coalition names.",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of timed runs per backend. Default is 3",
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    result = compare_coalitions_backends(**vars(args))
+    sys.exit(1 if result["mismatches"] else 0)
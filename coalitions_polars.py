@@ -0,0 +1,572 @@
+import pandas as pd
+
+
+def _import_polars():
+    """Import polars, only needed for the "polars" coalitions backend."""
+
+    try:
+        import polars as pl
+    except ImportError as e:
+        raise ImportError(
+            'The "polars" coalitions backend requires the polars package (pip install polars)'
+        ) from e
+
+    return pl
+
+
+def to_lazy(df):
+    """Convert a pandas data frame to a Polars LazyFrame.
+
+    Object columns only hold strings and missing values after
+    <pf.process_raw_data>, other object columns are converted to strings.
+
+    :param df: Data frame to convert
+    :type df: <pd.DataFrame>
+
+    :return: Lazy frame of the data
+    :rtype: <pl.LazyFrame>
+    """
+
+    pl = _import_polars()
+
+    try:
+        return pl.from_pandas(df).lazy()
+    except (TypeError, ValueError, pl.exceptions.PolarsError):
+        df = df.copy()
+        for col in df.columns[df.dtypes == object]:
+            df[col] = df[col].map(lambda x: x if pd.isna(x) else str(x))
+        return pl.from_pandas(df).lazy()
+
+
+def _columns(lf):
+    """Get the column names of a lazy frame."""
+
+    return lf.collect_schema().names()
+
+
+def _merge(left, right, on, how="left"):
+    """Merge two lazy frames like <pd.DataFrame.merge>.
+
+    Missing keys match each other, overlapping columns get the pandas
+    "_x" and "_y" suffixes and the columns are in the pandas order. Outer
+    merges are sorted on the keys like pandas, with missing keys last.
+
+    :param left: Left frame
+    :type left: <pl.LazyFrame>
+    :param right: Right frame
+    :type right: <pl.LazyFrame>
+    :param on: Columns to merge on
+    :type on: <List>
+    :param how: "left" or "outer"
+    :type how: <str>
+
+    :return: Merged frame
+    :rtype: <pl.LazyFrame>
+    """
+
+    pl = _import_polars()
+
+    left_cols = _columns(left)
+    right_cols = _columns(right)
+    overlap = [c for c in right_cols if c in left_cols and c not in on]
+    left = left.rename({c: f"{c}_x" for c in overlap})
+    right = right.rename({c: f"{c}_y" for c in overlap})
+    left_cols = [f"{c}_x" if c in overlap else c for c in left_cols]
+    right_cols = [f"{c}_y" if c in overlap else c for c in right_cols]
+
+    # Polars only joins keys of the same type
+    left_schema = left.collect_schema()
+    right_schema = right.collect_schema()
+    right = right.with_columns(
+        [
+            pl.col(c).cast(left_schema[c], strict=False)
+            for c in on
+            if left_schema[c] != right_schema[c]
+        ]
+    )
+
+    merged = left.join(
+        right,
+        on=on,
+        how="full" if how == "outer" else how,
+        nulls_equal=True,
+        coalesce=True,
+        maintain_order="left_right",
+    ).select(left_cols + [c for c in right_cols if c not in on])
+
+    if how == "outer":
+        merged = merged.sort(on, nulls_last=True, maintain_order=True)
+
+    return merged
+
+
+def _keep_group_extreme(lf, keys, col, agg):
+    """Keep the rows with the max or min <col> per group of <keys>.
+
+    This is the lazy version of merging the grouped max or min back onto
+    the data with a right merge, the rows are returned in the sorted group
+    order of the right merge.
+    """
+
+    pl = _import_polars()
+
+    extreme = getattr(pl.col(col), agg)().over(keys)
+    return lf.filter(pl.col(col).eq_missing(extreme)).sort(
+        keys, nulls_last=True, maintain_order=True
+    )
+
+
+def _melt(lf, id_vars, value_vars, var_name, value_name):
+    """Melt a lazy frame like <pd.DataFrame.melt>."""
+
+    pl = _import_polars()
+
+    # Empty columns are read as floats, the values need a common type
+    schema = lf.collect_schema()
+    if len(set(schema[c] for c in value_vars)) > 1 and any(
+        schema[c] == pl.String for c in value_vars
+    ):
+        lf = lf.with_columns([pl.col(c).cast(pl.String) for c in value_vars])
+
+    return lf.unpivot(
+        on=value_vars, index=id_vars, variable_name=var_name, value_name=value_name
+    )
+
+
+def standardize_submissions_polars(coal_frames, id_cols, coalition_names, col_mapping):
+    """Standardize coalition submissions by year, program, and name
+
+    This is the Polars version of <cpf.standardize_submissions>, it keeps
+    the maximum review sequence number, maximum submit date and minimum row
+    iteration for each coalition, year, program.
+
+    :param coal_frames: Dictionary of coalition sheets to be processed
+    :type coal_frames: <Dict(<pl.LazyFrame>)>
+    :param id_cols: Columns that serve as identifying variables for all sheets
+    :type id_cols: <list>
+    :param coalition_names: The full coalition names
+    :type coalition_names: <pl.LazyFrame>
+    :param col_mapping: New names to give to choice columns listed in id_cols
+    :type col_mapping: <Dict>
+
+    :return: Standardized coalition submissions and the identifier columns
+    :rtype: <Dict(<pl.LazyFrame>)>, <List>
+    """
+
+    pl = _import_polars()
+
+    for screen in coal_frames.keys():
+        lf = coal_frames[screen]
+
+        if "EIN" in _columns(lf):
+            lf = lf.drop("EIN")
+
+        lf = lf.rename(col_mapping, strict=False)
+        columns = _columns(lf)
+
+        merge_cols = id_cols.copy()
+
+        # Use max review sequence number
+        if "RevSeqNumber" in columns:
+            lf = _keep_group_extreme(lf, merge_cols, "RevSeqNumber", "max")
+            merge_cols.append("RevSeqNumber")
+
+        # Convert date to datetime, if exists, and use max
+        if "SubmitDate" in columns:
+            lf = lf.with_columns(
+                pl.col("SubmitDate").str.strptime(pl.Datetime("ns"), "%m/%d/%Y")
+            )
+            lf = _keep_group_extreme(lf, merge_cols, "SubmitDate", "max")
+            merge_cols.append("SubmitDate")
+
+        # Use min row iteration
+        lf = _keep_group_extreme(lf, merge_cols, "Row-Iteration", "min")
+
+        lf = _merge(lf, coalition_names, ["State"])
+        grant_name_cols = [
+            x for x in _columns(lf) if "granteename" in x.replace(" ", "").lower()
+        ]
+        lf = lf.drop(grant_name_cols)
+
+        if screen == "Screen-1":
+            coal1 = lf
+            coal1_columns = _columns(coal1)
+        else:
+            intersect_columns = list(set(coal1_columns).intersection(set(_columns(lf))))
+            intersect_columns = [
+                i
+                for i in intersect_columns
+                if i not in ["Screen-Name", "Row-Iteration", "Screen-Iteration"]
+            ]
+            lf = _merge(lf, coal1, intersect_columns)
+
+        coal_frames[screen] = lf
+
+    # Add the unique Screen-1 names to identifyer columns, since they were added to every sheet
+    join_cols = id_cols + [c for c in coal1_columns if c not in intersect_columns]
+    join_cols = [c for c in join_cols if c not in ["Screen-Name", "Row-Iteration", "Screen-Iteration"]]
+
+    return coal_frames, join_cols
+
+
+def process_sheets_polars(
+    coal_frames,
+    coal_xw,
+    screen_names,
+    cs_df,
+    soa_sheetName,
+    join_cols,
+    coalition_names,
+    ppr_year="2024",
+):
+    """Process coalition sheets
+
+    This is the Polars version of <cpf.process_sheets>.
+
+    :param coal_frames: Dictionary of coalition sheets to be processed
+    :type coal_frames: <Dict(<pl.LazyFrame>)>
+    :param coal_xw: Crosswalk file
+    :type coal_xw: <pd.DataFrame>
+    :param screen_names: Names of the coalition sheets and their section headers
+    :type screen_names: <Dict>
+    :param cs_df: List of expected coalition submissions for available years and programs
+    :type cs_df: <pl.LazyFrame>
+    :param soa_sheetName: Name of Summary of Activities sheet
+    :type soa_sheetName: <Str>
+    :param join_cols: Unique identifier columns to join sheets on
+    :type join_cols: <List>
+    :param coalition_names: The full coalition names
+    :type coalition_names: <pl.LazyFrame>
+    :param ppr_year: The PPR year being processed
+    :type ppr_year: <Str>
+
+    :return: Processed coalition sheets and updated join columns
+    :rtype: <Dict(<pl.LazyFrame>), <List>
+    """
+
+    pl = _import_polars()
+
+    cs_columns = _columns(cs_df)
+    new_join_cols = join_cols
+    for screen in screen_names.keys():
+        lf = coal_frames[screen]
+        columns = _columns(lf)
+
+        # Update join columns dynamically based on availability
+        these_join_cols = [col for col in join_cols if col in columns]
+        new_join_cols = [c for c in new_join_cols if c in these_join_cols]
+
+        # Get intersecting crosswalk column names
+        intersect_columns = list(set(coal_xw["Meta Name Description"]).intersection(set(columns)))
+        intersect_xw = coal_xw.loc[coal_xw["Meta Name Description"].isin(intersect_columns)]
+        rename_map = dict(zip(intersect_xw["Meta Name Description"], intersect_xw["Label"]))
+
+        # Rename columns based on crosswalk file
+        lf = lf.rename(rename_map, strict=False)
+        columns = _columns(lf)
+
+        # Process some of Section V.
+        if screen == soa_sheetName:
+            # Remove 'select' and 'none' from Involvement strings
+            involve_cols = [f for f in columns if "Involvement" in f]
+            lf = lf.with_columns(
+                [
+                    pl.when(
+                        pl.col(col)
+                        .cast(pl.String)
+                        .str.to_lowercase()
+                        .is_in(["none", "select"])
+                    )
+                    .then(None)
+                    .otherwise(pl.col(col))
+                    .alias(col)
+                    for col in involve_cols
+                ]
+            )
+
+            # Make training columns numeric
+            train_cols = [f for f in columns if "Trained" in f]
+            lf = lf.with_columns(
+                [pl.col(col).cast(pl.Float64, strict=False) for col in train_cols]
+            )
+
+        # Evaluate missing submissions for each program and year
+        lf = lf.with_columns(
+            pl.lit(False).alias("Missing"),
+            pl.col("Program Abbr").replace(
+                {"SDVC": "Core FVPSA", "SDC6": "ARP Act", "SDC3": "CARES Act"}
+            ),
+            pl.col("Year").cast(pl.String),
+        )
+        columns = _columns(lf)
+        lf = lf.unique(subset=these_join_cols, keep="first", maintain_order=True)
+
+        # Right merge on the expected submissions
+        lf = (
+            cs_df.join(
+                lf,
+                left_on=["State", "Year", "Coal Program Abbr"],
+                right_on=["State", "Year", "Program Abbr"],
+                how="left",
+                nulls_equal=True,
+                maintain_order="left_right",
+            )
+            .select(
+                [c for c in columns if c != "Program Abbr"]
+                + [c for c in cs_columns if c not in ["State", "Year"]]
+            )
+            .rename({"Coal Program Abbr": "Program Abbr"})
+            .unique(subset=these_join_cols, keep="first", maintain_order=True)
+            .with_columns(pl.col("Missing").fill_null(True))
+        )
+
+        # Add coalition name to missing coalitions
+        lf = lf.drop("CoalitionName", strict=False)
+        lf = _merge(lf, coalition_names, ["State"])
+
+        # Assign to processed data
+        coal_frames[screen] = lf
+
+    new_join_cols = new_join_cols + ["Missing", "CoalitionName"]
+
+    # Merge Screen IV and Screen V with year-specific logic
+    screen5 = coal_frames["Screen-5"]
+    screen4 = coal_frames["Screen-4"]
+
+    # Define narrative questions based on PPR year
+    if ppr_year == "2024":
+        narrative_prefix = ["1. ", "2. ", "3. ", "4. ", "5. ", "6. ", "7. "]  # Extra narrative questions in 2024
+    elif ppr_year == "2023":
+        narrative_prefix = ["1. ", "2. ", "3. ", "4. ", "5. "]
+
+    # Filter Screen IV based on year-specific narrative questions
+    narr_questions = [c for c in _columns(screen4) for e in narrative_prefix if e in c]
+    narr_questions = list(dict.fromkeys(narr_questions))
+    screen4 = screen4.select(new_join_cols + narr_questions)
+
+    # Merge Screen IV and V
+    coal_frames["Screen-5"] = _merge(screen5, screen4, new_join_cols)
+
+    return coal_frames, new_join_cols
+
+
+def sectionIV_long_format_polars(narr, var_cols, xw):
+    """Transform Section IV into long format.
+
+    This is the Polars version of <cpf.sectionIV_long_format>.
+
+    :param narr: Section IV data
+    :type narr: <pl.LazyFrame>
+    :param var_cols: Columns to keep as identifiers
+    :type var_cols: <List>
+    :param xw: Crosswalk with the Meta Name Description and Label columns
+    :type xw: <pd.DataFrame>
+
+    :return: Long format Section IV
+    :rtype: <pl.LazyFrame>
+    """
+
+    rename_map = dict(zip(xw["Meta Name Description"], xw["Label"]))
+    rename_map = {k: v for k, v in rename_map.items() if k != v}
+
+    narr = narr.rename(rename_map, strict=False)
+
+    # Include all narrative questions from 1 through 7
+    narr_cols = [label for label in xw["Label"] if any(sub in label for sub in ["1. ", "2. ", "3. ", "4. ", "5. ", "6. ", "7. "])]
+
+    narr_sub = narr.select(var_cols + narr_cols)
+    coal_long_narr = _melt(
+        narr_sub, var_cols, narr_cols, "Narrative Question", "Response"
+    ).unique(subset=var_cols + ["Response"], keep="first", maintain_order=True)
+
+    return coal_long_narr
+
+
+def _sectionV_priority_area(soa, var_cols, cols, value_name, prefix):
+    """Melt one group of Section V columns to long format.
+
+    The pandas version assigns the cleaned priority areas with a reset
+    index after dropping duplicates, so the n-th kept priority area lands
+    on the row with melt index n (and missing past the last kept row). The
+    same alignment is kept here so both backends produce the same sheet.
+    """
+
+    pl = _import_polars()
+
+    melted = _melt(soa.select(var_cols + cols), var_cols, cols, "Priority Area", value_name)
+    kept = melted.with_row_index("__melt_row").unique(
+        subset=var_cols + ["Priority Area"], keep="first", maintain_order=True
+    )
+    priority_areas = kept.select(
+        pl.int_range(pl.len(), dtype=pl.get_index_type()).alias("__melt_row"),
+        pl.col("Priority Area").str.replace_all(prefix, "", literal=True),
+    )
+
+    return (
+        kept.drop("Priority Area")
+        .join(priority_areas, on="__melt_row", how="left", maintain_order="left")
+        .select(var_cols + ["Priority Area", value_name])
+    )
+
+
+def sectionV_long_format_polars(soa, var_cols):
+    """Convert Section V to long format
+
+    This is the Polars version of <cpf.sectionV_long_format>.
+
+    :param soa: Summary of Activities sheet
+    :type soa: <pl.LazyFrame>
+    :param var_cols: Unique identifier columns
+    :type var_cols: <List>
+
+    :return: Summary of Activities sheet in long format
+    :rtype: <pl.LazyFrame>
+    """
+
+    pl = _import_polars()
+
+    columns = _columns(soa)
+
+    # Involvement
+    coal_long_involve = _sectionV_priority_area(
+        soa,
+        var_cols,
+        [f for f in columns if "Involvement" in f],
+        "Level of Involvement",
+        "Level of Involvement - ",
+    )
+
+    # Short responses
+    coal_long_short = _sectionV_priority_area(
+        soa,
+        var_cols,
+        [f for f in columns if "Short Response" in f],
+        "Short Response",
+        "Short Response (Involved and Highly Involved only) - ",
+    )
+
+    # Types of activities
+    coal_long_types = _sectionV_priority_area(
+        soa,
+        var_cols,
+        [f for f in columns if "Types of Activities" in f],
+        "Types of Activities",
+        "Types of Activities - ",
+    )
+
+    # Number of people trained
+    coal_long_trained = _sectionV_priority_area(
+        soa,
+        var_cols,
+        [f for f in columns if "Number of People Trained" in f],
+        "Number of People Trained",
+        "Number of People Trained - ",
+    )
+
+    keys = var_cols + ["Priority Area"]
+    soa_long = _merge(coal_long_involve, coal_long_types, keys, how="outer")
+    soa_long = _merge(soa_long, coal_long_short, keys, how="outer")
+    soa_long = _merge(soa_long, coal_long_trained, keys, how="outer")
+
+    # Split Types of Activities into separate rows
+    types = pl.col("Types of Activities")
+    soa_long = (
+        soa_long.with_columns(
+            types.cast(pl.String)
+            .fill_null("nan")
+            .str.split("|")
+            .list.eval(pl.element().str.strip_chars())
+        )
+        .explode("Types of Activities")
+        .with_columns(pl.when(types == "nan").then(None).otherwise(types).alias("Types of Activities"))
+    )
+
+    return soa_long
+
+
+def transform_coalitions_polars(
+    coal_dat_processed,
+    join_cols,
+    coal_xw,
+    coalition_names,
+    cs_df,
+    screen_names,
+    soa_sheetName,
+    narr_sheetName,
+    soa_rename_map,
+    col_mapping,
+    ppr_year,
+):
+    """Standardize, process and reshape the coalition sheets with Polars.
+
+    The whole chain is built as one lazy query per output and collected
+    together, so Polars can push projections and filters down and share
+    the common subplans between the sheets.
+
+    :param coal_dat_processed: Lightly processed coalition sheets
+    :type coal_dat_processed: <Dict(<pd.DataFrame>)>
+    :param join_cols: Unique identifier columns to join sheets on
+    :type join_cols: <List>
+    :param coal_xw: Crosswalk file
+    :type coal_xw: <pd.DataFrame>
+    :param coalition_names: The full coalition names
+    :type coalition_names: <pd.DataFrame>
+    :param cs_df: List of expected coalition submissions
+    :type cs_df: <pd.DataFrame>
+    :param screen_names: Names of the coalition sheets and their section headers
+    :type screen_names: <Dict>
+    :param soa_sheetName: Name of Summary of Activities sheet
+    :type soa_sheetName: <str>
+    :param narr_sheetName: Name of Narrative Questions sheet
+    :type narr_sheetName: <str>
+    :param soa_rename_map: Duplicated Summary of Activities columns and their
+        proper names
+    :type soa_rename_map: <Dict>
+    :param col_mapping: New names to give to choice columns listed in join_cols
+    :type col_mapping: <Dict>
+    :param ppr_year: The PPR year being processed
+    :type ppr_year: <str>
+
+    :return: Processed coalition sheets, Section IV. long format and Section
+        V. long format
+    :rtype: <Dict(<pd.DataFrame>)>, <pd.DataFrame>, <pd.DataFrame>
+    """
+
+    pl = _import_polars()
+
+    coal_frames = dict((k, to_lazy(v)) for k, v in coal_dat_processed.items())
+    coalition_names = to_lazy(coalition_names)
+
+    (coal_frames, new_join_cols) = standardize_submissions_polars(
+        coal_frames, join_cols, coalition_names, col_mapping
+    )
+
+    # Fix duplicate columns in Section V. Summary of Activities
+    coal_frames[soa_sheetName] = coal_frames[soa_sheetName].rename(
+        soa_rename_map, strict=False
+    )
+
+    (coal_frames, new_join_cols) = process_sheets_polars(
+        coal_frames,
+        coal_xw,
+        screen_names,
+        to_lazy(cs_df),
+        soa_sheetName,
+        new_join_cols,
+        coalition_names,
+        ppr_year,
+    )
+
+    var_cols = new_join_cols.copy()
+    narr_long = sectionIV_long_format_polars(
+        coal_frames[narr_sheetName], var_cols + ["Rpt-Receipt-Id"], coal_xw
+    )
+    soa_long = sectionV_long_format_polars(
+        coal_frames[soa_sheetName], var_cols + ["Rpt-Receipt-Id"]
+    )
+
+    screens = list(coal_frames.keys())
+    collected = pl.collect_all([coal_frames[k] for k in screens] + [narr_long, soa_long])
+    collected = [df.to_pandas() for df in collected]
+
+    return dict(zip(screens, collected[:-2])), collected[-2], collected[-1]
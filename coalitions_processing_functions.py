@@ -1,10 +1,57 @@
 import pandas as pd
 import os
 import shutil
+import tomllib
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import date, datetime
 
+import processing_functions as pf
+
+
+# Columns every screen has that screens aren't joined to Screen-1 on, the join suffixes them _x and _y
+SCREEN_ITERATION_COLUMNS = ["Screen-Name", "Row-Iteration", "Screen-Iteration"]
+
+# Column that keys the rows of every screen to their Screen-1 cover page submission, see
+# <standardize_submissions>
+SUBMISSION_KEY = "Submission Key"
+
+# Configuration of the submissions coalitions are expected to make, the states and the programs of each fiscal year
+EXPECTED_SUBMISSIONS_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "expected_submissions.toml")
+
+
+def load_expected_submissions(filename=EXPECTED_SUBMISSIONS_FILENAME):
+    """Build the matrix of expected submissions from its configuration file
+
+    The file lists the states coalitions are expected to submit for, and
+    the programs of each fiscal year, so a new fiscal year only needs a new
+    line in the file.
+
+    :param filename: File path of the TOML configuration
+    :type filename: <str>
+
+    :return: Expected submissions, True for every state-year-program
+        combination, indexed by state, with a column per year and program
+    :rtype: <pd.DataFrame>
+    """
+
+    with open(filename, "rb") as f:
+        config = tomllib.load(f)
+
+    return pd.DataFrame(
+        True,
+        index=pd.Index(sorted(config["states"]), name="State"),
+        columns=pd.MultiIndex.from_tuples(
+            [(year, program) for year, programs in config["programs"].items() for program in programs],
+            names=["Year", "Coal Program Abbr"],
+        ),
+    )
+
+
+# Expected submissions, True for every state-year-program combination
+EXPECTED_SUBMISSIONS = load_expected_submissions()
+
 
 def copy_old_data(string_date,
     processed_coalitions_data_filename,
@@ -64,11 +111,14 @@ def copy_old_data(string_date,
     return os.path.join(os.path.dirname(processed_coalitions_data_filename), f"coalitions_processed_{oldc_pull_date}_processed_{string_date}.xlsx")
 
 
-def read_coalitions_data(filepath_raw, crosswalk_filename, coalitions_names_filename):
+def read_coalitions_data(
+    filepath_raw, crosswalk_filename, coalitions_names_filename, engine="openpyxl", sheet_names=None
+):
     """Read in raw coalitions data
 
-    This function reads in the raw coalitions data (all sheets) and
-    the crosswalk file and returns as pandas data frames.
+    This function reads in the raw coalitions data (all sheets, or the
+    sheets in <sheet_names>) and the crosswalk file and returns as pandas
+    data frames.
 
     :param filepath_raw: File path to the raw OLDC data (this is what will
         be processed)
@@ -78,19 +128,80 @@ def read_coalitions_data(filepath_raw, crosswalk_filename, coalitions_names_file
     :type filepath_crosswalk: <str>
     :param coalitions_names_filename: File path to the full coalition names
     :type coalitions_names_filename: <str>
+    :param engine: Engine to read the workbooks with, one of
+        <pf.EXCEL_ENGINES>
+    :type engine: <str>
+    :param sheet_names: Raw sheets to read. Default is all sheets
+    :type sheet_names: <List<str>>
 
     :return: Data frames corresponding to the given sheets, except for the
         raw data, which is returned as a dictionary of data frames
-        corresponding to the relevant sheets
+        corresponding to the relevant sheets, and the values that failed to
+        coerce to the data type the crosswalk declares for their column (see
+        <pf.apply_column_schema>)
     :rtype: <pd.DataFrame>; raw_data: <Dict<pd.DataFrame>>
     """
-    raw_data = pd.read_excel(filepath_raw, sheet_name=None, parse_dates=True)
+    xw = pf.read_excel_sheet(crosswalk_filename, "coalitions", engine=engine)
+
+    schema = pf.get_column_schema(xw)
+    with pf.open_excel(filepath_raw, engine=engine) as raw_file:
+        column_kinds = pf.read_column_kinds(
+            raw_file, sheet_names or raw_file.sheet_names, schema, engine=engine
+        )
+        raw_data = pf.read_excel(
+            raw_file,
+            sheet_name=sheet_names,
+            engine=engine,
+            parse_dates=True,
+            dtype=pf.get_reader_dtypes(column_kinds, text_columns=[]),
+        )
+    raw_data, coercion_report = pf.apply_column_schema(raw_data, column_kinds)
+    pf.print_coercion_report(coercion_report)
+
+    coal_names = pf.read_csv_file(coalitions_names_filename)
+
+    return raw_data, xw, coal_names, coercion_report
+
+
+def get_expected_submissions(target_year=None):
+    """Get the matrix of expected submissions
+
+    Every state-program-year combination that's expected from the raw OLDC
+    data is True. The matrix is built from <EXPECTED_SUBMISSIONS_FILENAME>
+    once, when the module is loaded, see <load_expected_submissions>.
+
+    :param target_year: "before_2024" for the years before 2024,
+        "after_2024" for 2024 onwards. Default is None, every year
+    :type target_year: <str>
+
+    :return: Expected submissions, indexed by state, with a column per year
+        and program
+    :rtype: <pd.DataFrame>
+    """
 
-    xw = pd.read_excel(crosswalk_filename, sheet_name="coalitions")
+    years = EXPECTED_SUBMISSIONS.columns.get_level_values("Year")
+    if target_year == "after_2024":  # Only return 2024 onwards
+        return EXPECTED_SUBMISSIONS.loc[:, years >= "2024"]
+    elif target_year == "before_2024":  # Return all years except 2024 onwards
+        return EXPECTED_SUBMISSIONS.loc[:, years < "2024"]
 
-    coal_names = pd.read_csv(coalitions_names_filename)
+    return EXPECTED_SUBMISSIONS
 
-    return raw_data, xw, coal_names
+
+def get_expected_keys(expected):
+    """Get the state, year and program of every expected submission
+
+    :param expected: Matrix of expected submissions, see
+        <get_expected_submissions>
+    :type expected: <pd.DataFrame>
+
+    :return: Expected submissions, in order of state, year and program
+    :rtype: <pd.MultiIndex>
+    """
+
+    stacked = expected.stack(["Year", "Coal Program Abbr"], future_stack=True)
+
+    return stacked.index[stacked.to_numpy(dtype=bool)]
 
 
 def get_ground_truth_submissions(target_year=None):
@@ -101,106 +212,212 @@ def get_ground_truth_submissions(target_year=None):
     always submit their PPRs, this data frame is used to identify which ones
     don't have any submission at all.
 
-    NOTE: This must be updated with additional programs/years over time
+    :param target_year: See <get_expected_submissions>
+    :type target_year: <str>
 
     :return: Data frame corresponding to every state-program-year combination
         expected from the coalitions data
     :rtype: <pd.DataFrame>
     """
-    coalition_states = [
-        "AL",
-        "AK",
-        "AZ",
-        "AR",
-        "CA",
-        "CO",
-        "CT",
-        "DE",
-        "DC",
-        "FL",
-        "GA",
-        "HI",
-        "ID",
-        "IL",
-        "IN",
-        "IA",
-        "KS",
-        "KY",
-        "LA",
-        "ME",
-        "MD",
-        "MA",
-        "MI",
-        "MN",
-        "MS",
-        "MO",
-        "MT",
-        "NE",
-        "NV",
-        "NH",
-        "NJ",
-        "NM",
-        "NY",
-        "NC",
-        "ND",
-        "OH",
-        "OK",
-        "OR",
-        "PA",
-        "RI",
-        "SC",
-        "SD",
-        "TN",
-        "TX",
-        "UT",
-        "VT",
-        "VA",
-        "WA",
-        "WV",
-        "WI",
-        "WY",
-        "PR",
-        "AS",
-        "MP",
-        "GU",
-        "VI",
-    ]
 
-    # NOTE: Years and programs should be added for each new fiscal year
-    years = {
-        "Year": ["2018", "2019", "2020", "2021", "2021", "2022", "2022", "2023", "2023", "2024", "2024"],
-        "Coal Program Abbr": [
-            "Core FVPSA",
-            "Core FVPSA",
-            "Core FVPSA",
-            "Core FVPSA",
-            "CARES Act",
-            "Core FVPSA",
-            "ARP Act",
-            "Core FVPSA",
-            "ARP Act",
-            "Core FVPSA",
-            "ARP Act"
-        ],
-    }
-
-    # Filter years based on the target_year input
-    years_df = pd.DataFrame(data=years)
-    if target_year == "after_2024":  # Only return 2024
-        years_df = years_df[years_df["Year"] >= "2024"]
-    elif target_year == "before_2024":  # Return all years except 2024
-        years_df = years_df[years_df["Year"] < "2024"]
-
-    # Build the combinations of State-Year
-    cs_df = pd.DataFrame(
-        data={
-            "State": np.sort(coalition_states * len(years_df["Year"].unique())),
-            "Year": list(years_df["Year"].unique()) * len(coalition_states),
-        }
+    return get_expected_keys(get_expected_submissions(target_year)).to_frame(index=False)
+
+
+def flag_missing_submissions(frames, expected, join_cols):
+    """Flag missing submissions on every coalition screen
+
+    The rows of every screen are looked up in the expected submissions at
+    once. Rows of submissions that aren't expected are dropped, and an
+    empty row flagged as "Missing" is added for every expected submission
+    a screen has no rows for. Each screen is then ordered by the expected
+    submissions, as a right merge on them would be.
+
+    :param frames: Dictionary of coalition sheets, with "State", "Year",
+        "Program Abbr" and "Missing" columns
+    :type frames: <Dict(<pd.DataFrame>)>
+    :param expected: Matrix of expected submissions, see
+        <get_expected_submissions>
+    :type expected: <pd.DataFrame>
+    :param join_cols: Join columns available in each screen
+    :type join_cols: <Dict(<List>)>
+
+    :return: Coalition sheets with the missing submissions
+    :rtype: <Dict(<pd.DataFrame>)>
+    """
+
+    key_cols = ["State", "Year", "Program Abbr"]
+    expected_keys = get_expected_keys(expected)
+    screens = list(frames.keys())
+    lengths = [len(frames[screen]) for screen in screens]
+
+    # Position of every submitted row of every screen in the expected submissions, -1 if it's not expected
+    positions = expected_keys.get_indexer(
+        pd.MultiIndex.from_frame(pd.concat([frames[screen][key_cols] for screen in screens]))
     )
-    cs_df = cs_df.merge(years_df, how="left", on="Year")
+    screen_codes = np.repeat(np.arange(len(screens)), lengths)
+
+    # Anti-join: the expected submissions each screen has no rows for
+    submitted = np.zeros((len(screens), len(expected_keys)), dtype=bool)
+    submitted[screen_codes[positions >= 0], positions[positions >= 0]] = True
+    missing_rows = expected_keys.to_frame(index=False, name=key_cols).assign(Missing=True)
+
+    offsets = np.cumsum([0] + lengths)
+    flagged = {}
+    for i, screen in enumerate(screens):
+        these_positions = positions[offsets[i] : offsets[i + 1]]
+        is_expected = these_positions >= 0
+        is_missing = ~submitted[i]
+
+        df = pd.concat([frames[screen][is_expected], missing_rows[is_missing]])
+        order = np.concatenate([these_positions[is_expected], np.flatnonzero(is_missing)])
+        df = df.iloc[np.argsort(order, kind="stable")]
+
+        # The program column comes last, as it did from the right merge
+        df = df[[c for c in df.columns if c != "Program Abbr"] + ["Program Abbr"]]
+        flagged[screen] = df.drop_duplicates(subset=join_cols[screen], ignore_index=True)
+
+    return flagged
+
+
+# Arguments shared by every screen, set once per worker process by <map_screens>
+_shared_screen_args = {}
+
+
+def _init_screen_worker(shared, copy_on_write):
+    """Store the arguments shared by every screen in a worker process.
+
+    The worker takes the pandas Copy-on-Write setting of the main process.
+    """
+
+    global _shared_screen_args
+    _shared_screen_args = shared
+    pd.set_option("mode.copy_on_write", copy_on_write)
+
+
+def _call_screen_func(func, screen, df):
+    """Call a per-screen function with the shared arguments of the worker."""
+
+    return func(screen, df, **_shared_screen_args)
+
+
+def map_screens(func, frames, shared, executor="serial", max_workers=None):
+    """Apply a function to every coalition screen
 
-    return cs_df
+    Calls <func(screen, df, **shared)> for every screen in <frames>. With the
+    "process" executor the shared arguments (e.g. the standardized Screen-1)
+    are sent to each worker process once instead of once per screen.
+
+    :param func: Module level function to apply
+    :type func: <Callable>
+    :param frames: Dictionary of coalition sheets
+    :type frames: <Dict(<pd.DataFrame>)>
+    :param shared: Keyword arguments shared by every screen
+    :type shared: <Dict>
+    :param executor: "serial", "thread" or "process"
+    :type executor: <str>
+    :param max_workers: Maximum number of workers in the pool
+    :type max_workers: <int>
+
+    :return: Results of every screen, in the order of <frames>
+    :rtype: <Dict>
+    """
+
+    screens = list(frames.keys())
+    if executor == "serial" or len(screens) < 2:
+        return dict((screen, func(screen, frames[screen], **shared)) for screen in screens)
+
+    if executor == "process":
+        pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_screen_worker,
+            initargs=(shared, pd.get_option("mode.copy_on_write")),
+        )
+        with pool:
+            results = list(
+                pool.map(
+                    _call_screen_func,
+                    [func] * len(screens),
+                    screens,
+                    [frames[screen] for screen in screens],
+                )
+            )
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(
+                pool.map(
+                    lambda screen: func(screen, frames[screen], **shared), screens
+                )
+            )
+
+    return dict(zip(screens, results))
+
+
+def _standardize_screen(screen, df, id_cols, coalition_names, col_mapping, coal1=None):
+    """Standardize the submissions of one coalition screen
+
+    See <standardize_submissions>. Every screen but Screen-1 is merged onto
+    the submission key of the standardized Screen-1 <coal1>.
+
+    :return: Standardized screen and the columns it was merged to Screen-1 on
+    :rtype: <pd.DataFrame>, <List>
+    """
+
+    if "EIN" in df.columns:
+        df = df.drop(["EIN"], axis="columns")
+
+    df = df.rename(columns=col_mapping)
+
+    merge_cols = id_cols.copy()
+
+    df_submitdate_col = "SubmitDate"
+    df_revseq_col = "RevSeqNumber"
+
+    # Use max review sequence number
+    if df_revseq_col in df.columns:
+        df_maxRev = (
+            df.groupby(merge_cols, dropna=False)[df_revseq_col].max().reset_index()
+        )
+
+        merge_cols.append(df_revseq_col)
+        df = df.merge(df_maxRev, how="right", on=merge_cols)
+
+    # Convert date to datetime, if exists, and use max
+    if df_submitdate_col in df.columns:
+        df[df_submitdate_col] = [
+            datetime.strptime(x, "%m/%d/%Y") for x in df[df_submitdate_col]
+        ]
+        df_maxDate = (
+            df.groupby(merge_cols, dropna=False)[df_submitdate_col]
+            .max()
+            .reset_index()
+        )
+
+        merge_cols.append(df_submitdate_col)
+        df = df.merge(df_maxDate, how="right", on=merge_cols)
+
+    # Use min row iteration
+    df_min = df.groupby(merge_cols, dropna=False)["Row-Iteration"].min().reset_index()
+    merge_cols.append("Row-Iteration")
+    df = df.merge(df_min, how="right", on=merge_cols)
+
+    df = df.merge(coalition_names, how="left", on="State")
+    grant_name_cols = [
+        x for x in df.columns if "granteename" in x.replace(" ", "").lower()
+    ]
+    df = df.drop(grant_name_cols, axis="columns")
+
+    intersect_columns = None
+    if coal1 is not None:
+        intersect_columns = list(set(coal1.columns).intersection(set(df.columns)))
+        intersect_columns = [
+            i
+            for i in intersect_columns
+            if i not in SCREEN_ITERATION_COLUMNS
+        ]
+        # Only the key of the cover page is joined, the cover page columns are joined for the export
+        df = df.merge(coal1[intersect_columns + [SUBMISSION_KEY]], how="left", on=intersect_columns)
+
+    return df, intersect_columns
 
 
 def standardize_submissions(
@@ -215,12 +432,20 @@ def standardize_submissions(
         "DunsId9": "DUNS",
         "ProgramName": "Program Name",
     },
+    executor="serial",
+    max_workers=None,
 ):
     """Standardize coalition submissions by year, program, and name
 
     This function standardizes the coalition submissions so that only the
     minimum row iteration, maximum review sequence number, and maximum submit date are used
-    for each coalition, year, program.
+    for each coalition, year, program. Screen-1 is standardized first, the
+    other screens only depend on it and are standardized concurrently.
+
+    Screen-1 is kept as the cover page of the submissions, a dimension
+    table keyed by <SUBMISSION_KEY>. The other screens are joined to it and
+    only carry the key, the cover page columns are joined onto them for
+    the export by <expand_cover_page>.
 
     :param coal_dat_processed: Dictionary of coalition sheets to be processed
     :type coal_dat_processed: <Dict(<pd.DataFrame>)>
@@ -230,93 +455,226 @@ def standardize_submissions(
     :type coalition_names: <pd.DataFrame>
     :param col_mapping: New names to give to choice columns listed in id_cols
     :type col_mapping: <Dict>
-
-    :return: Standardized coalition submissions
-    :rtype: <Dict(<pd.DataFrame>)>
+    :param executor: Pool to standardize the screens on, "serial", "thread"
+        or "process"
+    :type executor: <str>
+    :param max_workers: Maximum number of workers in the pool
+    :type max_workers: <int>
+
+    :return: Standardized coalition submissions, the identifier columns
+        and the cover page
+    :rtype: <Dict(<pd.DataFrame>)>, <List>, <pd.DataFrame>
     """
 
-    for screen in coal_dat_processed.keys():
-        df = coal_dat_processed[screen]
+    (coal1, _) = _standardize_screen(
+        "Screen-1", coal_dat_processed["Screen-1"], id_cols, coalition_names, col_mapping
+    )
 
-        if "EIN" in df.columns:
-            df = df.drop(["EIN"], axis="columns")
+    # Rows with the same cover page share a key, as they were deduplicated on the cover page columns
+    coal1[SUBMISSION_KEY] = coal1.groupby(
+        [c for c in coal1.columns if c not in SCREEN_ITERATION_COLUMNS], dropna=False, sort=False
+    ).ngroup()
+
+    results = map_screens(
+        _standardize_screen,
+        dict((k, v) for k, v in coal_dat_processed.items() if k != "Screen-1"),
+        shared={
+            "id_cols": id_cols,
+            "coalition_names": coalition_names,
+            "col_mapping": col_mapping,
+            "coal1": coal1,
+        },
+        executor=executor,
+        max_workers=max_workers,
+    )
+
+    for screen in coal_dat_processed.keys():
+        if screen == "Screen-1":
+            coal_dat_processed[screen] = coal1
+        else:
+            (coal_dat_processed[screen], intersect_columns) = results[screen]
 
-        df = df.rename(columns=col_mapping)
+    # Add the unique Screen-1 names to identifyer columns, they're joined onto every sheet by the key
+    join_cols = id_cols + [c for c in coal1.columns if c not in intersect_columns]
+    join_cols = [c for c in join_cols if c not in SCREEN_ITERATION_COLUMNS]
 
-        merge_cols = id_cols.copy()
+    return coal_dat_processed, join_cols, coal1.drop_duplicates(subset=[SUBMISSION_KEY])
 
-        df_submitdate_col = "SubmitDate"
-        df_revseq_col = "RevSeqNumber"
 
-        # Use max review sequence number
-        if df_revseq_col in df.columns:
-            df_maxRev = (
-                df.groupby(merge_cols, dropna=False)[df_revseq_col].max().reset_index()
-            )
+def expand_cover_page(df, cover_page, columns=None):
+    """Join the cover page columns onto a sheet that carries the submission key
 
-            merge_cols.append(df_revseq_col)
-            df = df.merge(df_maxRev, how="right", on=merge_cols)
-
-        # Convert date to datetime, if exists, and use max
-        if df_submitdate_col in df.columns:
-            df[df_submitdate_col] = [
-                datetime.strptime(x, "%m/%d/%Y") for x in df[df_submitdate_col]
-            ]
-            df_maxDate = (
-                df.groupby(merge_cols, dropna=False)[df_submitdate_col]
-                .max()
-                .reset_index()
-            )
+    The cover page columns take the place of the key, and columns the sheet
+    and the cover page both have are suffixed _x and _y, as when every
+    screen was merged onto Screen-1.
 
-            merge_cols.append(df_submitdate_col)
-            df = df.merge(df_maxDate, how="right", on=merge_cols)
+    :param df: Coalition sheet with the <SUBMISSION_KEY> column
+    :type df: <pd.DataFrame>
+    :param cover_page: Cover page from <standardize_submissions>
+    :type cover_page: <pd.DataFrame>
+    :param columns: Cover page columns to join. Default is the ones the
+        sheet doesn't have, and the <SCREEN_ITERATION_COLUMNS>
+    :type columns: <List>
 
-        # Use min row iteration
-        df_min = df.groupby(merge_cols, dropna=False)["Row-Iteration"].min().reset_index()
-        merge_cols.append("Row-Iteration")
-        df = df.merge(df_min, how="right", on=merge_cols)
+    :return: Sheet with the cover page columns instead of the key
+    :rtype: <pd.DataFrame>
+    """
 
-        df = df.merge(coalition_names, how="left", on="State")
-        grant_name_cols = [
-            x for x in df.columns if "granteename" in x.replace(" ", "").lower()
+    if columns is None:
+        columns = [
+            c
+            for c in cover_page.columns
+            if c != SUBMISSION_KEY and (c not in df.columns or c in SCREEN_ITERATION_COLUMNS)
         ]
-        df = df.drop(grant_name_cols, axis="columns")
 
-        if screen == "Screen-1":
-            coal1 = df.copy()
-        else:
-            intersect_columns = list(set(coal1.columns).intersection(set(df.columns)))
-            intersect_columns = [
-                i
-                for i in intersect_columns
-                if i not in ["Screen-Name", "Row-Iteration", "Screen-Iteration"]
-            ]
-            df = df.merge(coal1, how="left", on=intersect_columns)
+    expanded = df.merge(
+        cover_page[[SUBMISSION_KEY] + columns], how="left", on=SUBMISSION_KEY, suffixes=("_x", "_y")
+    )
 
-        coal_dat_processed[screen] = df
+    both = set(columns).intersection(set(df.columns))
+    left_columns = [f"{c}_x" if c in both else c for c in df.columns]
+    right_columns = [f"{c}_y" if c in both else c for c in columns]
+    position = left_columns.index(SUBMISSION_KEY)
+
+    return expanded[left_columns[:position] + right_columns + left_columns[position + 1 :]]
+
+
+def get_cover_page_join_cols(join_cols, id_cols, coal_xw):
+    """Get the cover page columns the long formats are identified by
+
+    These are the unique Screen-1 columns <standardize_submissions> adds to
+    the identifier columns, except the ones the crosswalk renames.
+
+    :param join_cols: Identifier columns from <standardize_submissions>
+    :type join_cols: <List>
+    :param id_cols: Identifier columns passed to <standardize_submissions>
+    :type id_cols: <List>
+    :param coal_xw: Crosswalk file
+    :type coal_xw: <pd.DataFrame>
+
+    :return: Cover page columns
+    :rtype: <List>
+    """
+
+    labelled = set(coal_xw["Meta Name Description"])
+
+    return [
+        c for c in join_cols if c not in id_cols and c != SUBMISSION_KEY and c not in labelled
+    ]
 
-    # Add the unique Screen-1 names to identifyer columns, since they were added to every sheet
-    join_cols = id_cols + [c for c in coal1.columns if c not in intersect_columns]
-    join_cols = [c for c in join_cols if c not in ["Screen-Name", "Row-Iteration", "Screen-Iteration"]]
 
-    return coal_dat_processed, join_cols
+def _get_label_map(coal_xw, columns):
+    """Get the crosswalk Label of each column that is in the crosswalk."""
+
+    # Get intersecting crosswalk column names
+    set_coal_xw = set(coal_xw["Meta Name Description"])
+    set_df_columns = set(columns)
+
+    intersect_columns = list(set_coal_xw.intersection(set_df_columns))
+
+    intersect_labels = list(
+        coal_xw.loc[
+            coal_xw["Meta Name Description"].isin(intersect_columns), "Label"
+        ].reset_index(drop=True)
+    )
+    intersect_columns = list(
+        coal_xw.loc[
+            coal_xw["Meta Name Description"].isin(intersect_columns),
+            "Meta Name Description",
+        ].reset_index(drop=True)
+    )
+
+    return dict(zip(intersect_columns, intersect_labels))
+
+
+def project_cover_page(coal_sheets, cover_page, coal_xw):
+    """Join the cover page onto every coalition screen for the export
+
+    Screen-1 is the cover page itself and only loses the key. The cover
+    page columns are renamed by the crosswalk, as the screens were.
+
+    :param coal_sheets: Processed coalition sheets with the <SUBMISSION_KEY>
+    :type coal_sheets: <Dict(<pd.DataFrame>)>
+    :param cover_page: Cover page from <standardize_submissions>
+    :type cover_page: <pd.DataFrame>
+    :param coal_xw: Crosswalk file
+    :type coal_xw: <pd.DataFrame>
+
+    :return: Coalition sheets with the cover page columns
+    :rtype: <Dict(<pd.DataFrame>)>
+    """
+
+    cover_page = cover_page.rename(columns=_get_label_map(coal_xw, cover_page.columns))
+
+    return dict(
+        (
+            screen,
+            df.drop(columns=SUBMISSION_KEY) if screen == "Screen-1" else expand_cover_page(df, cover_page),
+        )
+        for screen, df in coal_sheets.items()
+    )
+
+
+def _process_screen(screen, df, coal_xw, soa_sheetName, join_cols):
+    """Process one coalition screen
+
+    See <process_sheets>.
+
+    :return: Processed screen and the join columns available in it
+    :rtype: <pd.DataFrame>, <List>
+    """
+
+    # Join columns available in this screen
+    these_join_cols = [col for col in join_cols if col in df.columns]
+
+    # Rename columns based on crosswalk file
+    df = df.rename(columns=_get_label_map(coal_xw, df.columns))
+
+    # Process some of Section V.
+    if screen == soa_sheetName:
+        # Remove 'select' and 'none' from Involvement strings
+        involve_cols = [f for f in df.columns if "Involvement" in f]
+        for col in involve_cols:
+            df.loc[
+                (df.astype({col: str})[col].str.lower() == "none")
+                | (df.astype({col: str})[col].str.lower() == "select"),
+                col,
+            ] = np.nan
+
+        # Make training columns numeric
+        train_cols = [f for f in df.columns if "Trained" in f]
+        for col in train_cols:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    # Standardize the program and year, the missing submissions are flagged for all screens at once
+    df["Missing"] = False
+    df.loc[df["Program Abbr"] == "SDVC", "Program Abbr"] = "Core FVPSA"
+    df.loc[df["Program Abbr"] == "SDC6", "Program Abbr"] = "ARP Act"
+    df.loc[df["Program Abbr"] == "SDC3", "Program Abbr"] = "CARES Act"
+    df.Year = df.Year.astype(str)
+    df = df.drop_duplicates(subset=these_join_cols)
+
+    return df, these_join_cols
 
 
 def process_sheets(
     coal_dat_processed,
     coal_xw,
     screen_names,
-    cs_df,
+    expected,
     soa_sheetName,
     join_cols,
     coalition_names,
-    ppr_year="2024" 
+    ppr_year="2024",
+    executor="serial",
+    max_workers=None,
 ):
     """Process coalition sheets
     
     This function processes the data in each coalition sheet. It maps the raw 
     coalition column names to more readable header names, identifies missing submissions,
-    and adjusts for year-specific narrative questions.
+    and adjusts for year-specific narrative questions. The screens are
+    independent of each other and are processed concurrently.
 
     :param coal_dat_processed: Dictionary of coalition sheets to be processed
     :type coal_dat_processed: <Dict(<pd.DataFrame>)>
@@ -324,8 +682,9 @@ def process_sheets(
     :type coal_xw: <pd.DataFrame>
     :param screen_names: Names of the coalition sheets and their section headers
     :type screen_names: <Dict>
-    :param cs_df: List of expected coalition submissions for available years and programs
-    :type cs_df: <pd.DataFrame>
+    :param expected: Matrix of expected coalition submissions for available
+        years and programs, see <get_expected_submissions>
+    :type expected: <pd.DataFrame>
     :param soa_sheetName: Name of Summary of Activities sheet
     :type soa_sheetName: <Str>
     :param join_cols: Unique identifier columns to join sheets on
@@ -334,85 +693,44 @@ def process_sheets(
     :type coalition_names: <pd.DataFrame>
     :param ppr_year: The PPR year being processed (default is "2023")
     :type ppr_year: <Str>
+    :param executor: Pool to process the screens on, "serial", "thread" or
+        "process"
+    :type executor: <str>
+    :param max_workers: Maximum number of workers in the pool
+    :type max_workers: <int>
 
     :return: Processed coalition sheets and updated join columns
     :rtype: <Dict(<pd.DataFrame>), <List>
     """
 
+    results = map_screens(
+        _process_screen,
+        dict((screen, coal_dat_processed[screen]) for screen in screen_names.keys()),
+        shared={
+            "coal_xw": coal_xw,
+            "soa_sheetName": soa_sheetName,
+            "join_cols": join_cols,
+        },
+        executor=executor,
+        max_workers=max_workers,
+    )
+
+    # Evaluate missing submissions for each program and year
+    flagged = flag_missing_submissions(
+        dict((screen, results[screen][0]) for screen in screen_names.keys()),
+        expected,
+        dict((screen, results[screen][1]) for screen in screen_names.keys()),
+    )
 
+    # Update join columns dynamically based on availability, in screen order
     new_join_cols = join_cols
     for screen in screen_names.keys():
-        df = coal_dat_processed[screen]
-
-        # Update join columns dynamically based on availability
-        these_join_cols = [col for col in join_cols if col in df.columns]
-        new_join_cols = list(set(these_join_cols).intersection(set(new_join_cols)))
-
-        # Get intersecting crosswalk column names
-        set_coal_xw = set(coal_xw["Meta Name Description"])
-        set_df_columns = set(df.columns)
-
-        intersect_columns = list(set_coal_xw.intersection(set_df_columns))
-
-        intersect_labels = list(
-            coal_xw.loc[
-                coal_xw["Meta Name Description"].isin(intersect_columns), "Label"
-            ].reset_index(drop=True)
-        )
-        intersect_columns = list(
-            coal_xw.loc[
-                coal_xw["Meta Name Description"].isin(intersect_columns),
-                "Meta Name Description",
-            ].reset_index(drop=True)
-        )
-        rename_map = dict(zip(intersect_columns, intersect_labels))
-
-        # Rename columns based on crosswalk file
-        df = df.rename(columns=rename_map)
-
-        # Process some of Section V.
-        if screen == soa_sheetName:
-            # Remove 'select' and 'none' from Involvement strings
-            involve_cols = [f for f in df.columns if "Involvement" in f]
-            for col in involve_cols:
-                df.loc[
-                    (df.astype({col: str})[col].str.lower() == "none")
-                    | (df.astype({col: str})[col].str.lower() == "select"),
-                    col,
-                ] = np.nan
-
-            # Make training columns numeric
-            train_cols = [f for f in df.columns if "Trained" in f]
-            for col in train_cols:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-
-        # Evaluate missing submissions for each program and year
-        df["Missing"] = False
-        df.loc[df["Program Abbr"] == "SDVC", "Program Abbr"] = "Core FVPSA"
-        df.loc[df["Program Abbr"] == "SDC6", "Program Abbr"] = "ARP Act"
-        df.loc[df["Program Abbr"] == "SDC3", "Program Abbr"] = "CARES Act"
-        df.Year = df.Year.astype(str)
-        df = df.drop_duplicates(subset=these_join_cols)
-        df = (
-            pd.merge(
-                df,
-                cs_df,
-                how="right",
-                left_on=["State", "Year", "Program Abbr"],
-                right_on=["State", "Year", "Coal Program Abbr"],
-            )
-            .drop(columns=["Program Abbr"])
-            .rename(columns={"Coal Program Abbr": "Program Abbr"})
-            .drop_duplicates(subset=these_join_cols, ignore_index=True)
-        )
-        df.loc[df["Missing"] != False, "Missing"] = True
-
         # Add coalition name to missing coalitions
-        df = df.drop("CoalitionName", axis="columns", errors="ignore")
-        df = df.merge(coalition_names, how="left", on="State")
+        df = flagged[screen].drop("CoalitionName", axis="columns", errors="ignore")
+        coal_dat_processed[screen] = df.merge(coalition_names, how="left", on="State")
 
-        # Assign to processed data
-        coal_dat_processed[screen] = df
+        these_join_cols = results[screen][1]
+        new_join_cols = [c for c in new_join_cols if c in these_join_cols]
 
     new_join_cols = new_join_cols + ["Missing", "CoalitionName"]
 
@@ -0,0 +1,273 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import processing_functions as pf
+
+
+# Index columns of the long and wide format data
+LONG_ID_COLS = ["GranteeTypeTxt", "Fy", "ProgAcronym", "PostalCode", "EIN"]
+WIDE_INDEX_COLS = ["Grant Type", "Year", "Program Acronym", "State", "EIN"]
+LOOKUP_COLS = ["Clients", "In Use", "Demo", "TypeService", "Outcomes"]
+
+
+def get_connection(memory_limit=None, temp_directory=None):
+    """Open an in-process DuckDB database.
+
+    The database lives in memory and spills to <temp_directory> when the
+    data does not fit in <memory_limit>.
+
+    :param memory_limit: DuckDB memory limit, e.g. "4GB". Default is the
+        DuckDB default (80% of the system memory)
+    :type memory_limit: <str>
+    :param temp_directory: Directory to spill to. Default is a "ppr_duckdb"
+        directory in the system temp directory
+    :type temp_directory: <str>
+
+    :return: DuckDB connection
+    :rtype: <duckdb.DuckDBPyConnection>
+    """
+
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError(
+            'The "duckdb" transform engine requires the duckdb package (pip install duckdb)'
+        ) from e
+
+    config = {
+        "temp_directory": temp_directory
+        or os.path.join(tempfile.gettempdir(), "ppr_duckdb")
+    }
+    if memory_limit is not None:
+        config["memory_limit"] = memory_limit
+
+    return duckdb.connect(database=":memory:", config=config)
+
+
+def _quote(name):
+    """Quote an identifier for DuckDB."""
+
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def join_on_meta_name_desc_duckdb(
+    frames, meta_name_df, year=None, memory_limit=None, temp_directory=None
+):
+    """Melt and join grantee data to the lookup table in DuckDB.
+
+    This is the DuckDB version of melting each frame on the identifier
+    columns, concatenating them and calling <pf.join_on_meta_name_desc>.
+    The identifier columns of every row are joined to the value columns
+    (the unpivot) and hash joined against the lookup sheet in DuckDB. Only
+    the row and column position of each value goes through DuckDB, the
+    values are then taken from the frames by position, so they keep their
+    types and the same long format data frame is returned.
+
+    :param frames: Grantee data frames to melt (e.g. states and tribes)
+    :type frames: <List<pd.DataFrame>>
+    :param meta_name_df: Data frame of the lookup sheet that contains the
+        "Meta Name Description" column
+    :type meta_name_df: <pd.DataFrame>
+    :param year: PPR year, the 2024 question mapping is applied for 2024
+    :type year: <int>
+    :param memory_limit: DuckDB memory limit
+    :type memory_limit: <str>
+    :param temp_directory: Directory DuckDB spills to
+    :type temp_directory: <str>
+
+    :return: Data frame of merged data, with empty values removed, a new
+        Element column, and subset to only the relevant columns
+    :rtype: <pd.DataFrame>
+    """
+
+    con = get_connection(memory_limit, temp_directory)
+
+    variables = []
+    values = []
+    unpivots = []
+    id_select = ", ".join(_quote(c) for c in LONG_ID_COLS)
+    for part, frame in enumerate(frames):
+        value_positions = [
+            i for i, c in enumerate(frame.columns) if c not in LONG_ID_COLS
+        ]
+        for col_index, position in enumerate(value_positions):
+            variables.append(
+                {"part": part, "col": col_index, "variable": frame.columns[position]}
+            )
+
+        # Values of each column as object, as when the column is melted
+        values.append(
+            np.column_stack(
+                [frame.iloc[:, i].astype(object).to_numpy() for i in value_positions]
+            )
+            if value_positions
+            else np.empty((len(frame), 0), dtype=object)
+        )
+
+        ids = frame[LONG_ID_COLS].assign(__row=np.arange(len(frame)))
+        con.register(f"part{part}", ids)
+        unpivots.append(f"SELECT {part} AS part, __row, {id_select} FROM part{part}")
+
+    # Clean up the variable names once per column instead of once per row
+    variables = pd.DataFrame(variables, columns=["part", "col", "variable"])
+    if year == 2024:
+        variables["variable"] = variables["variable"].replace(pf.QUESTION_MAPPING_2024)
+    variables["variable"] = variables["variable"].map(lambda x: str(x).upper())
+    con.register("variables", variables)
+
+    lookup = meta_name_df[["Meta Name Description", "Element"] + LOOKUP_COLS].copy()
+    lookup["__lookup_row"] = np.arange(len(lookup))
+    con.register("lookup", lookup)
+
+    subawardee_totals = ", ".join(f"'{e}'" for e in pf.SUBAWARDEE_TOTAL_ELEMENTS)
+    lookup_select = ", ".join(f"k.{_quote(c)}" for c in LOOKUP_COLS)
+    long_data = con.execute(
+        f"""
+        WITH ids AS ({" UNION ALL ".join(unpivots)}),
+        joined AS (
+            SELECT
+                l.GranteeTypeTxt AS "Grant Type",
+                l.Fy AS "Year",
+                l.ProgAcronym AS "Program Acronym",
+                l.PostalCode AS "State",
+                l.EIN,
+                {lookup_select},
+                CASE
+                    WHEN v.variable IN ({subawardee_totals}) THEN v.variable
+                    ELSE k.Element
+                END AS Element,
+                l.part, v.col, l.__row, k.__lookup_row
+            FROM ids l
+            JOIN variables v ON l.part = v.part
+            LEFT JOIN lookup k ON v.variable = k."Meta Name Description"
+        )
+        SELECT * FROM joined
+        WHERE Element IS NOT NULL
+        ORDER BY part, col, __row, __lookup_row
+        """
+    ).df()
+    con.close()
+
+    # Take the values from the frames by position
+    value = np.empty(len(long_data), dtype=object)
+    parts = long_data["part"].to_numpy()
+    rows = long_data["__row"].to_numpy()
+    cols = long_data["col"].to_numpy()
+    for part, part_values in enumerate(values):
+        part_index = parts == part
+        value[part_index] = part_values[rows[part_index], cols[part_index]]
+    long_data["Value"] = value
+
+    # DuckDB types e.g. an all missing lookup column as an integer, keep the pandas dtypes
+    dtypes = dict(zip(WIDE_INDEX_COLS, pd.concat([f[LONG_ID_COLS] for f in frames]).dtypes))
+    dtypes.update(lookup[LOOKUP_COLS].dtypes)
+    long_data = long_data.astype(dtypes)
+
+    return long_data.drop(columns=["part", "col", "__row", "__lookup_row"])
+
+
+def pivot_wide_duckdb(
+    joined_long_data, field_names_conversion, memory_limit=None, temp_directory=None
+):
+    """Pivot long format data to wide format in DuckDB.
+
+    This is the DuckDB version of merging the long format data on the
+    crosswalk sheet and pivoting the values on the Label column. The row
+    position of each value is pivoted, and each label takes its values from
+    the typed value column of the kind of value it holds, see
+    <pf.get_label_kinds>, as <_pivot_wide> does.
+
+    :param joined_long_data: Long format data with the typed value columns,
+        see <pf.split_value_kinds>
+    :type joined_long_data: <pd.DataFrame>
+    :param field_names_conversion: Crosswalk sheet with the Element and Label
+        columns
+    :type field_names_conversion: <pd.DataFrame>
+    :param memory_limit: DuckDB memory limit
+    :type memory_limit: <str>
+    :param temp_directory: Directory DuckDB spills to
+    :type temp_directory: <str>
+
+    :return: Wide format data, one column per Label
+    :rtype: <pd.DataFrame>
+    """
+
+    con = get_connection(memory_limit, temp_directory)
+
+    # Pivot on a label id, DuckDB column names are case insensitive
+    labels = sorted(field_names_conversion["Label"].dropna().unique())
+    crosswalk = field_names_conversion[["Element", "Label"]].dropna(subset=["Label"])
+    crosswalk = crosswalk.assign(
+        label_id=crosswalk["Label"].map({label: i for i, label in enumerate(labels)})
+    )
+    con.register("crosswalk", crosswalk[["Element", "label_id"]])
+    long_data = joined_long_data[WIDE_INDEX_COLS + ["Element"]].assign(
+        __row=np.arange(len(joined_long_data))
+    )
+    con.register("long_data", long_data)
+
+    index_select = ", ".join(_quote(c) for c in WIDE_INDEX_COLS)
+    con.execute(
+        f"""
+        CREATE TEMP TABLE labelled AS
+        SELECT {index_select}, x.label_id, l.__row
+        FROM long_data l
+        JOIN crosswalk x ON l.Element = x.Element
+        """
+    )
+
+    duplicates = con.execute(
+        f"""
+        SELECT count(*) FROM (
+            SELECT {index_select}, label_id FROM labelled
+            GROUP BY ALL HAVING count(*) > 1
+        )
+        """
+    ).fetchone()[0]
+    if duplicates > 0:
+        con.close()
+        raise ValueError("Index contains duplicate entries, cannot reshape")
+
+    wide_data = con.execute(
+        f"""
+        PIVOT labelled ON label_id USING first(__row)
+        GROUP BY {index_select}
+        ORDER BY {index_select}
+        """
+    ).df()
+    con.close()
+
+    # Take each label from the typed value column of the kind of values it holds
+    label_kinds = pf.get_label_kinds(
+        joined_long_data.merge(crosswalk[["Element", "Label"]], on="Element")
+    )
+    values = joined_long_data[list(pf.VALUE_KIND_COLUMNS.values())].reset_index(drop=True)
+    combined = None
+
+    present_ids = sorted(
+        int(c) for c in wide_data.columns if c not in WIDE_INDEX_COLS
+    )
+    label_columns = {}
+    for label_id in present_ids:
+        label = labels[label_id]
+        kind = label_kinds.get(label)
+        if kind is not None:
+            label_values = values[pf.VALUE_KIND_COLUMNS[kind]]
+        else:
+            # Only one of the typed columns has a value in each cell
+            if combined is None:
+                combined = pf.combine_value_kinds(values)["Value"]
+            label_values = combined
+        rows = pd.to_numeric(wide_data[str(label_id)]).fillna(-1).astype("int64")
+        label_columns[label] = label_values.reindex(rows.to_numpy()).to_numpy()
+
+    wide_data = pd.concat(
+        [wide_data[WIDE_INDEX_COLS], pd.DataFrame(label_columns, index=wide_data.index)],
+        axis=1,
+    )
+    wide_data.columns.name = "Label"
+
+    return wide_data
@@ -0,0 +1,198 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import processing_functions as pf
+
+
+def make_synthetic_export(filepath, n_rows, n_screens=6, n_cols=60, seed=0):
+    """Write a workbook shaped like a raw OLDC export.
+
+    Every sheet has the OLDC identifier columns (receipt id, year, state,
+    submit date, zip codes) followed by a mix of number, text and empty
+    columns. The zip codes are written as numbers in some rows and as text
+    with leading zeros in others, as they are in the real exports.
+
+    :param filepath: File path of the workbook to write
+    :type filepath: <str>
+    :param n_rows: Number of rows per sheet
+    :type n_rows: <int>
+    :param n_screens: Number of "Screen-<n>" sheets
+    :type n_screens: <int>
+    :param n_cols: Number of columns per sheet
+    :type n_cols: <int>
+    :param seed: Seed of the random values
+    :type seed: <int>
+    """
+
+    rng = np.random.default_rng(seed)
+    states = ["PA", "MS", "LA", "NM", "AZ", "FL", "GA", "TX", "MA", "CT"]
+    sheets = {"Search Criteria": pd.DataFrame({"Criteria": ["Fy >= 2018"]})}
+    for screen in range(1, n_screens + 1):
+        zips = rng.integers(1000, 99999, n_rows)
+        df = pd.DataFrame(
+            {
+                "Rpt-Receipt-Id": np.arange(n_rows) + 1000,
+                "Screen-Name": f"Screen-{screen}",
+                "Fy": rng.integers(2018, 2024, n_rows),
+                "PostalCode": rng.choice(states, n_rows),
+                "SubmitDate": [
+                    datetime(2022, 1, 1) + timedelta(days=int(d))
+                    for d in rng.integers(0, 365, n_rows)
+                ],
+                "Grantee Zip5": [
+                    f"{z:05d}" if i % 2 else int(z) for i, z in enumerate(zips)
+                ],
+                "Grantee Zip4": [
+                    None if i % 5 == 0 else f"{z % 10000:04d}" for i, z in enumerate(zips)
+                ],
+            }
+        )
+        for col in range(n_cols - df.shape[1]):
+            if col % 3 == 0:
+                df[f"Number {col}"] = rng.integers(0, 500, n_rows)
+            elif col % 3 == 1:
+                df[f"Text {col}"] = rng.choice(["Yes", "No", "Unknown", None], n_rows)
+            else:
+                df[f"Empty {col}"] = None
+        sheets[f"Screen-{screen}"] = df
+
+    with pd.ExcelWriter(filepath) as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+def time_read(filepath, engine, repeat=3):
+    """Read every sheet of a workbook the way <pf.read_data> does and time it.
+
+    :param filepath: File path of the workbook
+    :type filepath: <str>
+    :param engine: One of <pf.EXCEL_ENGINES>
+    :type engine: <str>
+    :param repeat: Number of timed reads
+    :type repeat: <int>
+
+    :return: Best read time in seconds and the sheets of the last read
+    :rtype: <float>, <Dict<pd.DataFrame>>
+    """
+
+    times = []
+    for _ in range(repeat):
+        t1 = time.perf_counter()
+        sheets = pf.read_excel(
+            filepath,
+            sheet_name=None,
+            engine=engine,
+            parse_dates=True,
+            dtype=dict((c, "str") for c in pf.ZIP_COLUMNS),
+        )
+        times.append(time.perf_counter() - t1)
+
+    return min(times), sheets
+
+
+def get_mismatched_sheets(left, right):
+    """Get the sheets whose values or dtypes differ between two reads."""
+
+    mismatches = []
+    for sheet_name in sorted(set(left) | set(right)):
+        if sheet_name not in left or sheet_name not in right:
+            mismatches.append(sheet_name)
+            continue
+        try:
+            pd.testing.assert_frame_equal(left[sheet_name], right[sheet_name])
+        except AssertionError:
+            mismatches.append(sheet_name)
+
+    return mismatches
+
+
+def compare_excel_engines(filepaths, repeat=3):
+    """Time every Excel engine on each workbook and check they read the same data.
+
+    :param filepaths: File paths of the workbooks
+    :type filepaths: <List<str>>
+    :param repeat: Number of timed reads per engine
+    :type repeat: <int>
+
+    :return: Best time per engine and the mismatched sheets, by file path
+    :rtype: <Dict<Dict>>
+    """
+
+    results = {}
+    for filepath in filepaths:
+        timings = {}
+        sheets = {}
+        for engine in pf.EXCEL_ENGINES:
+            timings[engine], sheets[engine] = time_read(filepath, engine, repeat)
+
+        baseline = pf.EXCEL_ENGINES[0]
+        mismatches = dict(
+            (engine, get_mismatched_sheets(sheets[baseline], sheets[engine]))
+            for engine in pf.EXCEL_ENGINES[1:]
+        )
+        results[filepath] = {"timings": timings, "mismatches": mismatches}
+
+        n_cells = sum(df.size for df in sheets[baseline].values())
+        print(f"{os.path.basename(filepath)} ({len(sheets[baseline])} sheets, {n_cells:,} cells), best of {repeat}:")
+        for engine, best in timings.items():
+            print(f"  {engine:<10}{best:>10.3f}s{timings[baseline] / best:>8.1f}x")
+        for engine, sheet_names in mismatches.items():
+            if sheet_names:
+                print(f"  {engine} sheets that don't match {baseline}: " + ", ".join(sheet_names))
+            else:
+                print(f"  {engine} matches {baseline} on every sheet")
+
+    return results
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Compare the Excel reader engines on real and synthetic OLDC exports",
+    )
+
+    parser.add_argument(
+        "filepaths",
+        nargs="*",
+        help="File paths of workbooks to read, e.g. raw OLDC exports, crosswalks and processed data.",
+    )
+
+    parser.add_argument(
+        "--synthetic_rows",
+        type=int,
+        nargs="*",
+        default=[],
+        help="Also read synthetic exports with this many rows per sheet, one workbook per value.",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of timed reads per engine. Default is 3",
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix="ppr_excel_")
+    try:
+        filepaths = list(args.filepaths)
+        for n_rows in args.synthetic_rows:
+            filepath = os.path.join(scratch_dir, f"synthetic_{n_rows}_rows.xlsx")
+            print(f"Writing synthetic export with {n_rows} rows per sheet...")
+            make_synthetic_export(filepath, n_rows)
+            filepaths.append(filepath)
+
+        compare_excel_engines(filepaths, repeat=args.repeat)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
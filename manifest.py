@@ -0,0 +1,260 @@
+import glob
+import os
+import re
+import shutil
+import time
+import tomllib
+import traceback
+from datetime import datetime
+
+import pandas as pd
+
+import processing_functions as pf
+import watch_folder as wf
+
+
+# Options every job of a manifest shares, with the defaults of process_PPR_data.py
+DEFAULT_OPTIONS = {
+    "coalitions_names_filename": None,
+    "executor": "thread",
+    "max_workers": None,
+    "transform_engine": "pandas",
+    "duckdb_memory_limit": None,
+    "subawardee_join": "rows",
+    "transform_shards": 1,
+    "excel_engine": "openpyxl",
+    "raw_columns": "all",
+    "workbook_writer": "openpyxl",
+    "coalitions_backend": "pandas",
+    "catalog_filename": None,
+    "prescan": False,
+    "memory_budget": None,
+}
+
+# Options and job settings that are file paths, they're resolved against the manifest folder
+PATH_OPTIONS = ["coalitions_names_filename", "catalog_filename"]
+PATH_SETTINGS = ["raw_data_filename", "processed_data_filename", "crosswalk_filename", "new_export"]
+
+# Environment variable in a manifest path, $NAME or ${NAME}
+ENV_VARIABLE = re.compile(r"\$(\w+)|\$\{(\w+)\}")
+
+# Settings every job must have
+REQUIRED_SETTINGS = ["raw_data_filename", "processed_data_filename", "crosswalk_filename"]
+
+
+def _read_manifest_file(manifest_filename):
+    """Parse a TOML or YAML manifest file into a dictionary."""
+
+    if manifest_filename.lower().endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError as e:
+            raise ImportError(
+                "YAML manifests require the PyYAML package (pip install pyyaml), or use a TOML manifest"
+            ) from e
+        with open(manifest_filename) as f:
+            return yaml.safe_load(f) or {}
+
+    with open(manifest_filename, "rb") as f:
+        return tomllib.load(f)
+
+
+def resolve_path(path, base_dir):
+    """Resolve a manifest file path.
+
+    Environment variables and ~ are expanded and relative paths are taken
+    from the manifest folder. A path with wildcards resolves to the newest
+    matching file, or stays as it is if nothing matches. Variables that
+    aren't set expand to nothing, and a path that expands to nothing is no
+    path.
+
+    :param path: File path from the manifest
+    :type path: <str>
+    :param base_dir: Folder of the manifest
+    :type base_dir: <str>
+
+    :return: Resolved file path, or None
+    :rtype: <str>
+    """
+
+    path = ENV_VARIABLE.sub(lambda m: os.environ.get(m.group(1) or m.group(2), ""), path)
+    path = os.path.expanduser(path).strip()
+    if not path:
+        return None
+
+    path = os.path.join(base_dir, path)
+    if glob.has_magic(path):
+        matches = glob.glob(path)
+        if matches:
+            return max(matches, key=os.path.getmtime)
+
+    return path
+
+
+def load_manifest(manifest_filename):
+    """Read and check a job manifest.
+
+    A manifest is a TOML (or YAML) file with an optional "options" table,
+    the options every job shares (see <DEFAULT_OPTIONS>), and a "jobs" table
+    with a table per raw export, keyed by kind of <wf.EXPORT_KINDS>, e.g.:
+
+        [options]
+        coalitions_names_filename = "coalition_names.csv"
+
+        [jobs.states_2023]
+        raw_data_filename = "States and Tribes/fvps_sf-ppr_state_ver__6_*.xlsx"
+        processed_data_filename = "Processed/HistoricalPPR_*.xlsx"
+        crosswalk_filename = "Data_Element_Crosswalk.xlsx"
+        new_export = "$PPR"
+
+    The optional "new_export" is a freshly downloaded export to copy in
+    before the job runs, see <import_new_export>. The jobs run in the order
+    of the manifest.
+
+    :param manifest_filename: File path of the manifest
+    :type manifest_filename: <str>
+
+    :return: The options and the jobs
+    :rtype: <Dict>, <Dict<Dict>>
+    """
+
+    manifest = _read_manifest_file(manifest_filename)
+    base_dir = os.path.dirname(os.path.abspath(manifest_filename))
+
+    unknown = set(manifest.keys()) - {"options", "jobs"}
+    if unknown:
+        raise ValueError(f"Unknown manifest tables {sorted(unknown)}, expected 'options' and 'jobs'")
+
+    options = dict(DEFAULT_OPTIONS)
+    unknown = set(manifest.get("options", {}).keys()) - set(DEFAULT_OPTIONS.keys())
+    if unknown:
+        raise ValueError(f"Unknown manifest options {sorted(unknown)}, expected some of {list(DEFAULT_OPTIONS)}")
+    options.update(manifest.get("options", {}))
+    for option in PATH_OPTIONS:
+        if options[option] is not None:
+            options[option] = resolve_path(options[option], base_dir)
+
+    jobs = {}
+    for kind, job in manifest.get("jobs", {}).items():
+        if kind not in wf.EXPORT_KINDS:
+            raise ValueError(f"Unknown job '{kind}', expected one of {list(wf.EXPORT_KINDS)}")
+        missing = [s for s in REQUIRED_SETTINGS if not str(job.get(s) or "").strip()]
+        if missing:
+            raise ValueError(f"Job '{kind}' is missing {missing}")
+        unknown = set(job.keys()) - set(PATH_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings {sorted(unknown)} in job '{kind}', expected some of {PATH_SETTINGS}")
+        job = dict((k, resolve_path(v, base_dir)) for k, v in job.items())
+        jobs[kind] = dict((k, v) for k, v in job.items() if v is not None)
+
+    if not jobs:
+        raise ValueError(f"No jobs in {manifest_filename}")
+    if options["coalitions_names_filename"] is None and any(
+        wf.EXPORT_KINDS[kind]["branch"] == "coalitions" for kind in jobs
+    ):
+        raise ValueError("The coalitions jobs need the coalitions_names_filename option")
+
+    return options, jobs
+
+
+def import_new_export(new_export, kind, raw_data_filename, now, catalog_filename=None):
+    """Copy a downloaded export into the raw data folder of its kind.
+
+    The current export is moved to the Archive folder (see
+    <wf.archive_previous_exports>) and the download is copied in as
+    "<export_name>_<now>.xlsx", the name the pull date is read from.
+
+    :param new_export: File path of the downloaded export
+    :type new_export: <str>
+    :param kind: Key of <wf.EXPORT_KINDS>
+    :type kind: <str>
+    :param raw_data_filename: File path of the current export, the download
+        is copied into its folder
+    :type raw_data_filename: <str>
+    :param now: Pull date, in <%m%d%Y> format
+    :type now: <str>
+    :param catalog_filename: File path of the SQLite catalog the archived
+        export is moved in. Default is no catalog
+    :type catalog_filename: <str>
+
+    :return: File path of the copied export
+    :rtype: <str>
+    """
+
+    path = os.path.join(
+        os.path.dirname(raw_data_filename), f"{wf.EXPORT_KINDS[kind]['export_name']}_{now}.xlsx"
+    )
+    wf.archive_previous_exports(path, kind, now, catalog_filename=catalog_filename)
+    print(f"Copying {new_export} to {path}...")
+    shutil.copy(new_export, path)
+
+    return path
+
+
+def run_manifest(manifest_filename):
+    """Run every job of a manifest in one process.
+
+    The crosswalks, coalition names and historical data are parsed once
+    into the sheet cache and shared by the jobs, so the interpreter start,
+    imports and parsing aren't paid once per job. A failed job is reported
+    and the others carry on. Each job's time is reported at the end.
+
+    :param manifest_filename: File path of the manifest, see
+        <load_manifest>
+    :type manifest_filename: <str>
+
+    :return: Summary of every job: kind, raw data file path, status,
+        processed data file path, seconds and error
+    :rtype: <pd.DataFrame>
+    """
+
+    options, jobs = load_manifest(manifest_filename)
+    now = datetime.today().strftime("%m%d%Y")
+
+    for kind, job in jobs.items():
+        if "new_export" in job:
+            job["raw_data_filename"] = import_new_export(
+                job.pop("new_export"), kind, job["raw_data_filename"], now, options["catalog_filename"]
+            )
+
+    # Every export is checked before any job runs, not before each job
+    if options["prescan"]:
+        wf.prescan_jobs(jobs, excel_engine=options["excel_engine"])
+    options = dict(options, prescan=False)
+
+    t1 = time.time()
+    pf.enable_sheet_cache()
+    print("Loading crosswalks, coalition names and historical data...")
+    wf.warm_crosswalks(jobs, engine=options["excel_engine"])
+    if options["coalitions_names_filename"] is not None:
+        pf.read_csv_file(options["coalitions_names_filename"])
+    for kind, job in jobs.items():
+        if wf.EXPORT_KINDS[kind]["branch"] == "states" and os.path.exists(job["processed_data_filename"]):
+            wf.warm_history(job["processed_data_filename"], engine=options["excel_engine"])
+    print(f"Loading crosswalks, coalition names and historical data - COMPLETE ({time.time() - t1:.1f}s)")
+
+    summaries = []
+    for kind, job in jobs.items():
+        print(f"Running {kind} job on {job['raw_data_filename']}...")
+        summary = {"kind": kind, "raw": job["raw_data_filename"], "status": "ok", "output": None, "error": None}
+        t1 = time.time()
+        try:
+            summary["output"] = wf.run_export(
+                job["raw_data_filename"],
+                kind,
+                job,
+                options,
+                datetime.today().strftime("%m%d%Y_%H%M%S"),
+            )
+        except Exception:
+            summary["status"] = "failed"
+            summary["error"] = traceback.format_exc()
+            traceback.print_exc()
+        summary["seconds"] = round(time.time() - t1, 1)
+        summaries.append(summary)
+
+    summary = pd.DataFrame(summaries, columns=["kind", "raw", "status", "output", "seconds", "error"])
+    print(f"Ran {len(summary)} jobs from {manifest_filename}:")
+    print(summary[["kind", "status", "seconds", "output"]].to_string(index=False))
+
+    return summary
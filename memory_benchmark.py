@@ -0,0 +1,162 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+def get_peak_rss_mb():
+    """Get the peak resident memory of this process and its children in MB.
+
+    :return: Peak resident set size in MB
+    :rtype: <float>
+    """
+
+    try:
+        import resource
+    except ImportError:
+        # Windows, psutil reports the peak working set instead
+        import psutil
+
+        return psutil.Process().memory_info().peak_wset / 2**20
+
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _run_formula(kwargs, queue):
+    """Run the States & Tribes branch in a fresh process and report its peak memory."""
+
+    import process_PPR_data
+
+    t1 = time.time()
+    process_PPR_data.main(**kwargs)
+    queue.put((get_peak_rss_mb(), time.time() - t1))
+
+
+def measure_formula_run(
+    formula_OLDC_data_filename,
+    processed_data_filename,
+    crosswalk_filename,
+    copy_on_write=True,
+    executor="thread",
+):
+    """Measure the peak memory of a full formula run.
+
+    The raw data, processed data and crosswalk are copied to a scratch
+    directory first, so the run doesn't archive or replace the real files.
+    The run happens in a fresh process so earlier runs don't count towards
+    its peak.
+
+    :param formula_OLDC_data_filename: File path of raw formula OLDC data
+    :type formula_OLDC_data_filename: <str>
+    :param processed_data_filename: File path of previously processed data
+    :type processed_data_filename: <str>
+    :param crosswalk_filename: File path of the crosswalk
+    :type crosswalk_filename: <str>
+    :param copy_on_write: Whether to run under pandas Copy-on-Write
+    :type copy_on_write: <bool>
+    :param executor: Pool to run independent stages on
+    :type executor: <str>
+
+    :return: Peak resident set size in MB and run time in seconds
+    :rtype: <float>, <float>
+    """
+
+    scratch_dir = tempfile.mkdtemp(prefix="ppr_memory_")
+    try:
+        os.mkdir(os.path.join(scratch_dir, "processed"))
+        raw_copy = shutil.copy(formula_OLDC_data_filename, scratch_dir)
+        crosswalk_copy = shutil.copy(crosswalk_filename, scratch_dir)
+        processed_copy = shutil.copy(
+            processed_data_filename, os.path.join(scratch_dir, "processed")
+        )
+
+        kwargs = {
+            "process_formula": True,
+            "formula_OLDC_data_filename": raw_copy,
+            "processed_data_filename": processed_copy,
+            "process_coalitions": False,
+            "coalitions_OLDC_filename": None,
+            "processed_coalitions_data_filename": None,
+            "coalitions_names_filename": None,
+            "crosswalk_filename": crosswalk_copy,
+            "process_new_coalitions": False,
+            "new_coalitions_OLDC_filename": None,
+            "processed_new_coalitions_data_filename": None,
+            "process_new_states": False,
+            "new_states_OLDC_filename": None,
+            "processed_new_states_data_filename": None,
+            "crosswalk_filename_2024": None,
+            "executor": executor,
+            "copy_on_write": copy_on_write,
+        }
+
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        process = context.Process(target=_run_formula, args=(kwargs, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f"Formula run failed with exit code {process.exitcode}")
+
+        return queue.get()
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Compare the peak memory of a full formula run with and without pandas Copy-on-Write",
+    )
+
+    parser.add_argument(
+        "--formula_OLDC_data_filename",
+        "-o",
+        required=True,
+        help="File path of raw formula OLDC data.",
+    )
+
+    parser.add_argument(
+        "--processed_data_filename",
+        "-p",
+        required=True,
+        help="File path of previously processed data. It is copied, not replaced.",
+    )
+
+    parser.add_argument(
+        "--crosswalk_filename",
+        "-l",
+        required=True,
+        help="File path of lookup table for reference in processing.",
+    )
+
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process", "serial"],
+        default="thread",
+        help='Pool to run independent stages on. Default is "thread"',
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+
+    results = {}
+    for copy_on_write in [False, True]:
+        results[copy_on_write] = measure_formula_run(copy_on_write=copy_on_write, **vars(args))
+
+    print("Full formula run, peak resident memory:")
+    for copy_on_write, (peak_mb, run_time) in results.items():
+        label = "Copy-on-Write" if copy_on_write else "no Copy-on-Write"
+        print(f"  {label:<18}{peak_mb:>10.1f} MB{run_time:>10.1f}s")
+    drop = 1 - results[True][0] / results[False][0]
+    print(f"Peak memory drop with Copy-on-Write: {drop:.1%}")
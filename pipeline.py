@@ -0,0 +1,752 @@
+import importlib.util
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+import numpy as np
+import pandas as pd
+
+# Null values of text and date columns, Parquet reads every null back as None
+NULL_VALUES = {"None": None, "nan": np.nan, "NaT": pd.NaT}
+
+# Seconds between resident memory samples while a stage runs
+RSS_SAMPLE_SECONDS = 0.05
+
+
+def stage(name, func, inputs, outputs):
+    """Declare a pipeline stage.
+
+    A stage is a function that is called with its named inputs as keyword
+    arguments and returns its named outputs. A stage with one output
+    returns the value itself, a stage with several outputs returns a tuple
+    in the same order as <outputs>.
+
+    :param name: Unique name of the stage, used in the run report
+    :type name: <str>
+    :param func: Module level function to run (must be picklable to run on
+        a process pool)
+    :type func: <Callable>
+    :param inputs: Names of the artifacts the stage reads
+    :type inputs: <List<str>>
+    :param outputs: Names of the artifacts the stage produces
+    :type outputs: <List<str>>
+
+    :return: Stage definition
+    :rtype: <Dict>
+    """
+
+    return {
+        "name": name,
+        "func": func,
+        "inputs": list(inputs),
+        "outputs": list(outputs),
+    }
+
+
+def get_stage_dependencies(stages, available):
+    """Resolve the stage graph.
+
+    This function maps each stage to the stages that produce its inputs and
+    checks that every input is either produced by exactly one stage or is
+    already available in the run context.
+
+    :param stages: Stage definitions
+    :type stages: <List<Dict>>
+    :param available: Names of the artifacts provided to the run
+    :type available: <Iterable<str>>
+
+    :return: Dictionary of stage name to the set of stage names it depends on
+    :rtype: <Dict<str>: <Set<str>>>
+    """
+
+    producers = {}
+    for s in stages:
+        for output in s["outputs"]:
+            if output in producers or output in available:
+                raise ValueError(f"Artifact '{output}' is produced more than once")
+            producers[output] = s["name"]
+
+    dependencies = {}
+    for s in stages:
+        missing = [
+            i for i in s["inputs"] if i not in producers and i not in available
+        ]
+        if len(missing) > 0:
+            raise ValueError(f"Stage '{s['name']}' has unresolved inputs: {missing}")
+        dependencies[s["name"]] = {producers[i] for i in s["inputs"] if i in producers}
+
+    # Check for cycles by repeatedly removing stages without dependencies
+    remaining = {k: set(v) for k, v in dependencies.items()}
+    while remaining:
+        ready = [k for k, v in remaining.items() if len(v) == 0]
+        if len(ready) == 0:
+            raise ValueError(f"Stage graph has a cycle between: {sorted(remaining)}")
+        for k in ready:
+            del remaining[k]
+        for v in remaining.values():
+            v.difference_update(ready)
+
+    return dependencies
+
+
+def _get_null_value(column):
+    """Get the one null value used in a column, or "mixed" if there are several."""
+
+    nulls = {repr(v) for v in column[column.isna()].unique()}
+    if len(nulls) == 0:
+        return None
+    if len(nulls) > 1 or next(iter(nulls)) not in NULL_VALUES:
+        return "mixed"
+
+    return next(iter(nulls))
+
+
+def _is_parquet_safe(column):
+    """Check that a column reads back from Parquet with the same values and dtype.
+
+    Numeric, boolean and datetime columns round trip as is. Object columns
+    only if they hold text or dates and a single kind of null, object
+    columns with mixed values (e.g. the long format "value" column) are
+    pickled instead.
+    """
+
+    if column.dtype.kind in "biufM":
+        return True
+    if column.dtype != object:
+        return False
+
+    return (
+        pd.api.types.infer_dtype(column, skipna=True) in ["string", "date", "empty"]
+        and _get_null_value(column) != "mixed"
+    )
+
+
+def check_parquet_engine():
+    """Check that a Parquet engine is installed.
+
+    Checkpoints and spilled artifacts save their data frames to Parquet
+    (see <save_frame>), which pandas does through pyarrow or fastparquet.
+    Neither is a dependency of the plain runs, so this is checked before
+    a checkpointed or memory budgeted run starts rather than at its first
+    finished stage.
+
+    :raises ImportError: If neither pyarrow nor fastparquet is installed
+    """
+
+    if not any(importlib.util.find_spec(m) is not None for m in ["pyarrow", "fastparquet"]):
+        raise ImportError(
+            "Stage checkpoints and the memory budget save data frames to Parquet and require the "
+            "pyarrow package (pip install pyarrow)"
+        )
+
+
+def save_frame(df, path):
+    """Save a data frame checkpoint.
+
+    Columns that round trip through Parquet are saved to <path>.parquet and
+    the remaining columns are pickled to <path>.pkl, along with the column
+    order and the null value of each Parquet column.
+
+    :param df: Data frame to save
+    :type df: <pd.DataFrame>
+    :param path: File path without extension
+    :type path: <str>
+    """
+
+    parquet_cols = []
+    if (
+        df.columns.is_unique
+        and all(isinstance(c, str) for c in df.columns)
+        and df.index.nlevels == 1
+        and df.index.dtype.kind in "iu"
+    ):
+        parquet_cols = [c for c in df.columns if _is_parquet_safe(df[c])]
+
+    if len(parquet_cols) > 0:
+        df[parquet_cols].to_parquet(f"{path}.parquet")
+
+    with open(f"{path}.pkl", "wb") as f:
+        pickle.dump(
+            {
+                "columns": df.columns,
+                "null_values": dict(
+                    (c, _get_null_value(df[c]) if df[c].dtype == object else None)
+                    for c in parquet_cols
+                ),
+                "frame": df.drop(columns=parquet_cols) if parquet_cols else df,
+            },
+            f,
+        )
+
+
+def load_frame(path):
+    """Load a data frame checkpoint saved with <save_frame>.
+
+    :param path: File path without extension
+    :type path: <str>
+
+    :return: Data frame
+    :rtype: <pd.DataFrame>
+    """
+
+    with open(f"{path}.pkl", "rb") as f:
+        saved = pickle.load(f)
+    if len(saved["null_values"]) == 0:
+        return saved["frame"]
+
+    df = pd.read_parquet(f"{path}.parquet")
+    for c, null_value in saved["null_values"].items():
+        if null_value is not None and null_value != "None":
+            df[c] = df[c].where(df[c].notna(), NULL_VALUES[null_value])
+
+    return pd.concat([df, saved["frame"]], axis=1)[saved["columns"]]
+
+
+def _is_frames(value):
+    """Check if an artifact is a dictionary of data frames, e.g. workbook sheets."""
+
+    return (
+        isinstance(value, dict)
+        and len(value) > 0
+        and all(isinstance(v, pd.DataFrame) for v in value.values())
+    )
+
+
+def get_rss_mb():
+    """Get the current resident memory of this process in MB.
+
+    :return: Resident set size in MB
+    :rtype: <float>
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        # No /proc outside Linux
+        import psutil
+
+        return psutil.Process().memory_info().rss / 2**20
+
+
+def get_artifact_mb(value):
+    """Get the memory of a data frame, or dictionary of data frames, in MB.
+
+    Other artifacts are small (file names, settings) and count as 0.
+
+    :param value: Artifact
+    :type value: <Any>
+
+    :return: Memory of the artifact in MB
+    :rtype: <float>
+    """
+
+    if isinstance(value, pd.DataFrame):
+        return value.memory_usage(deep=True).sum() / 2**20
+    if _is_frames(value):
+        return sum(get_artifact_mb(v) for v in value.values())
+
+    return 0
+
+
+def spill_artifact(spill_dir, name, value):
+    """Save a data frame artifact to disk to free its memory.
+
+    The frames are saved with <save_frame>, so the columns go to Parquet
+    through Arrow.
+
+    :param spill_dir: Directory to save the artifact to
+    :type spill_dir: <str>
+    :param name: Name of the artifact
+    :type name: <str>
+    :param value: Data frame, or dictionary of data frames
+    :type value: <pd.DataFrame> or <Dict<pd.DataFrame>>
+
+    :return: How to load the artifact back with <load_spilled_artifact>
+    :rtype: <Tuple>
+    """
+
+    path = os.path.join(spill_dir, name)
+    if isinstance(value, pd.DataFrame):
+        save_frame(value, path)
+        return ("frame", path)
+
+    keys = list(value.keys())
+    for j, k in enumerate(keys):
+        save_frame(value[k], f"{path}_{j}")
+    return ("frames", path, keys)
+
+
+def load_spilled_artifact(spilled):
+    """Load an artifact saved with <spill_artifact>, or from a checkpoint."""
+
+    if spilled[0] == "checkpoint":
+        _, checkpoint_dir, s, name = spilled
+        return load_checkpoint(checkpoint_dir, s, [name])[name]
+    if spilled[0] == "frame":
+        return load_frame(spilled[1])
+
+    _, path, keys = spilled
+    return dict((k, load_frame(f"{path}_{j}")) for j, k in enumerate(keys))
+
+
+def _sample_peak_rss(stop, peak):
+    """Record the peak resident memory in <peak> until <stop> is set (runs on a thread)."""
+
+    while not stop.wait(RSS_SAMPLE_SECONDS):
+        peak[0] = max(peak[0], get_rss_mb())
+
+
+def save_checkpoint(checkpoint_dir, s, result):
+    """Save the outputs of a finished stage.
+
+    Data frames, and dictionaries of data frames (e.g. workbook sheets), are
+    saved with <save_frame>, any other output is pickled. The outputs are
+    written to a temporary directory that is renamed once complete, so a
+    stage only counts as checkpointed if all of its outputs were saved.
+
+    :param checkpoint_dir: Checkpoint directory of the run
+    :type checkpoint_dir: <str>
+    :param s: Stage definition
+    :type s: <Dict>
+    :param result: Stage outputs, in the same order as the stage outputs
+    :type result: <Tuple>
+    """
+
+    stage_dir = os.path.join(checkpoint_dir, s["name"])
+    tmp_dir = f"{stage_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    manifest = {}
+    for i, (output, value) in enumerate(zip(s["outputs"], result)):
+        if isinstance(value, pd.DataFrame):
+            save_frame(value, os.path.join(tmp_dir, str(i)))
+            manifest[output] = ("frame", None)
+        elif _is_frames(value):
+            keys = list(value.keys())
+            for j, k in enumerate(keys):
+                save_frame(value[k], os.path.join(tmp_dir, f"{i}_{j}"))
+            manifest[output] = ("frames", keys)
+        else:
+            manifest[output] = ("object", value)
+
+    with open(os.path.join(tmp_dir, "manifest.pkl"), "wb") as f:
+        pickle.dump(manifest, f)
+    os.replace(tmp_dir, stage_dir)
+
+
+def load_checkpoint(checkpoint_dir, s, outputs):
+    """Load outputs of a checkpointed stage.
+
+    :param checkpoint_dir: Checkpoint directory of the run
+    :type checkpoint_dir: <str>
+    :param s: Stage definition
+    :type s: <Dict>
+    :param outputs: Names of the outputs to load
+    :type outputs: <List<str>>
+
+    :return: Dictionary of output name to value
+    :rtype: <Dict>
+    """
+
+    stage_dir = os.path.join(checkpoint_dir, s["name"])
+    with open(os.path.join(stage_dir, "manifest.pkl"), "rb") as f:
+        manifest = pickle.load(f)
+
+    loaded = {}
+    for i, output in enumerate(s["outputs"]):
+        if output not in outputs:
+            continue
+        kind, value = manifest[output]
+        if kind == "frame":
+            value = load_frame(os.path.join(stage_dir, str(i)))
+        elif kind == "frames":
+            value = dict(
+                (k, load_frame(os.path.join(stage_dir, f"{i}_{j}")))
+                for j, k in enumerate(value)
+            )
+        loaded[output] = value
+
+    return loaded
+
+
+def _fingerprints_match(saved, current):
+    """Check if a fingerprint value of a resumed run matches the failed run.
+
+    A file, a {"path", "sha1"} dictionary, that was removed since only has
+    to match on its path, e.g. the previous processed data is removed once
+    the new workbook is saved.
+    """
+
+    if isinstance(saved, dict) and isinstance(current, dict):
+        if set(saved) == {"path", "sha1"} == set(current) and current["sha1"] is None:
+            return saved["path"] == current["path"]
+        return set(saved) == set(current) and all(
+            _fingerprints_match(saved[k], current[k]) for k in saved
+        )
+
+    return saved == current
+
+
+def check_fingerprint(run_dir, fingerprint):
+    """Save the fingerprint of a run, or check a resumed run against it.
+
+    The fingerprint holds the inputs and options that decide the stage
+    outputs, with the file names and the SHA-1 hash of their contents. The
+    first run saves it to <run_dir>, a resumed run must have the same
+    fingerprint, so checkpoints aren't mixed with outputs of other inputs.
+
+    :param run_dir: Checkpoint directory of the run
+    :type run_dir: <str>
+    :param fingerprint: Picklable inputs and options of the run, by name.
+        Files are {"path", "sha1"} dictionaries, with a None hash for a file
+        that doesn't exist
+    :type fingerprint: <Dict>
+
+    :raises ValueError: If the fingerprint differs from the saved one, with
+        the names of the inputs that differ
+    """
+
+    fingerprint_filename = os.path.join(run_dir, "fingerprint.pkl")
+    if not os.path.exists(fingerprint_filename):
+        os.makedirs(run_dir, exist_ok=True)
+        with open(fingerprint_filename, "wb") as f:
+            pickle.dump(fingerprint, f)
+        return
+
+    with open(fingerprint_filename, "rb") as f:
+        saved = pickle.load(f)
+
+    changed = [
+        name
+        for name in sorted(set(saved) | set(fingerprint))
+        if not _fingerprints_match(saved.get(name), fingerprint.get(name))
+    ]
+    if changed:
+        raise ValueError(
+            f"Can't resume from {run_dir}, the inputs or options changed since the failed run: "
+            + ", ".join(changed)
+            + ". Pass the same branches, files and options, or rerun without --resume"
+        )
+
+
+def _run_stage(func, kwargs, checkpoint=None):
+    """Run a stage function, time it and sample its peak memory (runs inside the worker).
+
+    Checkpoints are saved in the worker too, so stages finishing at the same
+    time save their outputs concurrently. The peak is of the whole worker
+    process, so on the thread pool it includes the stages running alongside.
+    """
+
+    start = time.time()
+    peak = [get_rss_mb()]
+    stop = threading.Event()
+    sampler = threading.Thread(target=_sample_peak_rss, args=(stop, peak), daemon=True)
+    sampler.start()
+    try:
+        result = func(**kwargs)
+        if checkpoint is not None:
+            checkpoint_dir, s = checkpoint
+            save_checkpoint(
+                checkpoint_dir, s, (result,) if len(s["outputs"]) == 1 else result
+            )
+    finally:
+        stop.set()
+        sampler.join()
+    return result, start, time.time(), max(peak[0], get_rss_mb())
+
+
+def get_critical_path(timings, dependencies):
+    """Find the critical path of a finished run.
+
+    The critical path is the chain of dependent stages with the largest
+    total duration, i.e. the stages that bound the wall time of the run no
+    matter how many workers are available.
+
+    :param timings: Dictionary of stage name to its (start, end) times
+    :type timings: <Dict<str>: <Tuple<float>>>
+    :param dependencies: Dictionary of stage name to the stage names it
+        depends on
+    :type dependencies: <Dict<str>: <Set<str>>>
+
+    :return: Stage names on the critical path and its total duration
+    :rtype: <List<str>>, <float>
+    """
+
+    cost = {}
+    previous = {}
+    for name in sorted(timings, key=lambda k: timings[k][1]):
+        duration = timings[name][1] - timings[name][0]
+        parents = [d for d in dependencies[name] if d in cost]
+        best_parent = max(parents, key=lambda d: cost[d]) if parents else None
+        cost[name] = duration + (cost[best_parent] if best_parent else 0)
+        previous[name] = best_parent
+
+    if len(cost) == 0:
+        return [], 0
+
+    last = max(cost, key=lambda k: cost[k])
+    path = []
+    while last is not None:
+        path.append(last)
+        last = previous[last]
+
+    return path[::-1], cost[path[0]]
+
+
+def _init_stage_worker(copy_on_write):
+    """Set the pandas Copy-on-Write mode of the main process in a stage worker process."""
+
+    pd.set_option("mode.copy_on_write", copy_on_write)
+
+
+def run_pipeline(
+    stages,
+    context,
+    executor="thread",
+    max_workers=None,
+    checkpoint_dir=None,
+    keep=(),
+    memory_budget=None,
+):
+    """Run a stage graph.
+
+    Stages are started as soon as all of their inputs are available, so
+    stages that only depend on the same upstream artifact run concurrently
+    on the selected pool.
+
+    Each stage output is released as soon as every stage that reads it has
+    finished, so the intermediates of early stages aren't held until the
+    end of the run. Outputs no stage reads, and the <keep> artifacts, are
+    returned.
+
+    With <checkpoint_dir> every finished stage saves its outputs there.
+    Running again with the same <checkpoint_dir> skips the stages that were
+    checkpointed and only loads the outputs the remaining stages need, so a
+    failure late in the run (e.g. saving the workbook) doesn't repeat the
+    reading and processing stages.
+
+    With <memory_budget>, whenever the resident memory after a stage is
+    over the budget, the largest data frame artifacts that no running stage
+    reads are spilled to disk until the overshoot is covered (see
+    <spill_artifact>), and loaded back when a stage reads them. Spilled
+    artifacts that were checkpointed are loaded from their checkpoint.
+
+    :param stages: Stage definitions created with <stage>
+    :type stages: <List<Dict>>
+    :param context: Artifacts available before the run (file names, PPR
+        version settings, etc.)
+    :type context: <Dict>
+    :param executor: "thread", "process" or "serial"
+    :type executor: <str>
+    :param max_workers: Maximum number of workers in the pool. Default is
+        the pool default
+    :type max_workers: <int>
+    :param checkpoint_dir: Directory to save stage outputs to and resume
+        from. Needs a Parquet engine, see <check_parquet_engine>. Default is
+        no checkpoints
+    :type checkpoint_dir: <str>
+    :param keep: Stage outputs to return even though stages read them
+    :type keep: <List<str>>
+    :param memory_budget: Resident memory in MB above which data frame
+        artifacts are spilled to disk. Needs a Parquet engine, see
+        <check_parquet_engine>. Default is no budget
+    :type memory_budget: <float>
+
+    :return: The returned artifacts, the context and the run report
+    :rtype: <Dict>, <Dict>
+    """
+
+    artifacts = dict(context)
+    dependencies = get_stage_dependencies(stages, artifacts.keys())
+    stages_by_name = {s["name"]: s for s in stages}
+    producers = dict((o, s) for s in stages for o in s["outputs"])
+
+    timings = {}
+    peak_rss = {}
+    done = set()
+    running = {}
+    t0 = time.time()
+
+    if checkpoint_dir is not None or memory_budget is not None:
+        check_parquet_engine()
+
+    resumed = []
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        resumed = [
+            s["name"] for s in stages
+            if os.path.exists(os.path.join(checkpoint_dir, s["name"], "manifest.pkl"))
+        ]
+        # Load what the remaining stages read, and the outputs nothing reads
+        pending_inputs = set(
+            i for s in stages if s["name"] not in resumed for i in s["inputs"]
+        )
+        all_inputs = set(i for s in stages for i in s["inputs"])
+        for name in resumed:
+            s = stages_by_name[name]
+            needed = [o for o in s["outputs"] if o in pending_inputs or o not in all_inputs]
+            artifacts.update(load_checkpoint(checkpoint_dir, s, needed))
+            done.add(name)
+        if len(resumed) > 0:
+            print(f"Resuming from {checkpoint_dir}, skipping: {', '.join(resumed)}")
+
+    # Stages that still have to read each stage output
+    readers = dict((o, set()) for o in producers)
+    for s in stages:
+        for i in s["inputs"]:
+            if i in readers and s["name"] not in done:
+                readers[i].add(s["name"])
+
+    # Spilled artifacts and how to load them back, see <load_spilled_artifact>
+    spilled = {}
+    spilled_names = []
+    sizes = {}
+    spill_dir = None
+    if memory_budget is not None and checkpoint_dir is None:
+        spill_dir = tempfile.mkdtemp(prefix="ppr_spill_")
+
+    def get_artifact(name):
+        if name in spilled:
+            return load_spilled_artifact(spilled[name])
+        return artifacts[name]
+
+    def spill_largest():
+        overshoot = get_rss_mb() - memory_budget
+        busy = set(i for name in running.values() for i in stages_by_name[name]["inputs"])
+        candidates = sorted(
+            (n for n in sizes if n in artifacts and n not in busy and sizes[n] > 0),
+            key=lambda n: sizes[n],
+            reverse=True,
+        )
+        for name in candidates:
+            if overshoot <= 0:
+                break
+            if checkpoint_dir is not None:
+                spilled[name] = ("checkpoint", checkpoint_dir, producers[name], name)
+            else:
+                spilled[name] = spill_artifact(spill_dir, name, artifacts[name])
+            del artifacts[name]
+            spilled_names.append(name)
+            overshoot -= sizes[name]
+            print(f"Memory over the {memory_budget:.0f} MB budget, spilled '{name}' ({sizes[name]:.1f} MB) to disk")
+
+    if executor == "process":
+        pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_stage_worker,
+            initargs=(pd.get_option("mode.copy_on_write"),),
+        )
+    elif executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    elif executor == "serial":
+        pool = ThreadPoolExecutor(max_workers=1)
+    else:
+        raise ValueError(f"Unknown executor '{executor}'")
+
+    try:
+        with pool:
+            while len(done) < len(stages):
+                # Submit every stage whose dependencies are finished
+                for name, s in stages_by_name.items():
+                    if name in done or name in running.values():
+                        continue
+                    if dependencies[name].issubset(done):
+                        kwargs = {i: get_artifact(i) for i in s["inputs"]}
+                        checkpoint = None if checkpoint_dir is None else (checkpoint_dir, s)
+                        future = pool.submit(_run_stage, s["func"], kwargs, checkpoint)
+                        running[future] = name
+                        del kwargs
+
+                finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        result, start, end, peak = future.result()
+                    except Exception:
+                        for f in running:
+                            f.cancel()
+                        print(f"Stage '{name}' failed")
+                        raise
+
+                    outputs = stages_by_name[name]["outputs"]
+                    if len(outputs) == 1:
+                        result = (result,)
+                    artifacts.update(zip(outputs, result))
+                    if memory_budget is not None:
+                        sizes.update((o, get_artifact_mb(v)) for o, v in zip(outputs, result))
+                    timings[name] = (start, end)
+                    peak_rss[name] = peak
+                    done.add(name)
+                    del result
+
+                    # Release the outputs every reader has finished with
+                    for i in stages_by_name[name]["inputs"]:
+                        if i not in readers:
+                            continue
+                        readers[i].discard(name)
+                        if len(readers[i]) == 0 and i not in keep:
+                            artifacts.pop(i, None)
+                            spilled.pop(i, None)
+                finished = None
+
+                if memory_budget is not None and get_rss_mb() > memory_budget:
+                    spill_largest()
+
+        # The returned artifacts are loaded back
+        for name in list(spilled.keys()):
+            artifacts[name] = load_spilled_artifact(spilled.pop(name))
+    finally:
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    critical_path, critical_time = get_critical_path(timings, dependencies)
+    report = {
+        "executor": executor,
+        "wall_time": time.time() - t0,
+        "timings": {k: (v[0] - t0, v[1] - t0) for k, v in timings.items()},
+        "peak_rss": peak_rss,
+        "critical_path": critical_path,
+        "critical_path_time": critical_time,
+        "resumed": resumed,
+        "spilled": spilled_names,
+    }
+
+    return artifacts, report
+
+
+def print_run_report(report):
+    """Print the stage timings and the critical path of a run.
+
+    :param report: Run report returned by <run_pipeline>
+    :type report: <Dict>
+    """
+
+    print(f"Run report ({report['executor']} executor)")
+    for name, (start, end) in sorted(
+        report["timings"].items(), key=lambda kv: kv[1][0]
+    ):
+        marker = "*" if name in report["critical_path"] else " "
+        print(
+            f" {marker} {name:<30} start {start:8.2f}s  took {end - start:8.2f}s"
+            f"  peak RSS {report['peak_rss'][name]:8.1f} MB"
+        )
+    if len(report.get("resumed", [])) > 0:
+        print(f"Resumed from checkpoints: {', '.join(report['resumed'])}")
+    if len(report.get("spilled", [])) > 0:
+        print(f"Spilled to disk: {', '.join(report['spilled'])}")
+    print(
+        f"Critical path ({report['critical_path_time']:.2f}s of "
+        f"{report['wall_time']:.2f}s wall time): "
+        + " -> ".join(report["critical_path"])
+    )
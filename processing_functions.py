@@ -1,4 +1,7 @@
+import difflib
+import hashlib
 import html
+import re
 from datetime import date
 
 from openpyxl import Workbook
@@ -8,6 +11,81 @@ import pandas as pd
 from dateutil.parser import parse
 import numpy as np
 
+# The 2024 OLDC export has two H-02 columns, map them onto the crosswalk names
+QUESTION_MAPPING_2024 = {
+    "H-02 What does the FVPSA grant allow you to do that you wouldn¿t be able to do without this funding?":
+        "H-02 WHAT DOES THE FVPSA GRANT ALLOW YOU TO DO THAT YOU WOULDN¿T BE ABLE TO DO WITHOUT THIS FUNDING?...49",
+    "H-02 What does the FVPSA grant allow you to do that you wouldn¿t be able to do without this funding?.1":
+        "H-02 WHAT DOES THE FVPSA GRANT ALLOW YOU TO DO THAT YOU WOULDN¿T BE ABLE TO DO WITHOUT THIS FUNDING?...50",
+}
+
+# Engineered subawardee funding totals that are not in the lookup table
+SUBAWARDEE_TOTAL_ELEMENTS = ["SUBAWARDEE_SHELTER_TOTAL", "SUBAWARDEE_NONSHELTER_TOTAL"]
+
+# Columns the subawardee funding rollup is grouped by, renamed to the names the subawardee reports use. See
+# <get_subawardee_rollup>
+SUBAWARDEE_ROLLUP_COLUMNS = {
+    "Fy": "Fy",
+    "ProgAcronym": "ProgAcronym",
+    "Subawardee List - Subawardee Name": "Subawardee List - Subawardee Name",
+    "Subawardee List - City": "Subawardee List - City",
+    "PostalCode": "PostalCode",
+    "Subawardee List - Type of Subawardee": "Shelter Type",
+    "Subawardee List - Classification of urban, rural, suburban or frontier": "Rural Designation",
+    "CultSpec2": "CultSpec2",
+}
+
+# Columns a distinct subawardee is identified by in the subawardee counts. See <get_subawardee_counts>
+SUBAWARDEE_ID_COLUMNS = [
+    "Fy",
+    "ProgAcronym",
+    "Subawardee List - Subawardee Name",
+    "Subawardee List - City",
+    "PostalCode",
+]
+
+# Typed columns the long format values are stored in, by kind of value. See
+# <split_value_kinds>
+VALUE_KIND_COLUMNS = {"num": "Value Num", "date": "Value Date", "text": "Value Text"}
+
+# Kind of value of each "Data Type" of the crosswalk sheet. Elements without
+# a data type get the kind of the values they hold
+DATA_TYPE_KINDS = {
+    "number": "num",
+    "numeric": "num",
+    "count": "num",
+    "integer": "num",
+    "currency": "num",
+    "percent": "num",
+    "percentage": "num",
+    "date": "date",
+    "text": "text",
+    "narrative": "text",
+}
+
+# Engines <read_excel> can parse workbooks with. "openpyxl" is the pandas
+# default (streams the workbook in read-only mode), "calamine" is the Rust
+# calamine reader from the optional python-calamine package
+EXCEL_ENGINES = ["openpyxl", "calamine"]
+
+# Zip codes are read as text so leading zeros are kept
+ZIP_COLUMNS = ["Grantee Zip4", "Grantee Zip5"]
+
+# Sheets of the raw States & Tribes export the formula branches use: the
+# cover page, subawardees and the grantee narrative screen
+STATES_RAW_SHEETS = ["Screen-1", "Screen-2", "Screen-3"]
+
+# Columns of the schema drift report of the header pre-scan, see <get_schema_drift>
+SCHEMA_DRIFT_COLUMNS = ["Sheet", "Check", "Expected", "Found"]
+
+# Suffix pandas adds to repeated header names, e.g. "H-02 ....1"
+DUPLICATE_SUFFIX = re.compile(r"\.\d+$")
+
+# Parsed Excel sheets kept in memory between runs, None when caching is off.
+# See <enable_sheet_cache>
+_sheet_cache = None
+SHEET_CACHE_SIZE = 16
+
 
 def is_date(string, fuzzy=False):
     """
@@ -24,7 +102,221 @@ def is_date(string, fuzzy=False):
         return False
 
 
-def process_long_data(raw_df, long_df, processed_data_file_name):
+def enable_sheet_cache():
+    """Keep parsed Excel sheets in memory between runs.
+
+    Used by long-running processes (see <watch_folder.run_daemon>) so the
+    crosswalks and the historical long format data are parsed once instead
+    of once per run. Sheets are cached by file content, so an edited file
+    is read again.
+    """
+
+    global _sheet_cache
+    if _sheet_cache is None:
+        _sheet_cache = {}
+
+
+def get_file_fingerprint(filepath):
+    """Get the SHA-1 hash of the contents of a file.
+
+    :param filepath: File to hash
+    :type filepath: <str>
+
+    :return: Hex digest of the file contents
+    :rtype: <str>
+    """
+
+    sha1 = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(chunk)
+
+    return sha1.hexdigest()
+
+
+def check_excel_dtypes(df, sheet_name):
+    """Check that a sheet read with calamine has the types openpyxl gives.
+
+    The zip code columns must be text, so leading zeros are kept. Date
+    cells must be parsed as datetimes, a column of date or datetime values
+    that was left as objects is converted to datetime64, as openpyxl does.
+
+    :param df: Data frame of the sheet
+    :type df: <pd.DataFrame>
+    :param sheet_name: Name of the sheet, for the error message
+    :type sheet_name: <str>
+
+    :return: Data frame with the date columns converted
+    :rtype: <pd.DataFrame>
+    """
+
+    for col in [c for c in ZIP_COLUMNS if c in df.columns]:
+        if pd.api.types.infer_dtype(df[col], skipna=True) not in ["string", "empty"]:
+            raise ValueError(f"'{col}' in sheet '{sheet_name}' was not read as text")
+
+    for col in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[col], skipna=True) in ["date", "datetime"]:
+            df[col] = pd.to_datetime(df[col])
+
+    return df
+
+
+def open_excel(filepath, engine="openpyxl"):
+    """Open an Excel file to read several sheets from it with <read_excel>.
+
+    :param filepath: File path of the Excel file
+    :type filepath: <str>
+    :param engine: One of <EXCEL_ENGINES>
+    :type engine: <str>
+
+    :return: Open Excel file, use it as a context manager to close it
+    :rtype: <pd.ExcelFile>
+    """
+
+    _check_excel_engine(engine)
+
+    return pd.ExcelFile(filepath, engine=engine)
+
+
+def _check_excel_engine(engine):
+    """Check the Excel engine is known and its package is installed."""
+
+    if engine not in EXCEL_ENGINES:
+        raise ValueError(f"Unknown Excel engine '{engine}', expected one of {EXCEL_ENGINES}")
+    if engine == "calamine":
+        try:
+            import python_calamine  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                'The "calamine" Excel engine requires the python-calamine package (pip install python-calamine)'
+            ) from e
+
+
+def read_excel(filepath, sheet_name=0, engine="openpyxl", **kwargs):
+    """Read sheets of an Excel file with the selected engine.
+
+    All workbook reads go through this function. Sheets read with an engine
+    other than openpyxl are checked with <check_excel_dtypes>.
+
+    :param filepath: File path of the Excel file, or an Excel file opened
+        with <open_excel> with the same engine
+    :type filepath: <str> or <pd.ExcelFile>
+    :param sheet_name: Sheet to read, a list of sheets, or None for all
+        sheets
+    :type sheet_name: <str>
+    :param engine: One of <EXCEL_ENGINES>
+    :type engine: <str>
+    :param kwargs: Other arguments of <pd.read_excel>, e.g. usecols
+
+    :return: Data frame of the sheet, or dictionary of data frames by sheet
+        name when <sheet_name> is a list or None
+    :rtype: <pd.DataFrame> or <Dict<pd.DataFrame>>
+    """
+
+    _check_excel_engine(engine)
+
+    sheets = pd.read_excel(filepath, sheet_name=sheet_name, engine=engine, **kwargs)
+    if engine == "openpyxl":
+        return sheets
+
+    if isinstance(sheets, dict):
+        return dict((k, check_excel_dtypes(v, k)) for k, v in sheets.items())
+    return check_excel_dtypes(sheets, sheet_name)
+
+
+def read_excel_sheet(filepath, sheet_name, engine="openpyxl"):
+    """Read one sheet of an Excel file.
+
+    When the sheet cache is enabled, the sheet is parsed once per file
+    content and a copy of the cached data frame is returned.
+
+    :param filepath: File path of the Excel file
+    :type filepath: <str>
+    :param sheet_name: Name of the sheet to read
+    :type sheet_name: <str>
+    :param engine: One of <EXCEL_ENGINES>
+    :type engine: <str>
+
+    :return: Data frame of the sheet
+    :rtype: <pd.DataFrame>
+    """
+
+    if _sheet_cache is None:
+        return read_excel(filepath, sheet_name=sheet_name, engine=engine)
+
+    return _read_cached(
+        (get_file_fingerprint(filepath), sheet_name, engine),
+        lambda: read_excel(filepath, sheet_name=sheet_name, engine=engine),
+    )
+
+
+def read_csv_file(filepath):
+    """Read a CSV file.
+
+    When the sheet cache is enabled, the file is parsed once per file
+    content and a copy of the cached data frame is returned, as with
+    <read_excel_sheet>.
+
+    :param filepath: File path of the CSV file
+    :type filepath: <str>
+
+    :return: Data frame of the file
+    :rtype: <pd.DataFrame>
+    """
+
+    if _sheet_cache is None:
+        return pd.read_csv(filepath)
+
+    return _read_cached((get_file_fingerprint(filepath), None, "csv"), lambda: pd.read_csv(filepath))
+
+
+def _read_cached(key, read):
+    """Get a data frame from the sheet cache, reading it with <read> if it isn't cached."""
+
+    if key in _sheet_cache:
+        # Move to the end, the oldest sheet is evicted first
+        _sheet_cache[key] = _sheet_cache.pop(key)
+    else:
+        _sheet_cache[key] = read()
+        while len(_sheet_cache) > SHEET_CACHE_SIZE:
+            del _sheet_cache[next(iter(_sheet_cache))]
+
+    # Under Copy-on-Write a shallow copy is enough to protect the cached sheet
+    return _sheet_cache[key].copy(deep=not pd.get_option("mode.copy_on_write"))
+
+
+def get_long_format_sheet_name(processed_data_file_name, engine="openpyxl"):
+    """Get the name of the long format sheet of a processed file.
+
+    The long format sheet is named after the date it was processed.
+
+    :param processed_data_file_name: File name of previously processed data,
+        or None if there is no previously processed data
+    :type processed_data_file_name: <str>
+    :param engine: One of <EXCEL_ENGINES>
+    :type engine: <str>
+
+    :return: Name of the long format sheet, or None if there isn't one
+    :rtype: <str>
+    """
+
+    sheet_names = (
+        pd.ExcelFile(processed_data_file_name, engine=engine).sheet_names
+        if processed_data_file_name is not None
+        else []
+    )
+    sheet_index = [is_date(sheet_name) for sheet_name in sheet_names]
+    if not any(sheet_index):
+        return None
+
+    return str(
+        date.fromisoformat(
+            [name for i, name in enumerate(sheet_names) if sheet_index[i]][0]
+        )
+    )
+
+
+def process_long_data(raw_df, long_df, processed_data_file_name, engine="openpyxl", field_names_conversion=None):
     """Create and process data in long format
 
     This function reads in the long format data, if it exists, and
@@ -35,10 +327,18 @@ def process_long_data(raw_df, long_df, processed_data_file_name):
 
     :parma raw_df: Raw OLDC data
     :type raw_df: <Dict(<pd.DataFrame>)>
-    :param long_df: Data frame of processed long format data
+    :param long_df: Data frame of processed long format data, with the
+        typed value columns
     :type long_df: <pd.DataFrame>
-    :param processed_data_file_name: File name of previously processed data
+    :param processed_data_file_name: File name of previously processed data,
+        or None if there is no previously processed data
     :type processed_data_file_name: <str>
+    :param engine: Engine to read the previously processed data with, one of
+        <EXCEL_ENGINES>
+    :type engine: <str>
+    :param field_names_conversion: Crosswalk sheet, the historical values
+        are split into typed columns like <long_df>, see <split_value_kinds>
+    :type field_names_conversion: <pd.DataFrame>
 
     :return: Processed and appended long format grantee data
     :rtype: <pd.DataFrame>
@@ -49,23 +349,18 @@ def process_long_data(raw_df, long_df, processed_data_file_name):
     years_in_oldc_data = [int(x) for x in raw_df["Screen-1"].Fy.unique()]
 
     # Check if long format data exists in the current processed file
-    sheet_names = pd.ExcelFile(processed_data_file_name).sheet_names
-    sheet_index = [is_date(sheet_name) for sheet_name in sheet_names]
-    if any(sheet_index):
-        # Sheet name of long format data
-        last_update = date.fromisoformat(
-            [name for i, name in enumerate(sheet_names) if sheet_index[i]][0]
-        )
-
+    last_update = get_long_format_sheet_name(processed_data_file_name, engine=engine)
+    if last_update is not None:
         # read in the historical long data
-        historical_long_data = pd.read_excel(
-            processed_data_file_name, sheet_name=str(last_update)
-        )
+        historical_long_data = read_excel_sheet(processed_data_file_name, last_update, engine=engine)
 
         # Overwrite old year's processed data with new
         historical_long_data = historical_long_data[
             ~historical_long_data.Year.isin(years_in_oldc_data)
         ]
+        historical_long_data = split_value_kinds(
+            historical_long_data, get_element_kinds(historical_long_data, field_names_conversion)
+        )
 
         # combine the historical long data with new long data
         # and remove any duplicate rows
@@ -73,9 +368,11 @@ def process_long_data(raw_df, long_df, processed_data_file_name):
     else:
         historical_long_data = long_df
 
-    # Light processing
-    historical_long_data.Element = historical_long_data.Element.str.upper().replace(
-        ["GRANTEE NAME", "GRANTEE_NAME", "GRANTEENAME"], "GRANTEENAME"
+    # Light processing, assign a new frame as <long_df> is read by other stages
+    historical_long_data = historical_long_data.assign(
+        Element=historical_long_data.Element.str.upper().replace(
+            ["GRANTEE NAME", "GRANTEE_NAME", "GRANTEENAME"], "GRANTEENAME"
+        )
     )
     historical_long_data = historical_long_data.drop_duplicates(
         ["Grant Type", "State", "Year", "EIN", "Element"], keep="last"
@@ -84,14 +381,417 @@ def process_long_data(raw_df, long_df, processed_data_file_name):
     return historical_long_data
 
 
-def read_data(filepath_raw, filepath_crosswalk):
+def get_used_columns(id_cols, lookup_data, field_names_conversion, year=None, duplicate_columns=None):
+    """Get a filter for the raw columns that the processing uses.
+
+    A column is used if it is an identifier column (or any other Screen-1
+    column, which would otherwise change the merge suffixes), if it is in the
+    lookup table (see <get_lookup_variables>), if it is a service outcome
+    column of the crosswalk, or if it is one of the duplicated columns that
+    <replace_duplicate_columns> renames. Every other column is dropped by the
+    lookup join.
+
+    :param id_cols: Screen-1 column names
+    :type id_cols: <List<str>>
+    :param lookup_data: Lookup sheet from lookup data
+    :type lookup_data: <pd.DataFrame>
+    :param field_names_conversion: Crosswalk sheet from lookup data
+    :type field_names_conversion: <pd.DataFrame>
+    :param year: PPR version year, the H-02 mapping only applies to 2024
+    :type year: <int>
+    :param duplicate_columns: Column name substrings of the duplicated
+        columns
+    :type duplicate_columns: <List<str>>
+
+    :return: Function that returns whether a column name is used, to pass
+        as usecols
+    :rtype: <Callable>
+    """
+
+    id_cols = set(id_cols)
+    lookup_data = lookup_data.assign(
+        **{"Meta Name Description": lookup_data["Meta Name Description"].str.upper()}
+    )
+    outcome_columns = set(
+        field_names_conversion.loc[
+            field_names_conversion.Group_Description == "Service Outcome",
+            "Meta Name Description",
+        ]
+        .dropna()
+        .str.upper()
+    )
+    duplicate_columns = list(duplicate_columns) if duplicate_columns is not None else []
+
+    def is_used(column):
+        if column in id_cols:
+            return True
+        if not isinstance(column, str):
+            return False
+        return (
+            len(get_lookup_variables([column], lookup_data, year=year)) > 0
+            or column.upper() in outcome_columns
+            or any(dup in column for dup in duplicate_columns)
+        )
+
+    return is_used
+
+
+def get_column_schema(field_names_conversion, lookup_data=None):
+    """Get the kind of value of every column the crosswalk declares one for.
+
+    The kinds come from the "Data Type" column of the crosswalk sheet, see
+    <DATA_TYPE_KINDS>. A crosswalk without one declares no kinds. With
+    <lookup_data>, every Meta Name Description of the lookup sheet also gets
+    the kind of its Element.
+
+    :param field_names_conversion: Crosswalk sheet, of the PPR version the
+        raw data is read for
+    :type field_names_conversion: <pd.DataFrame>
+    :param lookup_data: Lookup sheet from lookup data
+    :type lookup_data: <pd.DataFrame>
+
+    :return: "num", "date" or "text" by upper cased Meta Name Description
+    :rtype: <Dict<str, str>>
+    """
+
+    if "Data Type" not in field_names_conversion.columns:
+        return {}
+
+    declared = field_names_conversion.assign(
+        kind=field_names_conversion["Data Type"].map(
+            lambda x: DATA_TYPE_KINDS.get(str(x).strip().lower())
+        )
+    ).dropna(subset=["kind"])
+
+    schema = {}
+    if lookup_data is not None and "Element" in declared.columns:
+        element_kinds = dict(
+            (str(element).upper(), kind)
+            for element, kind in zip(declared["Element"], declared["kind"])
+            if pd.notna(element)
+        )
+        for name, element in zip(lookup_data["Meta Name Description"], lookup_data["Element"]):
+            if pd.notna(name) and str(element).upper() in element_kinds:
+                schema[str(name).upper()] = element_kinds[str(element).upper()]
+
+    for name, kind in zip(declared["Meta Name Description"], declared["kind"]):
+        if pd.notna(name):
+            schema[str(name).upper()] = kind
+
+    return schema
+
+
+def get_column_kinds(columns, schema, year=None):
+    """Get the kind of value of the raw columns that are in the schema.
+
+    :param columns: Column names of the raw data
+    :type columns: <List<str>>
+    :param schema: Kind by Meta Name Description, from <get_column_schema>
+    :type schema: <Dict<str, str>>
+    :param year: PPR version year, the H-02 mapping only applies to 2024
+    :type year: <int>
+
+    :return: "num", "date" or "text" by column name
+    :rtype: <Dict<str, str>>
+    """
+
+    column_kinds = {}
+    for column in columns:
+        variable = QUESTION_MAPPING_2024.get(column, column) if year == 2024 else column
+        if isinstance(variable, str) and variable.upper() in schema:
+            column_kinds[column] = schema[variable.upper()]
+
+    return column_kinds
+
+
+def read_column_kinds(excel_file, sheet_names, schema, engine="openpyxl", year=None):
+    """Get the kind of value of the schema columns of several sheets.
+
+    Only the header row of each sheet is read.
+
+    :param excel_file: Excel file opened with <open_excel>
+    :type excel_file: <pd.ExcelFile>
+    :param sheet_names: Sheets to read the headers of
+    :type sheet_names: <List<str>>
+    :param schema: Kind by Meta Name Description, from <get_column_schema>
+    :type schema: <Dict<str, str>>
+    :param engine: One of <EXCEL_ENGINES>
+    :type engine: <str>
+    :param year: PPR version year, the H-02 mapping only applies to 2024
+    :type year: <int>
+
+    :return: "num", "date" or "text" by column name
+    :rtype: <Dict<str, str>>
+    """
+
+    column_kinds = {}
+    if not schema:
+        return column_kinds
+
+    for sheet in sheet_names:
+        columns = read_excel(excel_file, sheet_name=sheet, engine=engine, nrows=0).columns
+        column_kinds.update(get_column_kinds(columns, schema, year=year))
+
+    return column_kinds
+
+
+def get_reader_dtypes(column_kinds, text_columns=ZIP_COLUMNS):
+    """Get the dtype argument of <read_excel> for the raw data.
+
+    The <text_columns> and the text columns of the schema are read as text,
+    so e.g. numeric looking codes keep their leading zeros.
+
+    :param column_kinds: Kind by column name, from <get_column_kinds>
+    :type column_kinds: <Dict<str, str>>
+    :param text_columns: Other columns to read as text, the zip codes by
+        default
+    :type text_columns: <List<str>>
+
+    :return: dtype by column name
+    :rtype: <Dict<str, str>>
+    """
+
+    dtypes = dict((c, "str") for c in text_columns)
+    dtypes.update((c, "str") for c, kind in column_kinds.items() if kind == "text")
+
+    return dtypes
+
+
+def downcast_numbers(values):
+    """Downcast a number column to the most compact type that holds its values.
+
+    Whole numbers without missing values become 32 bit integers, or 64 bit
+    when they don't fit, so sums of a few rows can't overflow. Other columns
+    become 32 bit floats when no value changes.
+
+    :param values: Number column
+    :type values: <pd.Series>
+
+    :return: Downcast column
+    :rtype: <pd.Series>
+    """
+
+    if pd.api.types.is_bool_dtype(values) or values.empty:
+        return values
+
+    if pd.api.types.is_integer_dtype(values) or (values.notna().all() and (values % 1 == 0).all()):
+        int32 = np.iinfo("int32")
+        if values.between(int32.min, int32.max).all():
+            return values.astype("int32")
+        return values.astype("int64")
+
+    float32 = values.astype("float32")
+    if ((float32.astype("float64") == values) | values.isna()).all():
+        return float32
+
+    return values
+
+
+def _coerce_column(values, kind):
+    """Coerce a column to a number or date kind, with a mask of the values that failed."""
+
+    if kind == "num":
+        coerced = values
+        if not pd.api.types.is_numeric_dtype(values):
+            coerced = pd.to_numeric(values, errors="coerce")
+    elif pd.api.types.is_datetime64_any_dtype(values):
+        coerced = values
+    else:
+        # Only text and dates can be dates, numbers would be read as nanoseconds
+        coerced = pd.to_datetime(
+            values.where(values.map(lambda x: isinstance(x, (str, date)))),
+            errors="coerce",
+            format="mixed",
+        )
+
+    failed = values.notna() & coerced.isna() & (values.astype(str).str.strip() != "")
+    if kind == "num":
+        coerced = downcast_numbers(coerced)
+
+    return coerced, failed
+
+
+def apply_column_schema(sheets, column_kinds):
+    """Coerce the number and date columns of the raw sheets to their kind.
+
+    Number columns are converted with <pd.to_numeric> and downcast, see
+    <downcast_numbers>, date columns with <pd.to_datetime>. Values that
+    can't be converted are left missing and reported. The text columns are
+    read as text, see <get_reader_dtypes>.
+
+    :param sheets: Data frames of the raw data by sheet name
+    :type sheets: <Dict<pd.DataFrame>>
+    :param column_kinds: Kind by column name, from <get_column_kinds>
+    :type column_kinds: <Dict<str, str>>
+
+    :return: Coerced sheets, and a data frame of the values that failed to
+        coerce, with the Sheet, Column, Kind, Value and the number of Rows
+    :rtype: <Dict<pd.DataFrame>>, <pd.DataFrame>
+    """
+
+    failures = []
+    for sheet_name, df in sheets.items():
+        for column in [c for c in df.columns if column_kinds.get(c) in ["num", "date"]]:
+            kind = column_kinds[column]
+            values = df[column]
+            df[column], failed = _coerce_column(values, kind)
+            for value, rows in values[failed].astype(str).value_counts(sort=False).items():
+                failures.append([sheet_name, column, kind, value, rows])
+        sheets[sheet_name] = df
+
+    return sheets, pd.DataFrame(failures, columns=["Sheet", "Column", "Kind", "Value", "Rows"])
+
+
+def print_coercion_report(coercion_report):
+    """Print the values that failed to coerce, see <apply_column_schema>."""
+
+    if coercion_report.empty:
+        return
+
+    print(
+        f"{coercion_report.Rows.sum()} values failed to coerce to the data type of their column "
+        "and were left empty:"
+    )
+    print(coercion_report.to_string(index=False))
+
+
+def read_headers(filepath, engine="openpyxl"):
+    """Read the sheet names and header rows of an Excel file.
+
+    Only the header row of each sheet is parsed, openpyxl streams the
+    workbook in read-only mode and stops after it.
+
+    :param filepath: File path of the Excel file
+    :type filepath: <str>
+    :param engine: One of <EXCEL_ENGINES>
+    :type engine: <str>
+
+    :return: Column names by sheet name, in workbook order
+    :rtype: <Dict<List<str>>>
+    """
+
+    with open_excel(filepath, engine=engine) as excel_file:
+        return dict(
+            (sheet, list(read_excel(excel_file, sheet_name=sheet, engine=engine, nrows=0).columns))
+            for sheet in excel_file.sheet_names
+        )
+
+
+def find_duplicate_columns(columns, expected=()):
+    """Find the repeated header names pandas added a suffix to.
+
+    :param columns: Column names of a sheet, as read by <read_excel>
+    :type columns: <List<str>>
+    :param expected: Repeated columns the processing renames, e.g. the keys
+        of <QUESTION_MAPPING_2024>
+    :type expected: <List<str>>
+
+    :return: Repeated columns that aren't expected
+    :rtype: <List<str>>
+    """
+
+    names = set(columns)
+
+    return [
+        c
+        for c in columns
+        if isinstance(c, str)
+        and DUPLICATE_SUFFIX.search(c)
+        and DUPLICATE_SUFFIX.sub("", c) in names
+        and c not in expected
+    ]
+
+
+def get_missing_columns(sheet, check, expected, found):
+    """Get the schema drift rows of the expected columns a sheet doesn't have.
+
+    Each missing column is reported with the closest column the sheet does
+    have, so a renamed column shows up next to its new name.
+
+    :param sheet: Name of the sheet, or of the sheets, that were checked
+    :type sheet: <str>
+    :param check: Name of the check, e.g. "identifier"
+    :type check: <str>
+    :param expected: Column names the sheet should have
+    :type expected: <List<str>>
+    :param found: Column names the sheet has
+    :type found: <List<str>>
+
+    :return: Schema drift rows, see <SCHEMA_DRIFT_COLUMNS>
+    :rtype: <List<List>>
+    """
+
+    found = [c for c in found if isinstance(c, str)]
+    found_set = set(found)
+    rows = []
+    for column in expected:
+        if column in found_set:
+            continue
+        close = difflib.get_close_matches(column, found, n=1, cutoff=0.9)
+        rows.append([sheet, check, column, close[0] if close else None])
+
+    return rows
+
+
+def get_schema_drift(rows):
+    """Get the schema drift report of the header pre-scan.
+
+    :param rows: Schema drift rows, see <SCHEMA_DRIFT_COLUMNS>
+    :type rows: <List<List>>
+
+    :return: Schema drift report, empty when the headers match the
+        expected layout
+    :rtype: <pd.DataFrame>
+    """
+
+    return pd.DataFrame(rows, columns=SCHEMA_DRIFT_COLUMNS)
+
+
+def check_schema_drift(schema_drift, label):
+    """Fail with the schema drift report if the headers drifted.
+
+    :param schema_drift: Schema drift report, see <get_schema_drift>
+    :type schema_drift: <pd.DataFrame>
+    :param label: Name of the input that was pre-scanned
+    :type label: <str>
+
+    :raises ValueError: If the report has any rows
+    """
+
+    if schema_drift.empty:
+        print(f"Pre-scan of {label} headers - OK")
+        return
+
+    raise ValueError(
+        f"Pre-scan of {label} headers found {len(schema_drift)} differences from the expected layout:\n"
+        + schema_drift.fillna("-").to_string(index=False)
+    )
+
+
+def read_data(
+    filepath_raw,
+    filepath_crosswalk,
+    engine="openpyxl",
+    raw_columns="all",
+    year=None,
+    duplicate_columns=None,
+):
     """Read in relevant data.
 
     This function reads in the necessary sheets from the given file paths
     and returns each one as a dictionary where each value is a data frame
-    corresponding to a given sheet. It includes all the sheets of the raw
-    data, the sheets of the previously processed data, and the following
-    sheets from the lookup data: lookup, cultspec_subawardee, crosswalk.
+    corresponding to a given sheet. It includes the sheets of the raw data
+    in <STATES_RAW_SHEETS>, the sheets of the previously processed data, and
+    the following sheets from the lookup data: lookup, cultspec_subawardee,
+    crosswalk.
+
+    With <raw_columns> "used", only the Screen-3 columns the processing uses
+    are read, see <get_used_columns>. The OriginalFormat sheet then only
+    has those columns, "all" keeps every column.
+
+    The raw columns are typed by the data types the crosswalk declares, see
+    <get_column_schema>: text columns are read as text, number and date
+    columns are coerced after the read, see <apply_column_schema>.
 
     :param filepath_raw: File path to the raw OLDC data (this is what will
         be processed)
@@ -99,34 +799,62 @@ def read_data(filepath_raw, filepath_crosswalk):
     :param filepath_crosswalk: File path to the lookup data to be used for
         processing
     :type filepath_crosswalk: <str>
+    :param engine: Engine to read the workbooks with, one of <EXCEL_ENGINES>
+    :type engine: <str>
+    :param raw_columns: "all" or "used" Screen-3 columns
+    :type raw_columns: <str>
+    :param year: PPR version year, the H-02 mapping only applies to 2024
+    :type year: <int>
+    :param duplicate_columns: Column name substrings of the duplicated
+        columns, see <replace_duplicate_columns>
+    :type duplicate_columns: <List<str>>
 
     :return: Data frames corresponding to the given sheets, except for the
         raw data, which is returned as a dictionary of data frames
-        corresponding to the relevant sheets
+        corresponding to the relevant sheets, and the values that failed to
+        coerce to their data type
     :rtype: <pd.DataFrame>; raw_data: <Dict<pd.DataFrame>>
     """
 
-    # Read in raw data
-    raw_data = pd.read_excel(
-        filepath_raw,
-        sheet_name=None,
-        parse_dates=True,
-        dtype={"Grantee Zip4": "str", "Grantee Zip5": "str"},
-    )
-
-    print("Reading in raw data - COMPLETE")
+    if raw_columns not in ["all", "used"]:
+        raise ValueError(f"Unknown raw_columns '{raw_columns}', expected 'all' or 'used'")
 
-    # Load the lookup table
-    lookup_data_based = pd.read_excel(filepath_crosswalk, sheet_name="lookup")
-    subawardee_lookup = pd.read_excel(
-        filepath_crosswalk, sheet_name="cultspec_subawardee"
-    )
+    # Load the lookup table, it decides which raw columns are used
+    lookup_data_based = read_excel_sheet(filepath_crosswalk, "lookup", engine=engine)
+    subawardee_lookup = read_excel_sheet(filepath_crosswalk, "cultspec_subawardee", engine=engine)
     subawardee_lookup = subawardee_lookup.drop_duplicates(subset=["SubAwdCultSpecf"])
 
-    field_names_conversion = pd.read_excel(filepath_crosswalk, "crosswalk")
+    field_names_conversion = read_excel_sheet(filepath_crosswalk, "crosswalk", engine=engine)
     print("Reading in the lookup table - COMPLETE")
 
-    return raw_data, lookup_data_based, subawardee_lookup, field_names_conversion
+    # Data types the crosswalk of this PPR version declares for the raw columns
+    schema = get_column_schema(field_names_conversion, lookup_data_based)
+
+    # Read in raw data, only the sheets that are used
+    with open_excel(filepath_raw, engine=engine) as raw_file:
+        column_kinds = read_column_kinds(raw_file, STATES_RAW_SHEETS, schema, engine=engine, year=year)
+        raw_kwargs = {"parse_dates": True, "dtype": get_reader_dtypes(column_kinds)}
+        raw_data = read_excel(
+            raw_file, sheet_name=STATES_RAW_SHEETS[:-1], engine=engine, **raw_kwargs
+        )
+        usecols = None
+        if raw_columns == "used":
+            usecols = get_used_columns(
+                raw_data["Screen-1"].columns,
+                lookup_data_based,
+                field_names_conversion,
+                year=year,
+                duplicate_columns=duplicate_columns,
+            )
+        raw_data[STATES_RAW_SHEETS[-1]] = read_excel(
+            raw_file, sheet_name=STATES_RAW_SHEETS[-1], engine=engine, usecols=usecols, **raw_kwargs
+        )
+
+    raw_data, coercion_report = apply_column_schema(raw_data, column_kinds)
+    print_coercion_report(coercion_report)
+    print("Reading in raw data - COMPLETE")
+
+    return raw_data, lookup_data_based, subawardee_lookup, field_names_conversion, coercion_report
 
 
 def process_raw_data(raw_df, coalitions = False):
@@ -157,8 +885,7 @@ def process_raw_data(raw_df, coalitions = False):
                     "GranteeTypeTxt"] = "State"
 
         # Impute NaN values where necessary
-        df = df.replace("nan", np.nan)
-        df = df.replace("", np.nan)
+        df = df.replace(["nan", ""], np.nan)
 
         if "GranteeName" in df.columns:
             # Use unique grantee name per EIN
@@ -166,14 +893,21 @@ def process_raw_data(raw_df, coalitions = False):
                 unique_grantee_names, how="left", on="RptEin"
             )
 
-        # Trim whitespace
-        df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
+        # Trim whitespace, only the text columns are replaced
+        text_cols = df.columns[df.dtypes == "object"]
+        df[text_cols] = df[text_cols].apply(lambda x: x.str.strip())
 
         raw_df[sheet] = df
 
     return raw_df
 
 
+def _unescape_text(x):
+    """Text of a cell with HTML entities (e.g. &quot;) replaced."""
+
+    return html.unescape(str(x))
+
+
 def process_subawardee_data(df, subawardee_lookup, receipt_ids_to_keep):
     """Process subawardee data.
 
@@ -181,9 +915,14 @@ def process_subawardee_data(df, subawardee_lookup, receipt_ids_to_keep):
     lookup columns from the subawardee lookup table. It only includes rows
     that are in the receipt_ids_to_keep list.
 
+    The rows are filtered first, so the subawardees of returned, superseded
+    and "Other" submissions are never cleaned up or looked up. The lookup
+    columns are mapped from the lookup table indexed on its key rather than
+    merged.
+
     :param df: Subawardee data frame to process
     :type df: <pd.DataFrame>
-    :param subawardee_lookup: Lookup data frame
+    :param subawardee_lookup: Lookup data frame, one row per SubAwdCultSpecf
     :type subawardee_lookup: <pd.DataFrame>
     :param receipt_ids_to_keep: List of rpt-receipt-ids to filter on
     :type receipt_ids_to_keep: <List<str>>
@@ -192,66 +931,74 @@ def process_subawardee_data(df, subawardee_lookup, receipt_ids_to_keep):
     :rtype: <pd.DataFrame>
     """
 
+    subawardee = df["Screen-2"]
+    text_cols = subawardee.columns[subawardee.dtypes == "object"]
+
+    # Filter records by Rpt-Receipt-Id (should only include subawardees that map to grantees in processed grantee
+    # data). Text ids are compared after the same clean up as the grantee data
+    receipt_ids = subawardee["Rpt-Receipt-Id"]
+    if "Rpt-Receipt-Id" in text_cols:
+        receipt_ids = receipt_ids.map(_unescape_text)
+    subawardee = subawardee[receipt_ids.isin(set(receipt_ids_to_keep)).to_numpy()]
+
     # Clean up text columns
-    subawardee_clean_html = df["Screen-2"]
-    subawardee_text_cols = subawardee_clean_html.select_dtypes(include=[
-                                                               "object"])
-    subawardee_clean_html[subawardee_text_cols.columns] = subawardee_text_cols.applymap(
-        lambda x: html.unescape(str(x))
-    ).fillna("")
+    subawardee = subawardee.assign(
+        **dict((c, subawardee[c].map(_unescape_text)) for c in text_cols)
+    )
 
     # Rename columns for FVPSA Funding Type and Primary Services Type
-    subawardee_clean_html.rename(
+    subawardee = subawardee.rename(
         columns={
             "II Text - FVPSA Funding Type,PPR FVPSA Subawardee - Maze Grid Input Row": "Subawardee - FVPSA Funding Type",
             "II Text - Primary Services Type,PPR FVPSA Subawardee - Maze Grid Input Row": "Subawardee - FVPSA Primary Services Type",
         },
-        inplace=True,
     )
 
-    # Use lookup to get predefined categories
-    subawardee_processed = subawardee_clean_html.merge(
-        subawardee_lookup,
-        left_on="Subawardee List - Underserved or culturally- and linguistically-specific population",
-        right_on="SubAwdCultSpecf",
-        how="left",
+    # Use lookup to get predefined categories, every lookup column is mapped on the lookup key
+    lookup_key = subawardee["Subawardee List - Underserved or culturally- and linguistically-specific population"]
+    indexed_lookup = subawardee_lookup.set_index(subawardee_lookup["SubAwdCultSpecf"])
+    subawardee = subawardee.assign(
+        **dict((c, lookup_key.map(indexed_lookup[c])) for c in subawardee_lookup.columns)
     )
 
     # Resolve NA values
-    subawardee_processed = subawardee_processed.replace("nan", np.nan)
-
-    # Filter records by Rpt-Receipt-Id (should only include subawardees that map to grantees in processed grantee data)
-    final_subawardee = subawardee_processed[
-        subawardee_processed["Rpt-Receipt-Id"].isin(receipt_ids_to_keep)
-    ]
+    final_subawardee = subawardee.replace("nan", np.nan)
 
     return final_subawardee
 
 
-def get_removable_cols(lookup_data, long_data):
-    """Get the columns to filter on.
+def get_lookup_variables(columns, lookup_data, year=None):
+    """Get the columns that match the lookup table.
 
-    This function gets the list of columns that can be filtered on to remove
-    empty values, based on the long data. It maps the Meta Name Description
-    to the variable column in the long data to find the set difference.
+    This function maps column names of the processed data to the Meta Name
+    Description of the lookup table, upper casing the names and applying the
+    2024 H-02 question mapping. Only columns that are in the lookup table, or
+    are one of the engineered subawardee funding totals, are kept, every
+    other column would be dropped after the join anyway. The mapping is done
+    once per column name rather than once per long format row.
 
+    :param columns: Column names of the processed data, or the unique values
+        of the "variable" column of long data
+    :type columns: <List<str>>
     :param lookup_data: Lookup sheet from lookup data
     :type lookup_data: <pd.DataFrame>
-    :param long_data: Long data frame of processed data
-    :type long_data: <pd.DataFrame>
+    :param year: PPR version year, the H-02 mapping only applies to 2024
+    :type year: <int>
 
-    :return: List of field names
-    :rtype: <List<str>>
+    :return: Lookup variable name by column name, for the relevant columns
+    :rtype: <Dict<str, str>>
     """
 
-    lookup_set = set(lookup_data["Meta Name Description"].str.upper())
-    lookup_set.add("SUBAWARDEE_SHELTER_TOTAL")  # Subawardee - Shelter Total
-    # Subawardee - Non-Shelter Total
-    lookup_set.add("SUBAWARDEE_NONSHELTER_TOTAL")
-    original_set = {str(x).upper() for x in set(long_data.variable)}
-    removable_cols = [x for x in (set.difference(original_set, lookup_set))]
+    lookup_set = set(lookup_data["Meta Name Description"].dropna())
+    lookup_set.update(SUBAWARDEE_TOTAL_ELEMENTS)
+
+    variables = {}
+    for column in columns:
+        variable = QUESTION_MAPPING_2024.get(column, column) if year == 2024 else column
+        if isinstance(variable, str) and variable.upper() in lookup_set:
+            variables[column] = variable.upper()
 
-    return removable_cols
+    return variables
 
 
 def save_to_final_workbook(df_to_save, sheet_name, historical_workbook=None):
@@ -458,66 +1205,32 @@ def calculate_gender_totals(df, genders):
     df["Shelter Total"] = 0
     df["Non-shelter Total"] = 0
 
-    # Get totals for each gender listed
+    # Get totals for each gender listed, the count columns are numeric so
+    # these are column-wise additions
     for gender in genders:
-        # Column headers to reference
-        shelter_col = f"Shelter {gender}"
-        nonshelter_col = f"Non-shelter {gender}"
-
-        # Initialize to 0
-        df.loc[:, gender] = 0
-
-        # Total clients served for gender = shelter + nonshelter totals
-        df.loc[:, gender] = df.loc[:, [shelter_col, nonshelter_col]].apply(
-            lambda x: (x[0] if pd.notnull(x[0]) else 0)
-            + (x[1] if pd.notnull(x[1]) else 0),
-            axis=1,
-        )
+        # Column headers to reference, missing counts count as 0
+        shelter = df[f"Shelter {gender}"].fillna(0)
+        nonshelter = df[f"Non-shelter {gender}"].fillna(0)
 
-        # Convert 0 counts to NaN
-        df.loc[df[gender] == 0, gender] = np.nan
+        # Total clients served for gender = shelter + nonshelter totals, 0 counts are NaN
+        df[gender] = (shelter + nonshelter).mask(lambda x: x == 0)
 
-        # Total shelter clients served is the sum of shelter totals for all genders
-        df.loc[pd.notna(df[shelter_col]), "Shelter Total"] += df.loc[
-            pd.notna(df[shelter_col]), shelter_col
-        ]
-
-        # Total non-shelter clients served is the sum of shelter totals for all genders
-        df.loc[pd.notna(df[nonshelter_col]), "Non-shelter Total"] += df.loc[
-            pd.notna(df[nonshelter_col]), nonshelter_col
-        ]
+        # Total shelter and non-shelter clients served are the sums over all genders
+        df["Shelter Total"] += shelter
+        df["Non-shelter Total"] += nonshelter
 
     # Convert 0 shelter and non-shelter totals to NaN
-    df.loc[df["Shelter Total"] == 0, "Shelter Total"] = np.nan
-    df.loc[df["Non-shelter Total"] == 0, "Non-shelter Total"] = np.nan
+    df["Shelter Total"] = df["Shelter Total"].mask(lambda x: x == 0)
+    df["Non-shelter Total"] = df["Non-shelter Total"].mask(lambda x: x == 0)
 
     return df
 
 
-def calculate_total_funds(subawardee_df, state_df, cols_to_merge):
-    """Calculate total subawardee funds by state.
-
-    Calculate the total funding amount by adding subawardee funding amounts
-    for each state and year. Shelter and nonshelter columns are renamed to
-    SUBAWARDEE_SHELTER_TOTAL and SUBAWARDEE_NONSHELTER_TOTAL. This function
-    appends the final subawardee shelter type funding totals to the state
-    grantee data.
-
-    :param subawardee_df: Data frame of processed subawardee data
-    :type subawardee_df: <pd.DataFrame>
-    :param state_df: Data frame of processed state grantee data
-    :type state_df: <pd.DataFrame>
-    :param cols_to_merge: List of column names to merge data frames on
-    :type cols_to_merge: List of <str>
-
-    :return: Data frame of state grantee data with total subawardee funding
-        amounts appended
-    :rtype: <pd.DataFrame>
-    """
+def _get_state_subawardees(subawardee_df):
+    """Get the state subawardee rows with a standardized ShelterType column."""
 
-    # Only states fill out the subawardee portion of the PPR
-    new_subawardee_df = subawardee_df.copy(
-        deep=True).query("GranteeTypeTxt == 'State'")
+    # Only states fill out the subawardee portion of the PPR, copied as the ShelterType column is added to it
+    new_subawardee_df = subawardee_df.query("GranteeTypeTxt == 'State'").copy()
 
     # Standardize the Shelter Type field
     shelter_index = (
@@ -527,13 +1240,13 @@ def calculate_total_funds(subawardee_df, state_df, cols_to_merge):
     new_subawardee_df["ShelterType"] = np.where(
         shelter_index, "Shelter", "Non-Shelter")
 
-    # Join state subawardee data to state grantee data
-    new_states_processed = state_df.merge(
-        new_subawardee_df, how="left", on=cols_to_merge
-    )
+    return new_subawardee_df
 
-    # Create total shelter and nonshelter funds for each year and state:
-    shelter_compare = (
+
+def _sum_shelter_types(new_subawardee_df):
+    """Total the subawardee funds of each shelter type by year, state and program."""
+
+    return (
         new_subawardee_df.groupby(["Fy", "PostalCode", "ProgAcronym", "ShelterType"])[
             "Subawardee List - FVPSA Funding Amount"
         ]
@@ -549,15 +1262,147 @@ def calculate_total_funds(subawardee_df, state_df, cols_to_merge):
         )
     )
 
+
+def get_subawardee_totals(subawardee_df):
+    """Get the total shelter and nonshelter subawardee funds of each state.
+
+    :param subawardee_df: Data frame of processed subawardee data
+    :type subawardee_df: <pd.DataFrame>
+
+    :return: Data frame of the SUBAWARDEE_SHELTER_TOTAL and
+        SUBAWARDEE_NONSHELTER_TOTAL funding amounts by Fy, PostalCode and
+        ProgAcronym
+    :rtype: <pd.DataFrame>
+    """
+
+    return _sum_shelter_types(_get_state_subawardees(subawardee_df))
+
+
+def get_subawardee_rollup(subawardee_df):
+    """Get the funding of each subawardee, by shelter type, rural designation and culturally specific category.
+
+    Rows without a subawardee name or with no funding are dropped, and the
+    funding amounts are summed over the <SUBAWARDEE_ROLLUP_COLUMNS>, so the
+    subawardee reports read this table instead of rebuilding it on every
+    render. Only CultSpec2 is used, whether the subawardee serves a mapped
+    culturally specific or underserved category, and a missing CultSpec2 is
+    "".
+
+    :param subawardee_df: Data frame of processed subawardee data
+    :type subawardee_df: <pd.DataFrame>
+
+    :return: Data frame of the "Subawardee Funding" of each subawardee by
+        the <SUBAWARDEE_ROLLUP_COLUMNS>, sorted on them
+    :rtype: <pd.DataFrame>
+    """
+
+    amount = subawardee_df["Subawardee List - FVPSA Funding Amount"]
+    funded = subawardee_df[
+        subawardee_df["Subawardee List - Subawardee Name"].notna()
+        & amount.notna()
+        & (amount != 0)
+    ]
+    funded = funded.assign(CultSpec2=funded["CultSpec2"].fillna(""))
+
+    return (
+        funded.groupby(list(SUBAWARDEE_ROLLUP_COLUMNS), dropna=False)[
+            "Subawardee List - FVPSA Funding Amount"
+        ]
+        .sum()
+        .reset_index(name="Subawardee Funding")
+        .rename(columns=SUBAWARDEE_ROLLUP_COLUMNS)
+    )
+
+
+def get_subawardee_counts(subawardee_rollup):
+    """Get the number of distinct subawardees and their funding by year and program.
+
+    A subawardee listed under several shelter types, rural designations or
+    culturally specific categories is counted once.
+
+    :param subawardee_rollup: Subawardee funding rollup, see
+        <get_subawardee_rollup>
+    :type subawardee_rollup: <pd.DataFrame>
+
+    :return: Data frame of the "Total Subawardees" and "Total Subawardee
+        Funding" by Fy and ProgAcronym
+    :rtype: <pd.DataFrame>
+    """
+
+    subawardees = (
+        subawardee_rollup.groupby(SUBAWARDEE_ID_COLUMNS, dropna=False)["Subawardee Funding"]
+        .sum()
+        .reset_index()
+    )
+
+    return (
+        subawardees.groupby(["Fy", "ProgAcronym"], dropna=False)
+        .agg(
+            **{
+                "Total Subawardees": ("Subawardee Funding", "size"),
+                "Total Subawardee Funding": ("Subawardee Funding", "sum"),
+            }
+        )
+        .reset_index()
+    )
+
+
+def calculate_total_funds(subawardee_df, state_df, cols_to_merge, aggregate_only=False, totals=None):
+    """Calculate total subawardee funds by state.
+
+    Calculate the total funding amount by adding subawardee funding amounts
+    for each state and year. Shelter and nonshelter columns are renamed to
+    SUBAWARDEE_SHELTER_TOTAL and SUBAWARDEE_NONSHELTER_TOTAL. This function
+    appends the final subawardee shelter type funding totals to the state
+    grantee data.
+
+    By default every subawardee row is also joined onto its state row, which
+    repeats the state row once per subawardee. With <aggregate_only> only
+    the totals are joined, one row per state submission. The subawardee
+    detail is kept in its own sheet either way.
+
+    :param subawardee_df: Data frame of processed subawardee data
+    :type subawardee_df: <pd.DataFrame>
+    :param state_df: Data frame of processed state grantee data
+    :type state_df: <pd.DataFrame>
+    :param cols_to_merge: List of column names to merge data frames on
+    :type cols_to_merge: List of <str>
+    :param aggregate_only: Only join the funding totals, not the subawardee
+        rows
+    :type aggregate_only: <bool>
+    :param totals: Funding totals from <get_subawardee_totals>, for when
+        <subawardee_df> only holds some of the states. Default is the totals
+        of <subawardee_df>
+    :type totals: <pd.DataFrame>
+
+    :return: Data frame of state grantee data with total subawardee funding
+        amounts appended
+    :rtype: <pd.DataFrame>
+    """
+
+    new_subawardee_df = _get_state_subawardees(subawardee_df)
+
+    # Join state subawardee data to state grantee data
+    if aggregate_only:
+        new_states_processed = state_df
+    else:
+        new_states_processed = state_df.merge(
+            new_subawardee_df, how="left", on=cols_to_merge
+        )
+
+    # Create total shelter and nonshelter funds for each year and state:
+    if totals is None:
+        totals = _sum_shelter_types(new_subawardee_df)
+
     # Merge total shelter/non-shelter funding amounts back onto states data frame
     new_states_processed = new_states_processed.merge(
-        shelter_compare, how="left", on=["Fy", "PostalCode", "ProgAcronym"]
+        totals, how="left", on=["Fy", "PostalCode", "ProgAcronym"]
     )
 
     return new_states_processed
 
 
-def join_on_meta_name_desc(long_data, meta_name_df, year=None):
+def join_on_meta_name_desc(long_data, meta_name_df, year=None, keep_columns=()):
     """Join to lookup table.
 
     This function takes the long format processed grantee data and merges it
@@ -572,6 +1417,11 @@ def join_on_meta_name_desc(long_data, meta_name_df, year=None):
     :param meta_name_df: Data frame of the lookup sheet that contains the
         "Meta Name Description" column, to be merged on the long_data
     :type meta_name_df: <pd.DataFrame>
+    :param year: PPR version year, the H-02 mapping only applies to 2024
+    :type year: <int>
+    :param keep_columns: Other columns of <long_data> to keep at the end of
+        the subset
+    :type keep_columns: List of <str>
 
     :return: Data frame of merged data, with empty values removed, a new
         Element column, and subset to only the relevant columns
@@ -579,19 +1429,13 @@ def join_on_meta_name_desc(long_data, meta_name_df, year=None):
     """
 
     print("Unique variables in long_data before merge:", long_data["variable"].unique())
-    if year == 2024:
-        # Only apply this mapping in 2024
-        question_mapping = {
-            "H-02 What does the FVPSA grant allow you to do that you wouldn¿t be able to do without this funding?":
-                "H-02 WHAT DOES THE FVPSA GRANT ALLOW YOU TO DO THAT YOU WOULDN¿T BE ABLE TO DO WITHOUT THIS FUNDING?...49",
-            "H-02 What does the FVPSA grant allow you to do that you wouldn¿t be able to do without this funding?.1":
-                "H-02 WHAT DOES THE FVPSA GRANT ALLOW YOU TO DO THAT YOU WOULDN¿T BE ABLE TO DO WITHOUT THIS FUNDING?...50",
-        }
-        long_data['variable'] = long_data['variable'].replace(question_mapping)
 
+    # Only keep the variables in the lookup table, with the 2024 mapping applied and upper cased
+    variables = get_lookup_variables(long_data["variable"].unique(), meta_name_df, year=year)
+    long_data = long_data[long_data["variable"].isin(variables.keys())]
+    long_data = long_data.assign(variable=long_data["variable"].map(variables))
 
     # Join the long data on the lookup table meta name description
-    long_data.variable = long_data.variable.str.upper()
     all_long_data = long_data.merge(
         meta_name_df,
         how="left",
@@ -599,26 +1443,14 @@ def join_on_meta_name_desc(long_data, meta_name_df, year=None):
         right_on=["Meta Name Description"],
     ).drop(columns="Meta Name Description")
 
-
-    # Grab columns that are in element (from lookup table), but not in variable (from long data)
-    # This only grabs the relevant variables to include based on the lookup table
-    removable_cols = get_removable_cols(meta_name_df, all_long_data)
-
-
     # Add the engineered SUBAWARDEE_SHELTER_TOTAL columns to the Element column (not currently included in lookup table)
-    subawardee_shelter_index = all_long_data.variable.isin(
-        ["SUBAWARDEE_SHELTER_TOTAL", "SUBAWARDEE_NONSHELTER_TOTAL"]
-    )
+    subawardee_shelter_index = all_long_data.variable.isin(SUBAWARDEE_TOTAL_ELEMENTS)
     all_long_data.loc[subawardee_shelter_index, "Element"] = all_long_data.loc[
         subawardee_shelter_index, "variable"
     ]
 
     # Drop empty values and clean up column names
-    all_long_data = (
-        all_long_data[~all_long_data.variable.str.upper().isin(removable_cols)]
-        .dropna(subset=["Element"])
-        .drop(columns=["variable"])
-    )
+    all_long_data = all_long_data.dropna(subset=["Element"]).drop(columns=["variable"])
 
     all_long_data = all_long_data[
         [
@@ -635,6 +1467,7 @@ def join_on_meta_name_desc(long_data, meta_name_df, year=None):
             "Element",
             "value",
         ]
+        + list(keep_columns)
     ].rename(
         columns={
             "value": "Value",
@@ -648,6 +1481,187 @@ def join_on_meta_name_desc(long_data, meta_name_df, year=None):
     return all_long_data
 
 
+def get_value_kind(values):
+    """Get the kind of values stored in a column.
+
+    :param values: Column to get the kind of
+    :type values: <pd.Series>
+
+    :return: "num", "date" or "text"
+    :rtype: <str>
+    """
+
+    if pd.api.types.is_bool_dtype(values):
+        return "text"
+    if pd.api.types.is_numeric_dtype(values):
+        return "num"
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return "date"
+
+    # Dates are converted to <date> objects with "" for missing dates
+    values = values[values.notna() & (values != "")]
+    inferred = pd.api.types.infer_dtype(values, skipna=True)
+    if inferred in ["integer", "floating", "mixed-integer-float", "decimal"]:
+        return "num"
+    if inferred in ["date", "datetime"]:
+        return "date"
+
+    return "text"
+
+
+def cast_values(values, kind):
+    """Cast text values back to their kind.
+
+    :param values: Values to cast
+    :type values: <pd.Series>
+    :param kind: "num", "date" or "text"
+    :type kind: <str>
+
+    :return: Cast values
+    :rtype: <pd.Series>
+    """
+
+    if kind == "num":
+        return pd.to_numeric(values, errors="coerce")
+    if kind == "date":
+        return pd.to_datetime(values, errors="coerce").dt.date
+
+    return values
+
+
+def get_element_kinds(long_data, field_names_conversion=None):
+    """Get the kind of value each Element of the long format data holds.
+
+    The kind comes from the "Data Type" column of the crosswalk sheet when
+    it has one (see <DATA_TYPE_KINDS>), the subawardee funding totals are
+    numbers, and every other Element gets the kind of its values, see
+    <get_value_kind>.
+
+    :param long_data: Long format data with the Element and Value columns
+    :type long_data: <pd.DataFrame>
+    :param field_names_conversion: Crosswalk sheet
+    :type field_names_conversion: <pd.DataFrame>
+
+    :return: "num", "date" or "text" by Element
+    :rtype: <Dict<str, str>>
+    """
+
+    element_kinds = dict((element, "num") for element in SUBAWARDEE_TOTAL_ELEMENTS)
+    if field_names_conversion is not None and "Data Type" in field_names_conversion.columns:
+        declared = field_names_conversion.dropna(subset=["Element", "Data Type"])
+        for element, data_type in zip(declared["Element"], declared["Data Type"]):
+            kind = DATA_TYPE_KINDS.get(str(data_type).strip().lower())
+            if kind is not None:
+                element_kinds[element] = kind
+
+    undeclared = long_data[~long_data["Element"].isin(element_kinds.keys())]
+    for element, values in undeclared.groupby("Element", sort=False)["Value"]:
+        element_kinds[element] = get_value_kind(values.astype(object))
+
+    return element_kinds
+
+
+def split_value_kinds(long_data, element_kinds):
+    """Store the long format Value column as one typed column per kind.
+
+    The object Value column mixes counts, amounts, dates and narrative
+    text. Each value is moved to the column of its Element's kind, see
+    <VALUE_KIND_COLUMNS>: numbers to a float column, dates to a datetime
+    column and text to an object column. Values that don't convert to
+    their Element's kind (e.g. "" for a missing count) are kept as they are
+    in the text column, so <combine_value_kinds> gives back the same values.
+
+    :param long_data: Long format data with the Element and Value columns
+    :type long_data: <pd.DataFrame>
+    :param element_kinds: Kind of value by Element, see <get_element_kinds>
+    :type element_kinds: <Dict<str, str>>
+
+    :return: Long format data with the typed value columns instead of Value
+    :rtype: <pd.DataFrame>
+    """
+
+    value = long_data["Value"].astype(object)
+    kinds = long_data["Element"].map(element_kinds)
+
+    num = pd.to_numeric(value.where(kinds == "num"), errors="coerce").astype("float64")
+
+    # Only dates and date strings are converted, numbers would be read as epoch times
+    date_like = (kinds == "date").to_numpy(copy=True)
+    date_like[date_like] = [isinstance(x, (date, str)) for x in value[date_like]]
+    date_values = pd.to_datetime(value.where(date_like), errors="coerce", format="mixed")
+
+    text = value.where(value.notna() & num.isna() & date_values.isna())
+
+    return long_data.drop(columns="Value").assign(
+        **{
+            VALUE_KIND_COLUMNS["num"]: num,
+            VALUE_KIND_COLUMNS["date"]: date_values,
+            VALUE_KIND_COLUMNS["text"]: text,
+        }
+    )
+
+
+def combine_value_kinds(long_data):
+    """Combine the typed value columns back into one object Value column.
+
+    This is the inverse of <split_value_kinds>, used to save the long format
+    data in the layout of the previously processed files.
+
+    :param long_data: Long format data with the typed value columns
+    :type long_data: <pd.DataFrame>
+
+    :return: Long format data with the Value column instead
+    :rtype: <pd.DataFrame>
+    """
+
+    value_columns = list(VALUE_KIND_COLUMNS.values())
+    value = long_data[VALUE_KIND_COLUMNS["text"]].astype(object)
+    for kind in ["num", "date"]:
+        typed = long_data[VALUE_KIND_COLUMNS[kind]]
+        value = value.where(typed.isna(), typed.astype(object))
+
+    position = long_data.columns.get_loc(value_columns[0])
+    combined = long_data.drop(columns=value_columns)
+    combined.insert(position, "Value", value)
+
+    return combined
+
+
+def get_label_kinds(labelled_data):
+    """Get the kind of value each wide format Label holds.
+
+    A Label holds one kind when all of its values, leaving out "" and
+    missing values, are in the same typed value column.
+
+    :param labelled_data: Long format data with the typed value columns
+        and the crosswalk Label column
+    :type labelled_data: <pd.DataFrame>
+
+    :return: "num", "date" or "text" by Label, None for a Label that holds
+        more than one kind
+    :rtype: <Dict<str, str>>
+    """
+
+    present = pd.DataFrame(
+        dict(
+            (kind, labelled_data[column].notna().to_numpy())
+            for kind, column in VALUE_KIND_COLUMNS.items()
+        )
+    )
+    present["text"] &= (labelled_data[VALUE_KIND_COLUMNS["text"]] != "").to_numpy()
+    present = present.groupby(labelled_data["Label"].to_numpy()).any()
+
+    label_kinds = {}
+    for label, row in present.iterrows():
+        kinds = list(row.index[row.to_numpy()])
+        if len(kinds) > 1:
+            label_kinds[label] = None
+        else:
+            label_kinds[label] = kinds[0] if len(kinds) == 1 else "text"
+
+    return label_kinds
+
+
 def service_outcome_survey_type_helper(
         outcome_dat, xw_dat, outcome_columns, id_cols, survey_type_ind, survey_type_str, safety=False):
     """Transform Service Outcome Data by Service Type
@@ -742,10 +1756,10 @@ def service_outcome_transform(processed_dat, xw_dat):
     :rtype: <pd.DataFrame>
     """
 
-    dat = processed_dat.copy()
-
-    # Identify service outcome columns
-    dat.columns = map(str.upper, dat.columns)
+    # Identify service outcome columns, renaming doesn't copy the data
+    dat = processed_dat.set_axis(
+        [str.upper(c) for c in processed_dat.columns], axis="columns"
+    )
     outcome_columns = list(xw_dat.loc[xw_dat.Group_Description ==
                                       "Service Outcome", "Meta Name Description"])
     # Unique identifier columns
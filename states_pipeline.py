@@ -0,0 +1,1299 @@
+import argparse
+import html
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from openpyxl.utils.dataframe import dataframe_to_rows
+
+import catalog as ct
+import coalitions_pipeline as cp
+import duckdb_transforms as dt
+import pipeline
+import processing_functions as pf
+import xlsx_writer as xw
+
+
+ALL_STATES = sorted(
+    "PA MS PR LA NM AZ FL AK OK HI KS DE IN ND MT WA RI KY TN OH IA WV ID GA WI MD NE VT ME VA TX CA UT NC NJ NV "
+    "MI MN OR NY DC SD WY CO MA IL CT AR MO NH SC AL".split()
+)
+
+GENDERS = ["Men", "Women", "Children", "Not Specified"]
+
+# Columns that keep the order of the long format rows when they're transformed in shards: the grantee
+# type part, the melted variable, the grantee row and the joined subawardee row
+SHARD_ORDER_COLUMNS = ["__part", "__var", "__row", "__sub"]
+
+# Leading Screen-1 columns that identify a submission, Screen-3 is joined to Screen-1 on them
+ID_COLUMN_COUNT = 43
+
+# Identifier columns the processing uses by name, they must be in the leading Screen-1 columns
+KEY_COLUMNS = [
+    "Screen-Name",
+    "Rpt-Receipt-Id",
+    "Fy",
+    "PostalCode",
+    "ProgAcronym",
+    "RptEin",
+    "EIN",
+    "GranteeTypeTxt",
+    "CodeTxt",
+    "RevSeqNumber",
+    "SubmitDate",
+]
+
+# Settings that differ between the PPR versions of the States & Tribes data
+PPR_VERSIONS = {
+    # fvps_sf-ppr_state_ver__6 (FY2018-2023)
+    "2023": {
+        "label": "2023",
+        "join_year": 2023,
+        # Find all the versions of the H-02 column that exist and replace with the correct column name
+        "duplicate_column_replacements": {
+            "H-02 What does the FVPSA grant allow you to do that you wouldn¿t be able to do without this "
+            "funding?": [
+                "H-03 Describe any efforts supported in whole or in part by your FVPSA grant to meet the "
+                "needs of underserved populations in your community, including populations underserved "
+                "because of ethnic, racial, cultural or language diversity, sexual orientation or gender "
+                "identity or geographic isolation. Describe any ongoing challenges."
+            ]
+        },
+    },
+    # fvps_sf-ppr_state_ver__8 (FY2024-2027)
+    "2024": {
+        "label": "2024 States",
+        "join_year": 2024,
+        "duplicate_column_replacements": None,
+    },
+}
+
+
+def read_inputs(raw_data_filename, crosswalk_filename, ppr_settings, run_options):
+    """Stage: read the raw OLDC data and the crosswalk sheets."""
+
+    print("Reading in data files...")
+    (
+        raw_data,
+        lookup_data_based,
+        subawardee_lookup,
+        field_names_conversion,
+        coercion_report,
+    ) = pf.read_data(
+        raw_data_filename,
+        crosswalk_filename,
+        engine=run_options["excel_engine"],
+        raw_columns=run_options["raw_columns"],
+        year=ppr_settings["join_year"],
+        duplicate_columns=(ppr_settings["duplicate_column_replacements"] or {}).keys(),
+    )
+    print("Reading in data files - COMPLETE")
+
+    return raw_data, lookup_data_based, subawardee_lookup, field_names_conversion, coercion_report
+
+
+def prescan_states_inputs(ppr_version, raw_data_filename, crosswalk_filename, excel_engine="openpyxl"):
+    """Check the headers of a raw States & Tribes export against the expected layout.
+
+    Only the sheet names and header rows of the export are read, so schema
+    drift is found in seconds rather than deep into a run. The export must
+    have the sheets in <pf.STATES_RAW_SHEETS>, at least <ID_COLUMN_COUNT>
+    leading Screen-1 identifier columns including <KEY_COLUMNS>, all of
+    which Screen-3 is joined on, the Screen-2 subawardee columns of the
+    subawardee rollup (see <pf.get_subawardee_rollup>), a column for every
+    Meta Name Description of the lookup and crosswalk sheets, and only the
+    duplicated columns the PPR version renames.
+
+    :param ppr_version: Key of <PPR_VERSIONS> to check against
+    :type ppr_version: <str>
+    :param raw_data_filename: File path of the raw OLDC data
+    :type raw_data_filename: <str>
+    :param crosswalk_filename: File path of the crosswalk for this version
+    :type crosswalk_filename: <str>
+    :param excel_engine: Engine to read the workbooks with, one of
+        <pf.EXCEL_ENGINES>
+    :type excel_engine: <str>
+
+    :return: Schema drift report, see <pf.get_schema_drift>
+    :rtype: <pd.DataFrame>
+    """
+
+    ppr_settings = PPR_VERSIONS[ppr_version]
+    year = ppr_settings["join_year"]
+    headers = pf.read_headers(raw_data_filename, engine=excel_engine)
+
+    rows = pf.get_missing_columns("(workbook)", "sheet", pf.STATES_RAW_SHEETS, list(headers.keys()))
+
+    if "Screen-1" in headers:
+        id_cols = headers["Screen-1"][:ID_COLUMN_COUNT]
+        if len(id_cols) < ID_COLUMN_COUNT:
+            rows.append(["Screen-1", "identifier count", str(ID_COLUMN_COUNT), str(len(id_cols))])
+        rows += pf.get_missing_columns("Screen-1", "identifier", KEY_COLUMNS, id_cols)
+        if "Screen-3" in headers:
+            rows += pf.get_missing_columns(
+                "Screen-3", "identifier", [c for c in id_cols if c != "Screen-Name"], headers["Screen-3"]
+            )
+
+    # CultSpec2 comes from the subawardee lookup, not the export
+    if "Screen-2" in headers:
+        subawardee_cols = [c for c in pf.SUBAWARDEE_ROLLUP_COLUMNS if c != "CultSpec2"]
+        rows += pf.get_missing_columns(
+            "Screen-2", "subawardee", subawardee_cols + ["Subawardee List - FVPSA Funding Amount"], headers["Screen-2"]
+        )
+
+    # Every Meta Name Description is matched as the lookup join matches it, see <pf.get_lookup_variables>
+    lookup_data = pf.read_excel_sheet(crosswalk_filename, "lookup", engine=excel_engine)
+    field_names_conversion = pf.read_excel_sheet(crosswalk_filename, "crosswalk", engine=excel_engine)
+    names = pd.concat(
+        [lookup_data["Meta Name Description"], field_names_conversion["Meta Name Description"]]
+    )
+    names = list(dict.fromkeys(n for n in names.dropna().str.upper() if n not in pf.SUBAWARDEE_TOTAL_ELEMENTS))
+    variables = [
+        (pf.QUESTION_MAPPING_2024.get(c, c) if year == 2024 else c).upper()
+        for sheet in pf.STATES_RAW_SHEETS
+        for c in headers.get(sheet, [])
+        if isinstance(c, str)
+    ]
+    rows += pf.get_missing_columns("(raw sheets)", "crosswalk", names, variables)
+
+    # Duplicated columns are only expected where the version renames them
+    replacements = ppr_settings["duplicate_column_replacements"] or {}
+    for sheet in [s for s in pf.STATES_RAW_SHEETS if s in headers]:
+        expected = list(pf.QUESTION_MAPPING_2024.keys()) if year == 2024 else []
+        for substring, replacement in replacements.items():
+            duplicates = [c for c in headers[sheet] if isinstance(c, str) and substring in c and c != substring]
+            expected += duplicates[: len(replacement)]
+        for column in pf.find_duplicate_columns(headers[sheet], expected=expected):
+            rows.append([sheet, "duplicate", None, column])
+
+    return pf.get_schema_drift(rows)
+
+
+def prepare_lookups(raw_lookup_data, raw_field_names_conversion):
+    """Stage: upper case the lookup and crosswalk join keys."""
+
+    # Assign new frames, the raw sheets are read by other stages
+    lookup_data = raw_lookup_data.assign(
+        Element=raw_lookup_data.Element.str.upper(),
+        **{"Meta Name Description": raw_lookup_data["Meta Name Description"].str.upper()},
+    )
+    field_names_conversion = raw_field_names_conversion.assign(
+        Element=raw_field_names_conversion.Element.str.upper(),
+        **{"Meta Name Description": raw_field_names_conversion["Meta Name Description"].str.upper()},
+    )
+    field_names_conversion = field_names_conversion.dropna(
+        subset=["Meta Name Description", "Note"], how="all"
+    )
+
+    return lookup_data, field_names_conversion
+
+
+def prepare_raw_data(raw_data):
+    """Stage: light processing on the raw data and the identifier columns."""
+
+    # Get columns needed to join on for processing
+    first_43_cols = list(raw_data["Screen-1"].columns[0:ID_COLUMN_COUNT])
+    first_43_cols.remove("Screen-Name")
+
+    # Light processing on raw data
+    processed_raw_data = pf.process_raw_data(raw_data)
+
+    return processed_raw_data, first_43_cols
+
+
+def archive_processed_data(processed_data_filename, string_date):
+    """Stage: back up the current processed file to the Archive directory.
+
+    Make copy of old processed data and put in Archive If there already
+    exists a processed data file, append _Archived_<timestamp> to the name to
+    store as a legacy file create historical data backup before we overwrite
+    it (backup HistoricalPPR.xlsx regardless if input file was a backup)
+    """
+
+    backup_file_name = (
+        f"{processed_data_filename.replace('.xlsx', '')}_Archived_{string_date}.xlsx"
+    )
+
+    # Create Archive directory if it doesn't exist
+    if not os.path.exists(processed_data_filename):
+        return None
+
+    if not os.path.exists(
+        os.path.join(os.path.dirname(processed_data_filename), "Archive")
+    ):
+        print("Creating Archive directory to store backup processed data in...")
+        os.mkdir(os.path.join(os.path.dirname(processed_data_filename), "Archive"))
+
+    backup_file_path = os.path.join(
+        os.path.dirname(backup_file_name),
+        "Archive",
+        os.path.basename(backup_file_name),
+    )
+
+    print("Saving current processed file to " + backup_file_path + "...")
+
+    # Create backup file from existing historical file
+    shutil.copy(processed_data_filename, backup_file_path)
+
+    return backup_file_path
+
+
+def filter_grantee_data(processed_raw_data, first_43_cols, ppr_settings):
+    """Stage: join screens 1 and 3 and keep one submission per grantee."""
+
+    print(f"Processing {ppr_settings['label']} OLDC data...")
+
+    # Join screens 1 and screens 3 for grantee data
+    processed_data = processed_raw_data["Screen-1"].merge(
+        processed_raw_data["Screen-3"], on=first_43_cols
+    )
+
+    # Make sure data types match
+    date_columns = processed_data.select_dtypes(include=["datetime"])
+    processed_data[date_columns.columns] = date_columns.map(
+        lambda x: x.date()
+    ).fillna("")
+    text_columns = processed_data.select_dtypes(include=["object"])
+    processed_data[text_columns.columns] = text_columns.map(
+        lambda x: html.unescape(str(x))
+    )
+
+    # Remove brackets and spaces from EIN for ease of use
+    processed_data["old_EIN"] = processed_data.EIN
+    processed_data["EIN"] = processed_data.RptEin.apply(pf.parse_ein)
+
+    # Filter out rows that have been returned for edits
+    processed_data_filtered = processed_data.loc[
+        ~processed_data.CodeTxt.isin(["Submission Returned by CO"])
+    ]
+
+    # If a grantee has multiple rows, only keep the last RevSeqNumber
+    processed_data_filtered = processed_data_filtered.loc[
+        processed_data_filtered.groupby(["Fy", "EIN", "ProgAcronym"])[
+            "RevSeqNumber"
+        ].transform("max")
+        == processed_data_filtered.RevSeqNumber
+    ]
+
+    # Exclude any grantees listed as "other"
+    processed_data_filtered = processed_data_filtered.loc[
+        processed_data_filtered.GranteeTypeTxt != "Other"
+    ]
+
+    # If state grantee has two EINs for same program and year,
+    # choose submission with the latest submit date, otherwise, choose the first row
+    grouped_states = processed_data_filtered[processed_data_filtered['GranteeTypeTxt']=='State'].groupby(['PostalCode', 'Fy', 'ProgAcronym'])
+    # Get max submit date for each grouped state, merge back onto state data to get rest of data for each state
+    # If submit date is the same for a duplicate row, max() chooses the first one based on row rank
+    max_states = grouped_states.SubmitDate.max().reset_index().merge(
+        processed_data_filtered[processed_data_filtered['GranteeTypeTxt']=='State'],
+        how="left",
+        on=['PostalCode', 'Fy', 'ProgAcronym', 'SubmitDate']
+        )
+    # Add tribes back in
+    processed_data_filtered = pd.concat([max_states, processed_data_filtered[processed_data_filtered.GranteeTypeTxt == "Tribe"]])
+
+    if ppr_settings["duplicate_column_replacements"] is not None:
+        processed_data_filtered = pf.replace_duplicate_columns(
+            df=processed_data_filtered,
+            replacements=ppr_settings["duplicate_column_replacements"],
+        )
+
+    # Convert all nans to empty
+    processed_data_filtered = processed_data_filtered.replace("nan", np.nan)
+
+    return processed_data, processed_data_filtered
+
+
+def service_outcome(processed_data_filtered, field_names_conversion):
+    """Stage: service outcome data (Section G)."""
+
+    return pf.service_outcome_transform(processed_data_filtered, field_names_conversion)
+
+
+def subawardee(processed_raw_data, subawardee_lookup, processed_data_filtered):
+    """Stage: aggregate state data for subawardees."""
+
+    print("Processing subawardee data...")
+    states_processed_data = processed_data_filtered[
+        processed_data_filtered.GranteeTypeTxt == "State"
+    ]
+    receipt_ids_to_keep = states_processed_data[
+        "Rpt-Receipt-Id"
+    ]  # Only want subawardees that are in processed data
+    final_subawardee = pf.process_subawardee_data(
+        processed_raw_data, subawardee_lookup, receipt_ids_to_keep
+    )
+    print("Processing subawardee data - COMPLETE")
+
+    return final_subawardee
+
+
+def subawardee_rollups(final_subawardee):
+    """Stage: subawardee funding rollup and distinct subawardee counts for the subawardee reports."""
+
+    subawardee_rollup = pf.get_subawardee_rollup(final_subawardee)
+
+    return subawardee_rollup, pf.get_subawardee_counts(subawardee_rollup)
+
+
+def _melt_lookup_columns(df, lookup_data, year, id_cols=dt.LONG_ID_COLS):
+    """Melt the columns of <df> that match the lookup table to long format."""
+
+    value_vars = list(pf.get_lookup_variables(df.columns.drop(id_cols), lookup_data, year))
+    # Melt as object so the values keep their types, as when every column is melted
+    return (
+        df[id_cols + value_vars]
+        .astype(dict((c, object) for c in value_vars))
+        .melt(id_vars=id_cols, value_vars=value_vars)
+    )
+
+
+def get_shards(keys, n_shards):
+    """Assign every state and tribe to a shard.
+
+    The PostalCodes are handed out largest first to the shard with the
+    fewest rows, so the shards are about the same size and the assignment
+    only depends on the data.
+
+    :param keys: PostalCode of every grantee row
+    :type keys: <pd.Series>
+    :param n_shards: Number of shards
+    :type n_shards: <int>
+
+    :return: Shard number of every row of <keys>
+    :rtype: <pd.Series>
+    """
+
+    keys = keys.fillna("")
+    sizes = keys.value_counts().sort_index(kind="stable").sort_values(ascending=False, kind="stable")
+    loads = [0] * n_shards
+    assignment = {}
+    for key, size in sizes.items():
+        shard = loads.index(min(loads))
+        assignment[key] = shard
+        loads[shard] += size
+
+    return keys.map(assignment)
+
+
+_shared_shard_args = {}
+
+
+def _init_shard_worker(shared, copy_on_write):
+    """Store the arguments shared by every shard in a worker process.
+
+    The worker takes the pandas Copy-on-Write setting of the main process.
+    """
+
+    global _shared_shard_args
+    _shared_shard_args = shared
+    pd.set_option("mode.copy_on_write", copy_on_write)
+
+
+def _call_shard_func(func, frames):
+    """Call a per-shard function with the shared arguments of the worker."""
+
+    return func(*frames, **_shared_shard_args)
+
+
+def map_shards(func, shards, shared, max_workers=None):
+    """Apply a function to every shard of the grantee data in a process pool.
+
+    Calls <func(*frames, **shared)> for the data frames of every shard. The
+    shared arguments (e.g. the lookup table) are sent to each worker process
+    once instead of once per shard.
+
+    :param func: Module level function to apply
+    :type func: <Callable>
+    :param shards: Data frames of every shard
+    :type shards: <List<Tuple>>
+    :param shared: Keyword arguments passed to every call
+    :type shared: <Dict>
+    :param max_workers: Maximum number of workers in the pool
+    :type max_workers: <int>
+
+    :return: Results of every shard, in the order of <shards>
+    :rtype: <List>
+    """
+
+    if len(shards) < 2:
+        return [func(*frames, **shared) for frames in shards]
+
+    pool = ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_shard_worker,
+        initargs=(shared, pd.get_option("mode.copy_on_write")),
+    )
+    with pool:
+        return list(pool.map(_call_shard_func, [func] * len(shards), shards))
+
+
+def _long_format_shard(
+    states_shard,
+    tribes_shard,
+    subawardee_shard,
+    subawardee_totals,
+    first_43_cols,
+    lookup_data,
+    ppr_settings,
+    run_options,
+):
+    """Melt one shard of the grantee data and join it on the lookup sheet.
+
+    The rows keep the <SHARD_ORDER_COLUMNS> to put the shards back in order.
+    """
+
+    states_shard = pf.calculate_total_funds(
+        subawardee_df=subawardee_shard,
+        state_df=states_shard,
+        cols_to_merge=first_43_cols,
+        aggregate_only=run_options["subawardee_join"] == "aggregate",
+        totals=subawardee_totals,
+    )
+
+    id_cols = dt.LONG_ID_COLS + ["__row", "__sub"]
+    all_long_data = []
+    for part, df in enumerate([states_shard, tribes_shard]):
+        if "__sub" not in df:
+            df = df.assign(__sub=np.nan)
+        long_data = _melt_lookup_columns(df, lookup_data, ppr_settings["join_year"], id_cols=id_cols)
+        # Every shard melts the same columns, so the variables come in the same order
+        variables = dict((v, i) for i, v in enumerate(long_data["variable"].unique()))
+        all_long_data.append(long_data.assign(__part=part, __var=long_data["variable"].map(variables)))
+
+    return pf.join_on_meta_name_desc(
+        pd.concat(all_long_data),
+        lookup_data,
+        year=ppr_settings["join_year"],
+        keep_columns=SHARD_ORDER_COLUMNS,
+    )
+
+
+def _sharded_long_format(
+    states_processed_data,
+    tribes_processed_data,
+    final_subawardee,
+    first_43_cols,
+    lookup_data,
+    ppr_settings,
+    run_options,
+):
+    """Melt and join the grantee data in shards of states and tribes.
+
+    The subawardee funding totals are calculated once for every state, then
+    each shard melts and joins its own grantee and subawardee rows. The
+    shards are put back in the row order of the unsharded transform.
+    """
+
+    states_processed_data = states_processed_data.assign(__row=np.arange(len(states_processed_data)))
+    tribes_processed_data = tribes_processed_data.assign(__row=np.arange(len(tribes_processed_data)))
+    final_subawardee = final_subawardee.assign(__sub=np.arange(len(final_subawardee)))
+
+    shard_ids = get_shards(
+        pd.concat([states_processed_data.PostalCode, tribes_processed_data.PostalCode]),
+        run_options["transform_shards"],
+    )
+    states_ids = shard_ids.iloc[:len(states_processed_data)].to_numpy()
+    tribes_ids = shard_ids.iloc[len(states_processed_data):].to_numpy()
+    # Send each subawardee row to the shard of its state
+    state_shards = dict(zip(states_processed_data.PostalCode.fillna(""), states_ids))
+    subawardee_ids = final_subawardee.PostalCode.fillna("").map(state_shards).to_numpy()
+
+    shards = [
+        (
+            states_processed_data[states_ids == shard],
+            tribes_processed_data[tribes_ids == shard],
+            final_subawardee[subawardee_ids == shard],
+        )
+        for shard in sorted(set(shard_ids))
+    ]
+    print(f"Transforming {len(shards)} shards of states and tribes...")
+
+    joined_long_data = pd.concat(
+        map_shards(
+            _long_format_shard,
+            shards,
+            {
+                "subawardee_totals": pf.get_subawardee_totals(final_subawardee),
+                "first_43_cols": first_43_cols,
+                "lookup_data": lookup_data,
+                "ppr_settings": ppr_settings,
+                "run_options": run_options,
+            },
+            max_workers=run_options["max_workers"],
+        )
+    )
+
+    return (
+        joined_long_data.sort_values(SHARD_ORDER_COLUMNS, kind="stable", na_position="first")
+        .drop(columns=SHARD_ORDER_COLUMNS)
+        .reset_index(drop=True)
+    )
+
+
+def long_format(
+    processed_data_filtered,
+    final_subawardee,
+    first_43_cols,
+    lookup_data,
+    field_names_conversion,
+    ppr_settings,
+    run_options,
+):
+    """Stage: long format data joined on the lookup sheet, with typed values."""
+
+    print("Transforming the data to long format...")
+    # Split out states and tribes
+    tribes_processed_data = processed_data_filtered[
+        processed_data_filtered.GranteeTypeTxt == "Tribe"
+    ]
+    states_processed_data = processed_data_filtered[
+        processed_data_filtered.GranteeTypeTxt == "State"
+    ]
+
+    if run_options["transform_shards"] > 1:
+        # Add the subawardee totals, melt and join in shards of states and tribes
+        joined_long_data = _sharded_long_format(
+            states_processed_data,
+            tribes_processed_data,
+            final_subawardee,
+            first_43_cols,
+            lookup_data,
+            ppr_settings,
+            run_options,
+        )
+        return pf.split_value_kinds(
+            joined_long_data, pf.get_element_kinds(joined_long_data, field_names_conversion)
+        )
+
+    # Add total funding amounts by state and year to state data
+    states_processed_data = pf.calculate_total_funds(
+        subawardee_df=final_subawardee,
+        state_df=states_processed_data,
+        cols_to_merge=first_43_cols,
+        aggregate_only=run_options["subawardee_join"] == "aggregate",
+    )
+
+    if run_options["transform_engine"] == "duckdb":
+        # Melt and join on the lookup table as SQL in DuckDB
+        joined_long_data = dt.join_on_meta_name_desc_duckdb(
+            [states_processed_data, tribes_processed_data],
+            lookup_data,
+            year=ppr_settings["join_year"],
+            memory_limit=run_options["duckdb_memory_limit"],
+        )
+    else:
+        # Convert to long format for later merge on lookup table, only melting the
+        # columns that are in the lookup table
+        all_long_data = pd.concat(
+            [
+                _melt_lookup_columns(states_processed_data, lookup_data, ppr_settings["join_year"]),
+                _melt_lookup_columns(tribes_processed_data, lookup_data, ppr_settings["join_year"]),
+            ]
+        )
+
+        # Join on lookup tab of lookup table and subset to relevant columns
+        joined_long_data = pf.join_on_meta_name_desc(
+            all_long_data, lookup_data, year=ppr_settings["join_year"]
+        )
+
+    # Store the values in typed columns, by the kind of value of each Element
+    return pf.split_value_kinds(
+        joined_long_data, pf.get_element_kinds(joined_long_data, field_names_conversion)
+    )
+
+
+def historical_long_format(
+    processed_raw_data, joined_long_data, backup_file_path, field_names_conversion, run_options
+):
+    """Stage: append the new long format data to the historical long data."""
+
+    historical_long_data = pf.process_long_data(
+        processed_raw_data,
+        joined_long_data,
+        backup_file_path,
+        engine=run_options["excel_engine"],
+        field_names_conversion=field_names_conversion,
+    )
+    print("Transforming the data to long format - COMPLETE")
+
+    return historical_long_data
+
+
+def wide_format(
+    joined_long_data, field_names_conversion, processed_data_filtered, run_options
+):
+    """Stage: wide format data with the clean crosswalk labels."""
+
+    print("Transforming the data to wide format...")
+
+    # Join on the crosswalk tab of the lookup table to get the final, clean column names
+    # The cleaned up column names are in the Label field of the crosswalk sheet
+    if run_options["transform_shards"] > 1:
+        # Pivot and add the gender totals in shards of states and tribes
+        historical_wide_data = _sharded_wide_format(
+            joined_long_data, field_names_conversion, run_options
+        )
+    else:
+        if run_options["transform_engine"] == "duckdb":
+            historical_wide_data = dt.pivot_wide_duckdb(
+                joined_long_data,
+                field_names_conversion,
+                memory_limit=run_options["duckdb_memory_limit"],
+            )
+        else:
+            historical_wide_data = _pivot_wide(joined_long_data, field_names_conversion)
+
+        # Add sums for gender and shelter/non-shelter
+        historical_wide_data = pf.calculate_gender_totals(historical_wide_data, GENDERS)
+
+    # Get grantee names from original file
+    historical_wide_data.loc[:, "Grantee Name"] = historical_wide_data.EIN.apply(
+        lambda x: pf.lookup_name_from_ein(EIN=x, df=processed_data_filtered)
+    )
+    print("Transforming the data to wide format - COMPLETE")
+
+    return historical_wide_data
+
+
+def _pivot_wide(joined_long_data, field_names_conversion, label_kinds=None):
+    """Pivot the long format data on the crosswalk labels with pandas.
+
+    Every typed value column is pivoted, and each label takes the column of
+    the kind of value it holds, so number labels are float columns. A label
+    that holds more than one kind keeps its values as objects. Pass the
+    <label_kinds> of all the data to pivot part of it, the labels it doesn't
+    hold are added as empty columns.
+    """
+
+    value_columns = list(pf.VALUE_KIND_COLUMNS.values())
+    labelled_data = joined_long_data.merge(
+        field_names_conversion, how="left", on="Element"
+    ).dropna(subset=["Label"])[dt.WIDE_INDEX_COLS + ["Label"] + value_columns]
+
+    # Pivot each typed column on its own, so the number and date columns keep their dtypes
+    pivoted = dict(
+        (
+            column,
+            labelled_data.pivot(values=column, columns="Label", index=dt.WIDE_INDEX_COLS),
+        )
+        for column in value_columns
+    )
+    index = pivoted[value_columns[0]].index
+
+    if label_kinds is None:
+        label_kinds = pf.get_label_kinds(labelled_data)
+    labels = set(pivoted[value_columns[0]].columns)
+
+    wide_data = {}
+    for label, kind in label_kinds.items():
+        if label not in labels:
+            dtype = labelled_data[pf.VALUE_KIND_COLUMNS[kind]].dtype if kind is not None else object
+            wide_data[label] = pd.Series(np.nan, index=index, dtype=dtype)
+        elif kind is not None:
+            wide_data[label] = pivoted[pf.VALUE_KIND_COLUMNS[kind]][label]
+        else:
+            # Only one of the typed columns has a value in each cell
+            wide_data[label] = pf.combine_value_kinds(
+                pd.DataFrame(dict((column, pivoted[column][label]) for column in value_columns))
+            )["Value"]
+
+    wide_data = pd.DataFrame(wide_data, index=index)
+    wide_data.columns.name = "Label"
+
+    return wide_data.reset_index()
+
+
+def _wide_format_shard(joined_long_shard, field_names_conversion, label_kinds):
+    """Pivot one shard of the long format data and add the gender totals."""
+
+    return pf.calculate_gender_totals(
+        _pivot_wide(joined_long_shard, field_names_conversion, label_kinds), GENDERS
+    )
+
+
+def _sharded_wide_format(joined_long_data, field_names_conversion, run_options):
+    """Pivot the long format data in shards of states and tribes.
+
+    Each label keeps the kind of value it holds in all the data, so the
+    shards have the same columns. The rows are sorted as the unsharded pivot
+    sorts them.
+    """
+
+    labelled_data = joined_long_data.merge(
+        field_names_conversion, how="left", on="Element"
+    ).dropna(subset=["Label"])
+    label_kinds = pf.get_label_kinds(labelled_data)
+
+    shard_ids = get_shards(joined_long_data.State, run_options["transform_shards"]).to_numpy()
+    shards = [(joined_long_data[shard_ids == shard],) for shard in sorted(set(shard_ids))]
+
+    wide_data = (
+        pd.concat(
+            map_shards(
+                _wide_format_shard,
+                shards,
+                {"field_names_conversion": field_names_conversion, "label_kinds": label_kinds},
+                max_workers=run_options["max_workers"],
+            )
+        )
+        .sort_values(dt.WIDE_INDEX_COLS, kind="stable")
+        .reset_index(drop=True)
+    )
+    wide_data.columns.name = "Label"
+
+    return wide_data
+
+
+def codetxt_table(processed_data):
+    """Stage: table of counts for each CodeTxt for the Metadata sheet."""
+
+    # CodeTxt: ["Submitted", "Submission Accepted by CO", "Submission in Review by CO", "Submission Returned by CO"]
+    # Create table of counts for each code for each year (split on states and tribes)
+    return pf.create_codetxt_table(processed_data)
+
+
+def get_output_sheets(
+    processed_data_filtered,
+    service_outcome_data,
+    final_subawardee,
+    subawardee_rollup,
+    subawardee_counts,
+    historical_long_data,
+    historical_wide_data,
+):
+    """Get the data sheets of the final workbook, in order, as (sheet name, data frame) pairs."""
+
+    return [
+        ("OriginalFormat", processed_data_filtered),
+        ("ServiceOutcome", service_outcome_data),
+        ("Subawardee", final_subawardee),
+        ("SubawardeeRollup", subawardee_rollup),
+        ("SubawardeeCounts", subawardee_counts),
+        (str(date.today()), pf.combine_value_kinds(historical_long_data)),
+        ("WideFormat", historical_wide_data),
+    ]
+
+
+def save_workbook(
+    processed_data_filtered,
+    service_outcome_data,
+    final_subawardee,
+    subawardee_rollup,
+    subawardee_counts,
+    historical_long_data,
+    historical_wide_data,
+    codetxt_table,
+    processed_data_filename,
+    oldc_pull_date,
+    string_date,
+    ppr_settings,
+    run_options,
+):
+    """Stage: write every sheet and save the final workbook."""
+
+    new_processed_data_filename = f"{os.path.dirname(processed_data_filename)}/HistoricalPPR_{oldc_pull_date}_processed_{string_date}.xlsx"
+
+    # Save processed data in original format, service outcome data, clean subawardee data
+    # (only edited to use characters like " instead of &quot;), long and wide format data
+    workbook, sheet_xml = xw.save_sheets_to_workbook(
+        get_output_sheets(
+            processed_data_filtered,
+            service_outcome_data,
+            final_subawardee,
+            subawardee_rollup,
+            subawardee_counts,
+            historical_long_data,
+            historical_wide_data,
+        ),
+        writer=run_options["workbook_writer"],
+        max_workers=run_options["max_workers"],
+        previous_filename=processed_data_filename,
+    )
+
+    # METADATA
+    # ==================================================================================================================
+    print("Creating Metadata sheet...")
+    # Create sheet with metadata information, including the number of states & tribes reporting each year,
+    # the timestamp of the last data processing, and the list of missing states for each year
+    workbook = pf.create_metadata_sheet(
+        workbook, historical_wide_data, ALL_STATES, True, True
+    )
+    ws = workbook["Metadata"]
+    max_year = int(historical_wide_data.Year.max())
+
+    print("Saving meta data to sheet: Metadata")
+    for row_index, row in enumerate(
+        dataframe_to_rows(codetxt_table, index=False, header=False), 1
+    ):
+        for col_index, item in enumerate(
+            row, 6 + (max_year - 2018)
+        ):  # Leave space for the table of missing grantees
+            ws.cell(row_index, col_index, item)
+    print("Creating Metadata sheet - COMPLETE")
+
+    # SAVE FINAL WORKBOOK
+    # ==================================================================================================================
+    print("Saving workbook...")
+    xw.save_workbook(workbook, new_processed_data_filename, sheet_xml)
+    # Only remove current version if save was successful, there is none when the history starts with this pull
+    if os.path.exists(processed_data_filename):
+        os.remove(processed_data_filename)
+    print(f"Processing {ppr_settings['label']} OLDC data - COMPLETE")
+
+    return new_processed_data_filename
+
+
+def update_catalog(
+    raw_data,
+    processed_data_filtered,
+    service_outcome_data,
+    final_subawardee,
+    subawardee_rollup,
+    subawardee_counts,
+    historical_long_data,
+    historical_wide_data,
+    raw_data_filename,
+    new_processed_data_filename,
+    backup_file_path,
+    oldc_pull_date,
+    string_date,
+    ppr_version,
+    run_options,
+):
+    """Stage: add the raw pull and the new processed data to the catalog."""
+
+    if run_options["catalog_filename"] is None:
+        return
+
+    ct.record_run(
+        run_options["catalog_filename"],
+        "states",
+        ppr_version,
+        raw_data_filename,
+        ct.get_sheet_shapes(raw_data),
+        new_processed_data_filename,
+        ct.get_sheet_shapes(
+            get_output_sheets(
+                processed_data_filtered,
+                service_outcome_data,
+                final_subawardee,
+                subawardee_rollup,
+                subawardee_counts,
+                historical_long_data,
+                historical_wide_data,
+            )
+        ),
+        oldc_pull_date,
+        string_date,
+        archived_filename=backup_file_path,
+    )
+
+
+def get_states_stages():
+    """Get the stage graph of the States & Tribes branches.
+
+    The same graph is used for every PPR version, the version specific
+    settings are passed in through the "ppr_settings" artifact.
+
+    :return: Stage definitions
+    :rtype: <List<Dict>>
+    """
+
+    return [
+        pipeline.stage(
+            "read_inputs",
+            read_inputs,
+            ["raw_data_filename", "crosswalk_filename", "ppr_settings", "run_options"],
+            [
+                "raw_data",
+                "raw_lookup_data",
+                "subawardee_lookup",
+                "raw_field_names_conversion",
+                "coercion_report",
+            ],
+        ),
+        pipeline.stage(
+            "prepare_lookups",
+            prepare_lookups,
+            ["raw_lookup_data", "raw_field_names_conversion"],
+            ["lookup_data", "field_names_conversion"],
+        ),
+        pipeline.stage(
+            "prepare_raw_data",
+            prepare_raw_data,
+            ["raw_data"],
+            ["processed_raw_data", "first_43_cols"],
+        ),
+        pipeline.stage(
+            "archive_processed_data",
+            archive_processed_data,
+            ["processed_data_filename", "string_date"],
+            ["backup_file_path"],
+        ),
+        pipeline.stage(
+            "filter_grantee_data",
+            filter_grantee_data,
+            ["processed_raw_data", "first_43_cols", "ppr_settings"],
+            ["processed_data", "processed_data_filtered"],
+        ),
+        pipeline.stage(
+            "service_outcome",
+            service_outcome,
+            ["processed_data_filtered", "field_names_conversion"],
+            ["service_outcome_data"],
+        ),
+        pipeline.stage(
+            "subawardee",
+            subawardee,
+            ["processed_raw_data", "subawardee_lookup", "processed_data_filtered"],
+            ["final_subawardee"],
+        ),
+        pipeline.stage(
+            "subawardee_rollups",
+            subawardee_rollups,
+            ["final_subawardee"],
+            ["subawardee_rollup", "subawardee_counts"],
+        ),
+        pipeline.stage(
+            "long_format",
+            long_format,
+            [
+                "processed_data_filtered",
+                "final_subawardee",
+                "first_43_cols",
+                "lookup_data",
+                "field_names_conversion",
+                "ppr_settings",
+                "run_options",
+            ],
+            ["joined_long_data"],
+        ),
+        pipeline.stage(
+            "historical_long_format",
+            historical_long_format,
+            [
+                "processed_raw_data",
+                "joined_long_data",
+                "backup_file_path",
+                "field_names_conversion",
+                "run_options",
+            ],
+            ["historical_long_data"],
+        ),
+        pipeline.stage(
+            "wide_format",
+            wide_format,
+            [
+                "joined_long_data",
+                "field_names_conversion",
+                "processed_data_filtered",
+                "run_options",
+            ],
+            ["historical_wide_data"],
+        ),
+        pipeline.stage(
+            "codetxt_table",
+            codetxt_table,
+            ["processed_data"],
+            ["codetxt_table"],
+        ),
+        pipeline.stage(
+            "save_workbook",
+            save_workbook,
+            [
+                "processed_data_filtered",
+                "service_outcome_data",
+                "final_subawardee",
+                "subawardee_rollup",
+                "subawardee_counts",
+                "historical_long_data",
+                "historical_wide_data",
+                "codetxt_table",
+                "processed_data_filename",
+                "oldc_pull_date",
+                "string_date",
+                "ppr_settings",
+                "run_options",
+            ],
+            ["new_processed_data_filename"],
+        ),
+        pipeline.stage(
+            "update_catalog",
+            update_catalog,
+            [
+                "raw_data",
+                "processed_data_filtered",
+                "service_outcome_data",
+                "final_subawardee",
+                "subawardee_rollup",
+                "subawardee_counts",
+                "historical_long_data",
+                "historical_wide_data",
+                "raw_data_filename",
+                "new_processed_data_filename",
+                "backup_file_path",
+                "oldc_pull_date",
+                "string_date",
+                "ppr_version",
+                "run_options",
+            ],
+            ["catalog_updated"],
+        ),
+    ]
+
+
+def run_states_branch(
+    ppr_version,
+    raw_data_filename,
+    processed_data_filename,
+    crosswalk_filename,
+    string_date,
+    executor="thread",
+    max_workers=None,
+    transform_engine="pandas",
+    duckdb_memory_limit=None,
+    subawardee_join="rows",
+    excel_engine="openpyxl",
+    raw_columns="all",
+    workbook_writer="openpyxl",
+    catalog_filename=None,
+    transform_shards=1,
+    checkpoint_dir=None,
+    memory_budget=None,
+):
+    """Process one version of the States & Tribes PPR data.
+
+    :param ppr_version: Key of <PPR_VERSIONS> to process ("2023" or "2024")
+    :type ppr_version: <str>
+    :param raw_data_filename: File path of the raw OLDC data
+    :type raw_data_filename: <str>
+    :param processed_data_filename: File path of the previously processed data
+    :type processed_data_filename: <str>
+    :param crosswalk_filename: File path of the crosswalk for this version
+    :type crosswalk_filename: <str>
+    :param string_date: Timestamp appended to the archived and new files
+    :type string_date: <str>
+    :param executor: Pool to run independent stages on, "thread", "process"
+        or "serial"
+    :type executor: <str>
+    :param max_workers: Maximum number of workers in the pool
+    :type max_workers: <int>
+    :param transform_engine: Engine to run the long and wide format
+        transforms with, "pandas" or "duckdb"
+    :type transform_engine: <str>
+    :param duckdb_memory_limit: Memory limit of the DuckDB engine before it
+        spills to disk, e.g. "4GB"
+    :type duckdb_memory_limit: <str>
+    :param subawardee_join: Join every subawardee row onto its state row
+        ("rows") or only the subawardee funding totals ("aggregate")
+    :type subawardee_join: <str>
+    :param excel_engine: Engine to read the workbooks with, one of
+        <pf.EXCEL_ENGINES>
+    :type excel_engine: <str>
+    :param raw_columns: Read "all" raw columns, or only the "used" ones,
+        which leaves the unused columns out of the OriginalFormat sheet
+    :type raw_columns: <str>
+    :param workbook_writer: Writer to save the final workbook with, one of
+        <xw.WORKBOOK_WRITERS>. "parallel" and "incremental" use up to
+        <max_workers> processes, "incremental" copies the sheets that didn't
+        change from the previously processed data
+    :type workbook_writer: <str>
+    :param catalog_filename: File path of the SQLite catalog to add the raw
+        pull and the new processed data to, see <ct.record_run>. Default is
+        no catalog
+    :type catalog_filename: <str>
+    :param transform_shards: Number of shards of states and tribes to run
+        the long and wide format transforms in, each in a worker process, up
+        to <max_workers> at a time. Only with the "pandas" transform engine.
+        Default is 1, no sharding
+    :type transform_shards: <int>
+    :param checkpoint_dir: Directory to checkpoint the stage outputs to and
+        resume from, see <pipeline.run_pipeline>
+    :type checkpoint_dir: <str>
+    :param memory_budget: Resident memory in MB above which stage outputs
+        are spilled to disk, see <pipeline.run_pipeline>. Default is no budget
+    :type memory_budget: <float>
+
+    :return: File path of the new processed data
+    :rtype: <str>
+    """
+
+    if transform_shards > 1 and transform_engine != "pandas":
+        raise ValueError(f"transform_shards only works with the pandas transform engine, got {transform_engine!r}")
+
+    t1 = time.time()
+    print("Using crosswalk file:", crosswalk_filename)
+    print(f"Using {transform_engine} engine for the long and wide format transforms")
+
+    # Extract the pull date from the filename
+    oldc_pull_splits = os.path.basename(raw_data_filename).split("_")
+    oldc_pull_date = oldc_pull_splits[-1].replace(".xlsx", "")
+
+    context = {
+        "raw_data_filename": raw_data_filename,
+        "processed_data_filename": processed_data_filename,
+        "crosswalk_filename": crosswalk_filename,
+        "oldc_pull_date": oldc_pull_date,
+        "string_date": string_date,
+        "ppr_version": ppr_version,
+        "ppr_settings": PPR_VERSIONS[ppr_version],
+        "run_options": {
+            "transform_engine": transform_engine,
+            "duckdb_memory_limit": duckdb_memory_limit,
+            "subawardee_join": subawardee_join,
+            "excel_engine": excel_engine,
+            "raw_columns": raw_columns,
+            "workbook_writer": workbook_writer,
+            "max_workers": max_workers,
+            "catalog_filename": catalog_filename,
+            "transform_shards": transform_shards,
+        },
+    }
+
+    artifacts, report = pipeline.run_pipeline(
+        get_states_stages(),
+        context,
+        executor=executor,
+        max_workers=max_workers,
+        checkpoint_dir=checkpoint_dir,
+        keep=["new_processed_data_filename"],
+        memory_budget=memory_budget,
+    )
+    pipeline.print_run_report(report)
+    print(time.time() - t1)
+
+    return artifacts["new_processed_data_filename"]
+
+
+# ENGINE EQUIVALENCE AND BENCHMARK
+# ======================================================================================================================
+def compare_transform_engines(ppr_version, raw_data_filename, crosswalk_filename, repeat=3):
+    """Check the transform engines produce the same sheets and time them.
+
+    The raw data is read and filtered once, then the long and wide format
+    transforms are run <repeat> times with each engine. Nothing is written
+    to disk.
+
+    :param ppr_version: Key of <PPR_VERSIONS> to process
+    :type ppr_version: <str>
+    :param raw_data_filename: File path of the raw OLDC data
+    :type raw_data_filename: <str>
+    :param crosswalk_filename: File path of the crosswalk for this version
+    :type crosswalk_filename: <str>
+    :param repeat: Number of timed runs per engine
+    :type repeat: <int>
+
+    :return: Best time per engine and the sheets that don't match
+    :rtype: <Dict>
+    """
+
+    ppr_settings = PPR_VERSIONS[ppr_version]
+    run_options = {
+        "excel_engine": "openpyxl",
+        "raw_columns": "all",
+        "subawardee_join": "rows",
+        "transform_shards": 1,
+        "duckdb_memory_limit": None,
+        "max_workers": None,
+    }
+    (raw_data, raw_lookup_data, subawardee_lookup, raw_field_names_conversion, _) = read_inputs(
+        raw_data_filename, crosswalk_filename, ppr_settings, run_options
+    )
+    (lookup_data, field_names_conversion) = prepare_lookups(raw_lookup_data, raw_field_names_conversion)
+    (processed_raw_data, first_43_cols) = prepare_raw_data(raw_data)
+    (_, processed_data_filtered) = filter_grantee_data(processed_raw_data, first_43_cols, ppr_settings)
+    final_subawardee = subawardee(processed_raw_data, subawardee_lookup, processed_data_filtered)
+
+    outputs = {}
+    timings = {}
+    for engine in ["pandas", "duckdb"]:
+        engine_options = dict(run_options, transform_engine=engine)
+        timings[engine] = []
+        for _ in range(repeat):
+            t1 = time.perf_counter()
+            joined_long_data = long_format(
+                processed_data_filtered,
+                final_subawardee,
+                first_43_cols,
+                lookup_data,
+                field_names_conversion,
+                ppr_settings,
+                engine_options,
+            )
+            historical_wide_data = wide_format(
+                joined_long_data, field_names_conversion, processed_data_filtered, engine_options
+            )
+            timings[engine].append(time.perf_counter() - t1)
+            outputs[engine] = (joined_long_data, historical_wide_data)
+
+    pairs = {
+        "Long Format": (outputs["pandas"][0], outputs["duckdb"][0]),
+        "Wide Format": (outputs["pandas"][1], outputs["duckdb"][1]),
+    }
+    # Both engines type the values the same way, so unlike the coalitions backends the dtypes must match too
+    mismatches = [
+        name
+        for name, (left, right) in pairs.items()
+        if not cp.frames_match(left.reset_index(drop=True), right.reset_index(drop=True))
+        or not left.dtypes.equals(right.dtypes)
+    ]
+
+    print(f"States & Tribes {ppr_version} transforms, best of {repeat}:")
+    for engine, times in timings.items():
+        print(f"  {engine:<8}{min(times):>10.3f}s")
+    if mismatches:
+        print("Sheets that don't match: " + ", ".join(mismatches))
+    else:
+        print(f"All {len(pairs)} sheets match")
+
+    return {
+        "timings": dict((k, min(v)) for k, v in timings.items()),
+        "mismatches": mismatches,
+    }
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Compare the pandas and duckdb transform engines on a raw OLDC file"
+    )
+
+    parser.add_argument(
+        "--ppr_version",
+        choices=list(PPR_VERSIONS.keys()),
+        default="2024",
+        help='Version of the States & Tribes PPR. Default is "2024"',
+    )
+
+    parser.add_argument(
+        "--raw_data_filename",
+        required=True,
+        help="File path of raw OLDC data.",
+    )
+
+    parser.add_argument(
+        "--crosswalk_filename",
+        required=True,
+        help="File path of the crosswalk for this PPR version.",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of timed runs per engine. Default is 3",
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    result = compare_transform_engines(**vars(args))
+    sys.exit(1 if result["mismatches"] else 0)
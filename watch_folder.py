@@ -0,0 +1,519 @@
+import os
+import select
+import shutil
+import struct
+import sys
+import time
+import traceback
+from datetime import datetime
+
+import catalog as ct
+import coalitions_pipeline as cp
+import processing_functions as pf
+import states_pipeline as sp
+
+
+# Raw OLDC exports the daemon processes, matched on the export file name. New exports are named
+# "<export_name>_<%m%d%Y pull date>.xlsx" when they are copied in, see <manifest.import_new_export>
+EXPORT_KINDS = {
+    "states_2023": {
+        "pattern": "ppr_state_ver__6_",
+        "branch": "states",
+        "ppr_version": "2023",
+        "export_name": "fvps_sf-ppr_state_ver__6_(fy__2018_to_2021)",
+    },
+    "states_2024": {
+        "pattern": "ppr_state_ver__8_",
+        "branch": "states",
+        "ppr_version": "2024",
+        "export_name": "fvps_sf-ppr_state_ver__8_(fy__2024_to_2027)",
+    },
+    "coalitions_2023": {
+        "pattern": "progress_report_ver_1_",
+        "branch": "coalitions",
+        "ppr_version": "2023",
+        "export_name": "fvpsa_performance_progress_report_ver_1_(fy_2001_to_2024)",
+    },
+    "coalitions_2024": {
+        "pattern": "progress_report_ver_2_",
+        "branch": "coalitions",
+        "ppr_version": "2024",
+        "export_name": "fvpsa_performance_progress_report_ver_2_(fy_2024_to_2027)",
+    },
+}
+
+# inotify events for a file that was written and closed, or moved into the folder
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+
+def classify_export(path):
+    """Get the kind of raw OLDC export from its file name.
+
+    :param path: File path of the export
+    :type path: <str>
+
+    :return: Key of <EXPORT_KINDS>, or None if the file isn't an export
+    :rtype: <str>
+    """
+
+    name = os.path.basename(path).lower()
+    # Skip Excel lock files and exports archived by the daemon or data_processing.bash
+    if not name.endswith(".xlsx") or name.startswith("~$") or "_archived_" in name:
+        return None
+
+    for kind, settings in EXPORT_KINDS.items():
+        if settings["pattern"] in name:
+            return kind
+
+    return None
+
+
+def get_file_state(path):
+    """Get the size and modified time of a file, or None if it's gone."""
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def wait_until_stable(path, stable_seconds=5, poll_interval=1):
+    """Wait until a file stops changing.
+
+    Exports are copied or synced into the raw data folders in chunks, the
+    file is only processed once its size and modified time have not changed
+    for <stable_seconds>.
+
+    :param path: File path to wait on
+    :type path: <str>
+    :param stable_seconds: Seconds the file must be unchanged for
+    :type stable_seconds: <float>
+    :param poll_interval: Seconds between checks
+    :type poll_interval: <float>
+
+    :return: Whether the file is stable, False if it was removed
+    :rtype: <bool>
+    """
+
+    last_state = get_file_state(path)
+    stable_since = time.monotonic()
+    while time.monotonic() - stable_since < stable_seconds:
+        time.sleep(poll_interval)
+        state = get_file_state(path)
+        if state is None:
+            return False
+        if state != last_state:
+            last_state = state
+            stable_since = time.monotonic()
+
+    return last_state is not None
+
+
+def archive_previous_exports(path, kind, now, catalog_filename=None):
+    """Move older exports of the same kind into the Archive folder.
+
+    This is what data_processing.bash does before copying in a new export,
+    the older export is renamed to "<name>_Archived_<now>.xlsx".
+
+    :param path: File path of the new export
+    :type path: <str>
+    :param kind: Key of <EXPORT_KINDS>
+    :type kind: <str>
+    :param now: Date appended to the archived exports, in <%m%d%Y> format
+    :type now: <str>
+    :param catalog_filename: File path of the SQLite catalog the archived
+        exports are moved in. Default is no catalog
+    :type catalog_filename: <str>
+    """
+
+    raw_dir = os.path.dirname(path)
+    for name in sorted(os.listdir(raw_dir)):
+        old_path = os.path.join(raw_dir, name)
+        if old_path == path or classify_export(old_path) != kind:
+            continue
+
+        archive_dir = os.path.join(raw_dir, "Archive")
+        if not os.path.exists(archive_dir):
+            os.mkdir(archive_dir)
+
+        legacy_path = os.path.join(
+            archive_dir, f"{name.replace('.xlsx', '')}_Archived_{now}.xlsx"
+        )
+        print(f"Moving current export to {legacy_path}...")
+        shutil.move(old_path, legacy_path)
+        if catalog_filename is not None:
+            ct.move_file(catalog_filename, old_path, legacy_path)
+
+
+def _inotify_events(directories):
+    """Yield files written or moved into <directories>, using inotify."""
+
+    import ctypes
+    import ctypes.util
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    try:
+        watches = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(
+                fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO
+            )
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            watches[wd] = directory
+
+        while True:
+            select.select([fd], [], [])
+            buffer = os.read(fd, 64 * 1024)
+            offset = 0
+            # struct inotify_event: int wd, uint32 mask, uint32 cookie, uint32 len, char name[len]
+            while offset < len(buffer):
+                wd, mask, cookie, length = struct.unpack_from("iIII", buffer, offset)
+                name = buffer[offset + 16 : offset + 16 + length].rstrip(b"\0")
+                offset += 16 + length
+                if name and wd in watches:
+                    yield os.path.join(watches[wd], os.fsdecode(name))
+    finally:
+        os.close(fd)
+
+
+def _polling_events(directories, poll_interval=2):
+    """Yield files that are new or changed in <directories>, by polling."""
+
+    def snapshot(directory):
+        return dict(
+            (entry.path, get_file_state(entry.path))
+            for entry in os.scandir(directory)
+            if entry.is_file()
+        )
+
+    seen = dict((directory, snapshot(directory)) for directory in directories)
+    while True:
+        time.sleep(poll_interval)
+        for directory in directories:
+            current = snapshot(directory)
+            for path, state in current.items():
+                if seen[directory].get(path) != state:
+                    yield path
+            seen[directory] = current
+
+
+def watch_events(directories, poll_interval=2):
+    """Yield files that land in the watched folders.
+
+    Uses inotify on Linux and falls back to polling the folders elsewhere
+    or when inotify is not available (e.g. some network drives).
+
+    :param directories: Folders to watch, not recursive
+    :type directories: <List<str>>
+    :param poll_interval: Seconds between polls when polling
+    :type poll_interval: <float>
+
+    :return: Generator of file paths
+    :rtype: <Generator<str>>
+    """
+
+    if sys.platform.startswith("linux"):
+        events = _inotify_events(directories)
+        try:
+            # Set up the watches before the first file lands
+            first = next(events)
+        except OSError as e:
+            print(f"inotify is not available ({e}), polling the folders instead")
+        else:
+            yield first
+            yield from events
+            return
+
+    yield from _polling_events(directories, poll_interval)
+
+
+def warm_history(processed_data_filename, engine="openpyxl"):
+    """Parse the long format sheet of a processed file into the sheet cache.
+
+    The next States & Tribes run reads the long format data back from the
+    archived copy of this file, parsing it between jobs keeps it off the
+    critical path of the next run.
+
+    :param processed_data_filename: File path of the processed data
+    :type processed_data_filename: <str>
+    :param engine: Engine the runs read workbooks with, one of
+        <pf.EXCEL_ENGINES>
+    :type engine: <str>
+    """
+
+    sheet_name = pf.get_long_format_sheet_name(processed_data_filename, engine=engine)
+    if sheet_name is not None:
+        pf.read_excel_sheet(processed_data_filename, sheet_name, engine=engine)
+
+
+def warm_crosswalks(jobs, engine="openpyxl"):
+    """Parse the crosswalk sheets of every job into the sheet cache."""
+
+    for kind, job in jobs.items():
+        if EXPORT_KINDS[kind]["branch"] == "states":
+            for sheet_name in ["lookup", "cultspec_subawardee", "crosswalk"]:
+                pf.read_excel_sheet(job["crosswalk_filename"], sheet_name, engine=engine)
+        else:
+            pf.read_excel_sheet(job["crosswalk_filename"], "coalitions", engine=engine)
+
+
+def prescan_export(path, kind, job, excel_engine="openpyxl"):
+    """Check the headers of a raw OLDC export against the expected layout of its kind.
+
+    :param path: File path of the export
+    :type path: <str>
+    :param kind: Key of <EXPORT_KINDS>
+    :type kind: <str>
+    :param job: Crosswalk file path of this kind
+    :type job: <Dict>
+    :param excel_engine: Engine to read the workbooks with
+    :type excel_engine: <str>
+
+    :raises ValueError: If the headers drifted from the expected layout, with
+        the schema drift report, see <pf.check_schema_drift>
+    """
+
+    settings = EXPORT_KINDS[kind]
+    prescan = sp.prescan_states_inputs if settings["branch"] == "states" else cp.prescan_coalitions_inputs
+    schema_drift = prescan(settings["ppr_version"], path, job["crosswalk_filename"], excel_engine=excel_engine)
+    pf.check_schema_drift(schema_drift, f"{kind} export {os.path.basename(path)}")
+
+
+def prescan_jobs(jobs, excel_engine="openpyxl"):
+    """Check the headers of the raw export of every job before any is processed.
+
+    Every job is checked, so one run reports the drift of all of them.
+
+    :param jobs: Raw export, processed data and crosswalk file paths per key
+        of <EXPORT_KINDS>
+    :type jobs: <Dict<Dict>>
+    :param excel_engine: Engine to read the workbooks with
+    :type excel_engine: <str>
+
+    :raises ValueError: If the headers of any export drifted
+    """
+
+    drifted = []
+    for kind, job in jobs.items():
+        try:
+            prescan_export(job["raw_data_filename"], kind, job, excel_engine=excel_engine)
+        except ValueError as e:
+            print(e)
+            drifted.append(kind)
+
+    if drifted:
+        raise ValueError(f"Schema drift in the {', '.join(drifted)} exports, see the reports above")
+
+
+def run_export(path, kind, job, options, string_date):
+    """Process a raw OLDC export with the branch of its kind.
+
+    :param path: File path of the export
+    :type path: <str>
+    :param kind: Key of <EXPORT_KINDS>
+    :type kind: <str>
+    :param job: Processed data and crosswalk file paths of this kind
+    :type job: <Dict>
+    :param options: Options shared by all jobs, see <run_daemon>
+    :type options: <Dict>
+    :param string_date: Timestamp appended to the archived and new files
+    :type string_date: <str>
+
+    :return: File path of the new processed data
+    :rtype: <str>
+    """
+
+    if options["prescan"]:
+        prescan_export(path, kind, job, excel_engine=options["excel_engine"])
+
+    settings = EXPORT_KINDS[kind]
+    if settings["branch"] == "states":
+        return sp.run_states_branch(
+            ppr_version=settings["ppr_version"],
+            raw_data_filename=path,
+            processed_data_filename=job["processed_data_filename"],
+            crosswalk_filename=job["crosswalk_filename"],
+            string_date=string_date,
+            executor=options["executor"],
+            max_workers=options["max_workers"],
+            transform_engine=options["transform_engine"],
+            duckdb_memory_limit=options["duckdb_memory_limit"],
+            subawardee_join=options["subawardee_join"],
+            excel_engine=options["excel_engine"],
+            raw_columns=options["raw_columns"],
+            workbook_writer=options["workbook_writer"],
+            catalog_filename=options["catalog_filename"],
+            transform_shards=options["transform_shards"],
+            memory_budget=options["memory_budget"],
+        )
+
+    return cp.run_coalitions_branch(
+        ppr_version=settings["ppr_version"],
+        raw_data_filename=path,
+        processed_data_filename=job["processed_data_filename"],
+        crosswalk_filename=job["crosswalk_filename"],
+        coalitions_names_filename=options["coalitions_names_filename"],
+        string_date=string_date,
+        executor=options["executor"],
+        max_workers=options["max_workers"],
+        coalitions_backend=options["coalitions_backend"],
+        excel_engine=options["excel_engine"],
+        workbook_writer=options["workbook_writer"],
+        catalog_filename=options["catalog_filename"],
+        memory_budget=options["memory_budget"],
+    )
+
+
+def is_dated_export(path):
+    """Check if an export is named with its pull date.
+
+    The branches read the pull date from the last "_" token of the export
+    file name, see <sp.run_states_branch>.
+
+    :param path: File path of the export
+    :type path: <str>
+
+    :return: Whether the file name ends in a <%m%d%Y> pull date
+    :rtype: <bool>
+    """
+
+    pull_date = os.path.basename(path).split("_")[-1].replace(".xlsx", "")
+
+    return ct.parse_pull_date(pull_date) is not None
+
+
+def import_export(path, kind, now, catalog_filename=None):
+    """Archive the previous exports of a new export and date it.
+
+    This is what data_processing.bash does with a new export: older exports
+    of the same kind are moved to the Archive folder (see
+    <archive_previous_exports>) and an export that lands without a pull
+    date, e.g. straight from the OLDC download, is renamed to
+    "<export_name>_<now>.xlsx", as <manifest.import_new_export> names it.
+
+    :param path: File path of the new export
+    :type path: <str>
+    :param kind: Key of <EXPORT_KINDS>
+    :type kind: <str>
+    :param now: Pull date, in <%m%d%Y> format
+    :type now: <str>
+    :param catalog_filename: File path of the SQLite catalog the archived
+        exports are moved in. Default is no catalog
+    :type catalog_filename: <str>
+
+    :return: File path of the dated export
+    :rtype: <str>
+    """
+
+    archive_previous_exports(path, kind, now, catalog_filename=catalog_filename)
+    if is_dated_export(path):
+        return path
+
+    dated_path = os.path.join(
+        os.path.dirname(path), f"{EXPORT_KINDS[kind]['export_name']}_{now}.xlsx"
+    )
+    print(f"Renaming {path} to {dated_path}...")
+    shutil.move(path, dated_path)
+
+    return dated_path
+
+
+def run_daemon(jobs, options, stable_seconds=5, poll_interval=2):
+    """Watch the raw data folders and process new exports as they land.
+
+    This replaces the manual data_processing.bash flow. Each job watches the
+    folder of its raw export. When a new export lands and stops changing it
+    is classified, the previous export is archived, an undated export is
+    renamed with its pull date (see <import_export>) and the export is
+    processed straight away. The crosswalks and the parsed historical data
+    stay in memory between jobs. A failed job is reported and the daemon
+    keeps watching. Stop with Ctrl+C.
+
+    :param jobs: Raw export, processed data and crosswalk file paths per key
+        of <EXPORT_KINDS>
+    :type jobs: <Dict<Dict>>
+    :param options: Options shared by all jobs: coalitions_names_filename,
+        executor, max_workers, transform_engine, duckdb_memory_limit,
+        subawardee_join, transform_shards, coalitions_backend, excel_engine,
+        raw_columns, workbook_writer, catalog_filename, memory_budget and
+        prescan, to check the headers of every export before it's processed
+        (see <prescan_export>)
+    :type options: <Dict>
+    :param stable_seconds: Seconds an export must be unchanged before it's
+        processed
+    :type stable_seconds: <float>
+    :param poll_interval: Seconds between polls when inotify isn't available
+    :type poll_interval: <float>
+    """
+
+    pf.enable_sheet_cache()
+
+    folders = {}
+    for kind, job in jobs.items():
+        raw_dir = os.path.dirname(os.path.abspath(job["raw_data_filename"]))
+        if os.path.isdir(raw_dir):
+            folders.setdefault(raw_dir, []).append(kind)
+        else:
+            print(f"Not watching {kind}, {raw_dir} does not exist")
+
+    print("Loading crosswalks and historical data...")
+    warm_crosswalks(jobs, engine=options["excel_engine"])
+    for kind, job in jobs.items():
+        if EXPORT_KINDS[kind]["branch"] == "states" and os.path.exists(job["processed_data_filename"]):
+            warm_history(job["processed_data_filename"], engine=options["excel_engine"])
+    print("Loading crosswalks and historical data - COMPLETE")
+
+    # Exports already in the folders have been processed by earlier runs
+    processed = dict(
+        (os.path.join(raw_dir, name), get_file_state(os.path.join(raw_dir, name)))
+        for raw_dir in folders
+        for name in os.listdir(raw_dir)
+    )
+
+    for raw_dir, kinds in folders.items():
+        print(f"Watching {raw_dir} for {', '.join(kinds)} exports...")
+
+    try:
+        for path in watch_events(list(folders.keys()), poll_interval):
+            kind = classify_export(path)
+            if kind is None or kind not in folders[os.path.dirname(path)]:
+                continue
+            if not wait_until_stable(path, stable_seconds):
+                continue
+
+            state = get_file_state(path)
+            if processed.get(path) == state:
+                continue
+            processed[path] = state
+
+            print(f"New {kind} export: {path}")
+            t1 = time.time()
+            try:
+                path = import_export(
+                    path, kind, datetime.today().strftime("%m%d%Y"), catalog_filename=options["catalog_filename"]
+                )
+                # The rename lands in the folder as a new export
+                processed[path] = get_file_state(path)
+                string_date = datetime.today().strftime("%m%d%Y_%H%M%S")
+                new_processed_data_filename = run_export(path, kind, jobs[kind], options, string_date)
+            except Exception:
+                traceback.print_exc()
+                print(f"Processing {path} failed, still watching for new exports")
+                continue
+
+            jobs[kind]["raw_data_filename"] = path
+            jobs[kind]["processed_data_filename"] = new_processed_data_filename
+            print(f"Processed {path} in {time.time() - t1:.1f}s")
+
+            if EXPORT_KINDS[kind]["branch"] == "states":
+                warm_history(new_processed_data_filename, engine=options["excel_engine"])
+    except KeyboardInterrupt:
+        print("Stopped watching")
@@ -0,0 +1,341 @@
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from zipfile import ZIP_DEFLATED, BadZipFile, ZipFile
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.packaging.custom import CustomPropertyList, StringProperty
+from openpyxl.packaging.relationship import RelationshipList
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.writer.excel import ExcelWriter
+from openpyxl.xml.constants import ARC_CUSTOM
+from openpyxl.xml.functions import fromstring
+
+import processing_functions as pf
+
+
+# Ways the final workbooks can be written. "openpyxl" builds and saves every
+# sheet in one process, "parallel" serializes each sheet's XML in its own
+# worker process and assembles the workbook package at the end.
+# "incremental" is "parallel" for the sheets whose data changed since the
+# previous workbook, the other sheets are copied from it
+WORKBOOK_WRITERS = ["openpyxl", "parallel", "incremental"]
+
+# Custom document property holding the fingerprint of the n-th sheet's data
+# and the CRC-32 of its worksheet part, written by the "incremental" writer
+FINGERPRINT_PROPERTY = "PPR sheet {} fingerprint"
+
+# Values whose cell styles are registered up front, in this order, so every
+# workbook gives the date and time cell styles the same style ids
+_TIME_VALUES = [
+    datetime.datetime(2000, 1, 1),
+    datetime.date(2000, 1, 1),
+    datetime.time(0, 0),
+    datetime.timedelta(0),
+]
+
+
+def new_workbook():
+    """Create an empty workbook with the date and time styles registered.
+
+    openpyxl numbers the cell styles of a workbook in the order the cells
+    using them are written. The parallel writer saves sheets serialized in
+    other workbooks with the styles of this one, so the styles data frame
+    values can use are registered before any sheet is written.
+
+    :return: Workbook without any sheets
+    :rtype: <openpyxl.Workbook>
+    """
+
+    workbook = Workbook()
+    ws = workbook.active
+    for col_index, value in enumerate(_TIME_VALUES, 1):
+        # Cell styles are numbered when their id is first asked for
+        ws.cell(1, col_index, value).style_id
+    workbook.remove(ws)
+
+    return workbook
+
+
+def _get_styles(workbook):
+    """Get the cell styles and number formats of a workbook."""
+
+    return list(workbook._cell_styles), list(workbook._number_formats)
+
+
+def get_fingerprint(df):
+    """Get the fingerprint of the data a data frame saves to a sheet.
+
+    The fingerprint covers the columns, dtypes and values. Object columns
+    are hashed by the repr of their values, so e.g. 1 and "1", which are
+    written as a number and as text, don't match.
+
+    :param df: Data frame to fingerprint
+    :type df: <pd.DataFrame>
+
+    :return: Hex digest of the data
+    :rtype: <str>
+    """
+
+    sha1 = hashlib.sha1()
+    sha1.update(repr((list(df.columns), [str(t) for t in df.dtypes], df.shape)).encode())
+    for col_index in range(df.shape[1]):
+        values = df.iloc[:, col_index]
+        if values.dtype == object:
+            values = values.map(repr)
+        sha1.update(pd.util.hash_pandas_object(values, index=False).values.tobytes())
+
+    return sha1.hexdigest()
+
+
+def get_sheet_part(sheet_index):
+    """Get the package part of the n-th worksheet, as openpyxl names it."""
+
+    return f"xl/worksheets/sheet{sheet_index}.xml"
+
+
+def read_fingerprints(filename):
+    """Read the sheet fingerprints of a workbook saved by the "incremental" writer.
+
+    A fingerprint is only returned while its worksheet part is still the
+    one that was written with it. A workbook saved again by Excel has its
+    parts rewritten, and none of its sheets are reused.
+
+    :param filename: File path of the workbook
+    :type filename: <str>
+
+    :return: Fingerprints by sheet index, starting at 1
+    :rtype: <Dict<int, str>>
+    """
+
+    try:
+        with ZipFile(filename) as archive:
+            props = CustomPropertyList.from_tree(fromstring(archive.read(ARC_CUSTOM)))
+            crcs = dict((info.filename, info.CRC) for info in archive.infolist())
+    except (OSError, KeyError, BadZipFile):
+        return {}
+
+    values = dict((prop.name, prop.value) for prop in props)
+    fingerprints = {}
+    sheet_index = 1
+    while FINGERPRINT_PROPERTY.format(sheet_index) in values:
+        fingerprint, crc = values[FINGERPRINT_PROPERTY.format(sheet_index)].split(":")
+        if crcs.get(get_sheet_part(sheet_index)) == int(crc, 16):
+            fingerprints[sheet_index] = fingerprint
+        sheet_index += 1
+
+    return fingerprints
+
+
+def _get_crc(filepath):
+    """Get the CRC-32 of the contents of a file."""
+
+    crc = 0
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            crc = zlib.crc32(chunk, crc)
+
+    return crc
+
+
+def _serialize_sheet(df_to_save, sheet_name, out):
+    """Write a data frame as worksheet XML.
+
+    The sheet is built by <pf.save_to_final_workbook>, so it has the same
+    cells, protection and auto filter as in the "openpyxl" writer.
+
+    :param df_to_save: Data frame to save
+    :type df_to_save: <pd.DataFrame>
+    :param sheet_name: Name of the sheet
+    :type sheet_name: <str>
+    :param out: File path to write the worksheet XML to
+    :type out: <str>
+
+    :return: Auto filter range and the styles of the sheet's workbook
+    :rtype: <str>, <Tuple<List>>
+    """
+
+    workbook = pf.save_to_final_workbook(df_to_save, sheet_name, new_workbook())
+    ws = workbook[sheet_name]
+    ws._drawing = SpreadsheetDrawing()
+
+    writer = WorksheetWriter(ws, out=out)
+    writer.write()
+
+    return ws.auto_filter.ref, _get_styles(workbook)
+
+
+def save_sheets_to_workbook(sheets, writer="openpyxl", max_workers=None, previous_filename=None):
+    """Save data frames as sheets of a new workbook.
+
+    With the "parallel" writer the sheets are serialized by worker
+    processes, largest first, into a scratch directory. The returned
+    workbook then only holds empty placeholder sheets, pass it with the
+    returned sheet XML to <save_workbook>. More sheets can be added to the
+    workbook in between, e.g. the Metadata sheet.
+
+    The "incremental" writer fingerprints every data frame and compares it
+    with the fingerprint of the sheet at the same position in
+    <previous_filename>. Unchanged sheets are copied byte for byte from the
+    previous workbook, only the changed ones are serialized. The new
+    fingerprints are saved with the workbook.
+
+    :param sheets: Sheet names and the data frames to save to them, in the
+        order of the sheets
+    :type sheets: <List<Tuple<str, pd.DataFrame>>>
+    :param writer: One of <WORKBOOK_WRITERS>
+    :type writer: <str>
+    :param max_workers: Maximum number of worker processes of the
+        "parallel" and "incremental" writers
+    :type max_workers: <int>
+    :param previous_filename: File path of the previous workbook, for the
+        "incremental" writer. Default is None, serializing every sheet
+    :type previous_filename: <str>
+
+    :return: Workbook and the worksheet XML by sheet name, empty for the
+        "openpyxl" writer. The XML is a file path, or a (workbook file
+        path, part) tuple for a sheet copied from the previous workbook
+    :rtype: <openpyxl.Workbook>, <Dict>
+    """
+
+    if writer not in WORKBOOK_WRITERS:
+        raise ValueError(f"writer must be one of {WORKBOOK_WRITERS}, got {writer!r}")
+
+    if writer == "openpyxl":
+        workbook = None
+        for sheet_name, df_to_save in sheets:
+            print(f"Saving sheet: {sheet_name}...")
+            workbook = pf.save_to_final_workbook(df_to_save, sheet_name, workbook)
+        return workbook, {}
+
+    sheet_xml = {}
+    fingerprints = {}
+    to_serialize = sheets
+    if writer == "incremental":
+        fingerprints = dict(
+            (i, get_fingerprint(df_to_save)) for i, (_, df_to_save) in enumerate(sheets, 1)
+        )
+        previous = read_fingerprints(previous_filename) if previous_filename else {}
+        for i, (sheet_name, _) in enumerate(sheets, 1):
+            if previous.get(i) == fingerprints[i]:
+                print(f"Sheet {sheet_name} is unchanged, copying it from the previous workbook")
+                sheet_xml[sheet_name] = (previous_filename, get_sheet_part(i))
+        to_serialize = [sheet for sheet in sheets if sheet[0] not in sheet_xml]
+
+    scratch_dir = tempfile.mkdtemp(prefix="ppr_xlsx_") if to_serialize else None
+    for i, (sheet_name, _) in enumerate(to_serialize, 1):
+        sheet_xml[sheet_name] = os.path.join(scratch_dir, f"sheet{i}.xml")
+
+    workbook = new_workbook()
+    try:
+        if to_serialize:
+            print(f"Serializing {len(to_serialize)} sheets in parallel...")
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = dict(
+                (
+                    sheet_name,
+                    pool.submit(_serialize_sheet, df_to_save, sheet_name, sheet_xml[sheet_name]),
+                )
+                for sheet_name, df_to_save in sorted(to_serialize, key=lambda s: -s[1].size)
+            )
+
+            for i, (sheet_name, df_to_save) in enumerate(sheets, 1):
+                if sheet_name in futures:
+                    ref, styles = futures[sheet_name].result()
+                    if styles != _get_styles(workbook):
+                        raise RuntimeError(f"Sheet {sheet_name} uses cell styles the workbook doesn't have")
+                    print(f"Serializing sheet: {sheet_name} - COMPLETE")
+                else:
+                    # Same range as <pf.save_to_final_workbook>
+                    ref = f"A1:{get_column_letter(df_to_save.shape[1])}{df_to_save.shape[0]}"
+
+                # Placeholder with the auto filter, which is also a workbook defined name
+                ws = workbook.create_sheet(sheet_name)
+                ws.auto_filter.ref = ref
+
+                if writer == "incremental":
+                    if sheet_name in futures:
+                        crc = _get_crc(sheet_xml[sheet_name])
+                    else:
+                        with ZipFile(previous_filename) as archive:
+                            crc = archive.getinfo(get_sheet_part(i)).CRC
+                    workbook.custom_doc_props.append(
+                        StringProperty(
+                            name=FINGERPRINT_PROPERTY.format(i),
+                            value=f"{fingerprints[i]}:{crc:08x}",
+                        )
+                    )
+    except BaseException:
+        if scratch_dir is not None:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        raise
+
+    return workbook, sheet_xml
+
+
+class _SheetXMLWriter(ExcelWriter):
+    """Workbook writer that copies already serialized worksheet XML."""
+
+    def __init__(self, workbook, archive, sheet_xml):
+        super().__init__(workbook, archive)
+        self.sheet_xml = sheet_xml
+
+    def write_worksheet(self, ws):
+        if ws.title not in self.sheet_xml:
+            return super().write_worksheet(ws)
+
+        ws._drawing = SpreadsheetDrawing()
+        ws._rels = RelationshipList()
+        xml = self.sheet_xml[ws.title]
+        if isinstance(xml, tuple):
+            # Copy the part of the previous workbook
+            filename, part = xml
+            with ZipFile(filename) as previous, previous.open(part) as src:
+                with self._archive.open(ws.path[1:], "w", force_zip64=True) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+        else:
+            self._archive.write(xml, ws.path[1:])
+        self.manifest.append(ws)
+
+
+def save_workbook(workbook, filename, sheet_xml=None):
+    """Save a workbook from <save_sheets_to_workbook>.
+
+    The serialized sheets, and the sheets reused from the previous
+    workbook, are copied into the package in place of their placeholders.
+    The workbook parts (styles, defined names, content types) are written
+    from the workbook itself. The scratch directory of the sheet XML is
+    removed afterwards.
+
+    :param workbook: Workbook to save
+    :type workbook: <openpyxl.Workbook>
+    :param filename: File path to save the workbook to
+    :type filename: <str>
+    :param sheet_xml: Worksheet XML by sheet name, see
+        <save_sheets_to_workbook>. Default is None, saving the workbook as is
+    :type sheet_xml: <Dict>
+    """
+
+    if not sheet_xml:
+        workbook.save(filename)
+        return
+
+    try:
+        # Same as <openpyxl.writer.excel.save_workbook>
+        archive = ZipFile(filename, "w", ZIP_DEFLATED, allowZip64=True)
+        workbook.properties.modified = datetime.datetime.now(
+            tz=datetime.timezone.utc
+        ).replace(tzinfo=None)
+        _SheetXMLWriter(workbook, archive, sheet_xml).save()
+    finally:
+        for scratch_dir in set(
+            os.path.dirname(xml) for xml in sheet_xml.values() if isinstance(xml, str)
+        ):
+            shutil.rmtree(scratch_dir, ignore_errors=True)